@@ -1,10 +1,24 @@
+from ._cache import *
 from ._client import *
 from ._client_manager import *
 from ._exceptions import *
 from ._host_manager import *
+from ._host_registry import *
+from ._metrics import *
 from ._proxy import *
+from ._proxy_health import *
 from ._proxy_pool import *
+from ._proxy_probe import *
+from ._proxy_registry import *
+from ._proxy_store import *
+from ._rate_controller import *
 from ._request import *
+from ._retry import *
+from ._sharding import *
+from ._single_flight import *
+from ._state_store import *
+from ._token_bucket import *
+from ._transport_pool import *
 from ._webber import *
 
 from httpx import HTTPError, RequestError, TimeoutException, ConnectTimeout, ReadTimeout, WriteTimeout, PoolTimeout, \
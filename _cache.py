@@ -0,0 +1,344 @@
+import email.utils
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import typing
+import httpx
+
+
+class CacheEntry(typing.NamedTuple):
+    """
+    A cached response.
+
+    :param url: The url of the request.
+    :param status_code: The status code of the response.
+    :param headers: The headers of the response. Content-Encoding and Content-Length are dropped, since the content
+                    is stored decoded.
+    :param content: The decoded body of the response.
+    :param vary: The values of the request headers named by the Vary header of the response.
+    :param stored_at: When the response was stored or last revalidated (time.time()).
+    :param expires_at: When the response becomes stale and has to be revalidated (time.time()).
+    """
+
+    url: str
+    status_code: int
+    headers: list[tuple[str, str]]
+    content: bytes
+    vary: dict[str, str | None]
+    stored_at: float
+    expires_at: float
+
+    @property
+    def etag(self) -> str | None:
+        return self._header("etag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return self._header("last-modified")
+
+    def is_fresh(self, now: float | None = None) -> bool:
+        """Whether the response may be used without revalidating it."""
+        return (time.time() if now is None else now) < self.expires_at
+
+    def validators(self) -> dict[str, str]:
+        """The headers of a conditional request that revalidates the response."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self) -> httpx.Response:
+        """Build a response from the entry. Its `from_cache` extension is set to True."""
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            request=httpx.Request("GET", self.url),
+            extensions={"from_cache": True},
+        )
+
+    def _header(self, name: str) -> str | None:
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return None
+
+
+class ResponseCache:
+    """
+    An on-disk cache of GET responses, stored in SQLite. Responses are keyed by their url and the values of
+    `key_headers` in the request, and the Vary header of a response is honoured. A fresh response (see
+    Cache-Control max-age and Expires) is served without a request. A stale response is revalidated with
+    If-None-Match / If-Modified-Since, so a 304 response is served from the cache.
+
+    The cache evicts the least recently used responses once its content exceeds `max_size` bytes, and responses
+    that were stored or revalidated more than `max_age` seconds ago.
+
+    Its methods block, so call them in a thread from async code, e.g. with `asyncio.to_thread`.
+
+    :param path: The path of the SQLite database. ":memory:" keeps the cache in memory.
+    :param max_size: The maximum total size of the cached bodies in bytes.
+    :param max_age: The maximum number of seconds a response is kept after it was stored or revalidated. Responses
+                    are kept until they are evicted for size if None.
+    :param default_ttl: The number of seconds a response without Cache-Control max-age or Expires header stays
+                        fresh. Such responses are revalidated on every use by default.
+    :param key_headers: The request headers that are part of the cache key, in addition to the url.
+    :param status_codes: The status codes of the responses that are cached.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_size: int = 1024 ** 3,
+            max_age: float | None = 7 * 24 * 3600,
+            default_ttl: float = 0.0,
+            key_headers: typing.Iterable[str] = ("Accept", "Accept-Encoding", "Accept-Language"),
+            status_codes: typing.Collection[int] = (200, 203, 300, 301, 308, 404, 410),
+    ):
+        if max_size < 0:
+            raise ValueError("max_size must not be negative.")
+        elif max_age is not None and max_age <= 0:
+            raise ValueError("max_age must be positive.")
+        elif default_ttl < 0:
+            raise ValueError("default_ttl must not be negative.")
+
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.default_ttl = default_ttl
+        self.key_headers = tuple(header.lower() for header in key_headers)
+        self.status_codes = frozenset(status_codes)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Rows replaced by INSERT OR REPLACE only fire delete triggers with recursive triggers on
+        self._connection.execute("PRAGMA recursive_triggers=ON")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status_code INTEGER NOT NULL,
+                headers TEXT NOT NULL,
+                content BLOB NOT NULL,
+                vary TEXT NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+        # The total size is kept up to date by triggers, so checking it doesn't scan the whole table
+        self._connection.executescript(
+            """
+            BEGIN;
+            CREATE TABLE IF NOT EXISTS total_size (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL);
+            INSERT OR IGNORE INTO total_size VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM responses));
+            CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+                UPDATE total_size SET size = size + NEW.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+                UPDATE total_size SET size = size - OLD.size;
+            END;
+            CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses BEGIN
+                UPDATE total_size SET size = size - OLD.size + NEW.size;
+            END;
+            COMMIT;
+            """
+        )
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached bodies in bytes."""
+        with self._lock:
+            return self._total_size()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, url: str, headers: httpx._types.HeaderTypes | None = None) -> CacheEntry | None:
+        """
+        Look up the cached response of a request.
+
+        :param url: The url of the request.
+        :param headers: The headers of the request.
+        :return: The cached response, or None if there is none, it has expired or it varies on a request header
+                 whose value differs.
+        """
+        headers = httpx.Headers(headers)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, status_code, headers, content, vary, stored_at, expires_at FROM responses WHERE key = ?",
+                (self._key(url, headers),),
+            ).fetchone()
+            if row is None:
+                return None
+
+            entry = CacheEntry(row[0], row[1], json.loads(row[2]), row[3], json.loads(row[4]), row[5], row[6])
+            if self.max_age is not None and entry.stored_at < now - self.max_age:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (self._key(url, headers),))
+                return None
+            elif any(headers.get(name) != value for name, value in entry.vary.items()):
+                return None
+
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, self._key(url, headers))
+            )
+            return entry
+
+    def put(self, url: str, headers: httpx._types.HeaderTypes | None, response: httpx.Response) -> CacheEntry | None:
+        """
+        Cache a response if it's cacheable, and evict responses if the cache has grown too large.
+
+        :param url: The url of the request.
+        :param headers: The headers of the request.
+        :param response: The response. Its body must have been read.
+        :return: The new cache entry, or None if the response isn't cacheable.
+        """
+        headers = httpx.Headers(headers)
+        cache_control = self._parse_cache_control(response.headers)
+        vary = [name.strip().lower() for name in response.headers.get("vary", "").split(",") if name.strip()]
+        if (
+                response.status_code not in self.status_codes
+                or "no-store" in cache_control
+                or "*" in vary
+                or len(response.content) > self.max_size
+        ):
+            self.delete(url, headers)
+            return None
+
+        now = time.time()
+        response_headers = [
+            (name, value) for name, value in response.headers.multi_items()
+            if name.lower() not in ("content-encoding", "content-length")
+        ]
+        entry = CacheEntry(
+            url=url,
+            status_code=response.status_code,
+            headers=response_headers,
+            content=response.content,
+            vary={name: headers.get(name) for name in vary},
+            stored_at=now,
+            expires_at=self._expires_at(response.headers, cache_control, now),
+        )
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self._key(url, headers), entry.url, entry.status_code, json.dumps(entry.headers), entry.content,
+                    json.dumps(entry.vary), entry.stored_at, entry.expires_at, now, len(entry.content),
+                ),
+            )
+            self._evict(now)
+        return entry
+
+    def refresh(
+            self,
+            entry: CacheEntry,
+            headers: httpx._types.HeaderTypes | None,
+            response: httpx.Response,
+    ) -> CacheEntry:
+        """
+        Update a cached response after a 304 response revalidated it. The headers of the 304 response replace the
+        cached ones and the freshness lifetime restarts.
+
+        :param entry: The cached response.
+        :param headers: The headers of the request.
+        :param response: The 304 response.
+        :return: The updated cache entry.
+        """
+        now = time.time()
+        updated = {name.lower() for name, _ in response.headers.multi_items()} - {"content-length", "content-encoding"}
+        response_headers = [(name, value) for name, value in entry.headers if name.lower() not in updated]
+        response_headers.extend(
+            (name, value) for name, value in response.headers.multi_items() if name.lower() in updated
+        )
+        response_headers = httpx.Headers(response_headers)
+        entry = entry._replace(
+            headers=response_headers.multi_items(),
+            stored_at=now,
+            expires_at=self._expires_at(response_headers, self._parse_cache_control(response_headers), now),
+        )
+        with self._lock:
+            self._connection.execute(
+                "UPDATE responses SET headers = ?, stored_at = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                (json.dumps(entry.headers), entry.stored_at, entry.expires_at, now, self._key(entry.url, headers)),
+            )
+        return entry
+
+    def delete(self, url: str, headers: httpx._types.HeaderTypes | None = None) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (self._key(url, httpx.Headers(headers)),))
+
+    def evict(self) -> None:
+        """Evict expired responses, and the least recently used responses if the cache is too large."""
+        with self._lock:
+            self._evict(time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self, now: float) -> None:
+        if self.max_age is not None:
+            self._connection.execute("DELETE FROM responses WHERE stored_at < ?", (now - self.max_age,))
+
+        excess = self._total_size() - self.max_size
+        if excess <= 0:
+            return
+        # Delete the least recently used responses until enough space has been freed
+        self._connection.execute(
+            """
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY accessed_at, key) - size AS freed
+                    FROM responses
+                ) WHERE freed < ?
+            )
+            """,
+            (excess,),
+        )
+
+    def _total_size(self) -> int:
+        return self._connection.execute("SELECT size FROM total_size").fetchone()[0]
+
+    def _key(self, url: str, headers: httpx.Headers) -> str:
+        key = json.dumps([url, [headers.get(name) for name in self.key_headers]])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _expires_at(self, headers: httpx.Headers, cache_control: dict[str, str | None], now: float) -> float:
+        if "no-cache" in cache_control:
+            return now
+        elif "max-age" in cache_control:
+            try:
+                return now + max(int(cache_control["max-age"]) - int(headers.get("age", 0)), 0)
+            except (TypeError, ValueError):
+                return now
+        elif "expires" in headers:
+            try:
+                return email.utils.parsedate_to_datetime(headers["expires"]).timestamp()
+            except (TypeError, ValueError):
+                return now
+        return now + self.default_ttl
+
+    @staticmethod
+    def _parse_cache_control(headers: httpx.Headers) -> dict[str, str | None]:
+        directives = {}
+        for directive in ",".join(headers.get_list("cache-control")).split(","):
+            name, _, value = directive.strip().partition("=")
+            if name:
+                directives[name.lower()] = value.strip('"') if value else None
+        return directives
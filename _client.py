@@ -1,8 +1,9 @@
+import contextlib
 import time
 import typing
 import warnings
 
-from httpx import AsyncClient, URL, Response, TooManyRedirects
+from httpx import AsyncClient, AsyncBaseTransport, URL, Headers, Response, TooManyRedirects
 from httpx._client import EventHook, UseClientDefault, USE_CLIENT_DEFAULT
 from httpx._config import DEFAULT_MAX_REDIRECTS, Timeout
 from httpx._types import AuthTypes, QueryParamTypes, HeaderTypes, CookieTypes, TimeoutTypes, \
@@ -13,6 +14,15 @@ from ._request import Request
 
 
 class Client(AsyncClient):
+    """
+    An httpx client bound to one proxy for its whole life, which sends the proxy's user-agent headers with every
+    request.
+
+    The headers and timeout every request starts with are computed once per client (see `build_request`), and only
+    recomputed when `headers` or `timeout` is set or the proxy is assigned a user agent. Modify the client's headers
+    by setting `headers` rather than in place.
+    """
+
     def __init__(
             self,
             *,
@@ -21,13 +31,16 @@ class Client(AsyncClient):
             follow_redirects: bool = False,
             max_redirects: int = DEFAULT_MAX_REDIRECTS,
             event_hooks: (typing.Mapping[str, list[EventHook]]) | None = None,
+            transport: AsyncBaseTransport | None = None,
     ) -> None:
+        # A transport is expected to already route through the proxy, e.g. a shared transport from a TransportPool
         super().__init__(
             http2=http2,
-            proxy=proxy.url,
+            proxy=proxy.url if transport is None else None,
             follow_redirects=follow_redirects,
             max_redirects=max_redirects,
             event_hooks=event_hooks,
+            transport=transport,
         )
 
         self._http2 = http2
@@ -35,6 +48,27 @@ class Client(AsyncClient):
         self._pending_requests = 0
         self._last_requested = 0
         self._proxy = proxy
+        self._template: tuple[Headers, dict[str, float | None]] | None = None
+        self._template_user_agent: typing.Mapping[str, str] | None = None
+        self._template_user_agent_keys: frozenset[bytes] = frozenset()
+
+    @property
+    def headers(self) -> Headers:
+        return AsyncClient.headers.fget(self)
+
+    @headers.setter
+    def headers(self, headers: HeaderTypes) -> None:
+        AsyncClient.headers.fset(self, headers)
+        self._template = None
+
+    @property
+    def timeout(self) -> Timeout:
+        return AsyncClient.timeout.fget(self)
+
+    @timeout.setter
+    def timeout(self, timeout: TimeoutTypes) -> None:
+        AsyncClient.timeout.fset(self, timeout)
+        self._template = None
 
     @property
     def http2(self) -> bool:
@@ -79,19 +113,31 @@ class Client(AsyncClient):
 
         [0]: /advanced/clients/#request-instances
         """
+        # Changed: the client's headers with the user agent and its timeout come from the client's template, so only
+        # the request's own headers are merged into a copy, and requests without any use the template as is
         url = self._merge_url(url)
-        headers = self._merge_headers(headers)
-        headers.update(self.proxy.user_agent)  # Added
+        template_headers, template_timeout = self._request_template()
+        if not headers:
+            # Request copies the headers, so the template isn't modified
+            headers = template_headers
+        else:
+            # Like Headers.update, the request's headers replace those of the template with the same (lowercase)
+            # names, except for the proxy's user-agent headers, which take precedence. The header lists are merged
+            # directly, since the template's headers are already normalised.
+            request_items = [
+                item for item in Headers(headers)._list if item[1] not in self._template_user_agent_keys
+            ]
+            names = {item[1] for item in request_items}
+            merged_headers = Headers()
+            merged_headers._list = [item for item in template_headers._list if item[1] not in names] + request_items
+            headers = merged_headers
         cookies = self._merge_cookies(cookies)
         params = self._merge_queryparams(params)
-        extensions = {} if extensions is None else extensions
+        if extensions is None:
+            extensions = {}
         if "timeout" not in extensions:
-            timeout = (
-                self.timeout
-                if isinstance(timeout, UseClientDefault)
-                else Timeout(timeout)
-            )
-            extensions = dict(**extensions, timeout=timeout.as_dict())
+            timeout = template_timeout if isinstance(timeout, UseClientDefault) else Timeout(timeout).as_dict()
+            extensions = dict(**extensions, timeout=timeout)
 
         if event_hooks is not None:
             _event_hooks = {
@@ -115,6 +161,25 @@ class Client(AsyncClient):
             event_hooks=_event_hooks,
         )
 
+    def _request_template(self) -> tuple[Headers, dict[str, float | None]]:
+        """
+        Get the headers and timeout extension every request of the client starts with, i.e. the client's headers
+        updated with the proxy's user agent, and the client's timeout. The template is recomputed when the proxy's
+        user agent changes, which is cheap to check since a proxy's user agent is only assigned once.
+
+        :return: The headers and the timeout extension.
+        """
+        user_agent = None if self._proxy is None else self._proxy.user_agent
+        if self._template is None or user_agent is not self._template_user_agent:
+            headers = Headers(self.headers)
+            user_agent_headers = Headers(user_agent)
+            headers.update(user_agent_headers)
+            self._template = headers, self.timeout.as_dict()
+            self._template_user_agent = user_agent
+            # The lowercase names of the user-agent headers, as stored by Headers
+            self._template_user_agent_keys = frozenset(item[1] for item in user_agent_headers._list)
+        return self._template
+
     async def request(
             self,
             method: str,
@@ -201,7 +266,64 @@ class Client(AsyncClient):
             event_hooks=event_hooks
         )
 
+    @contextlib.asynccontextmanager
+    async def stream(
+            self,
+            method: str,
+            url: URL | str,
+            *,
+            content: RequestContent | None = None,
+            data: RequestData | None = None,
+            files: RequestFiles | None = None,
+            json: typing.Any | None = None,
+            params: QueryParamTypes | None = None,
+            headers: HeaderTypes | None = None,
+            cookies: CookieTypes | None = None,
+            auth: AuthTypes | UseClientDefault | None = USE_CLIENT_DEFAULT,
+            follow_redirects: bool | UseClientDefault = USE_CLIENT_DEFAULT,
+            timeout: TimeoutTypes | UseClientDefault = USE_CLIENT_DEFAULT,
+            extensions: RequestExtensions | None = None,
+            event_hooks: (typing.Mapping[str, list[EventHook]]) | None = None
+    ) -> typing.AsyncIterator[Response]:
+        """
+        Alternative to `httpx.request()` that streams the response body
+        instead of loading it into memory at once.
+
+        **Parameters**: See `httpx.request`.
+
+        See also: [Streaming Responses][0]
 
+        [0]: /quickstart#streaming-responses
+        """
+        request = self.build_request(
+            method=method,
+            url=url,
+            content=content,
+            data=data,
+            files=files,
+            json=json,
+            params=params,
+            headers=headers,
+            cookies=cookies,
+            timeout=timeout,
+            extensions=extensions,
+            event_hooks=event_hooks,
+        )
+        # The request counts as pending until the stream is closed, so the client isn't closed while it's read
+        self._pending_requests += 1  # Added
+        try:
+            response = await self.send(
+                request=request,
+                auth=auth,
+                follow_redirects=follow_redirects,
+                stream=True,
+            )
+            try:
+                yield response
+            finally:
+                await response.aclose()
+        finally:
+            self._pending_requests -= 1  # Added
 
     async def _send_handling_redirects(
             self,
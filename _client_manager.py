@@ -1,18 +1,21 @@
 import asyncio
-import atexit
+import contextlib
+import heapq
+import itertools
 import random
-import signal
 import time
 import typing
 import httpx
 
+from collections import defaultdict
+
 from ._proxy_pool import ProxyPool
 from ._proxy import Proxy
 from ._client import Client
-from ._exceptions import AdjustmentError
-
-# TODO: better http version handling. Either use a mapping of http versions to clients or only allow one version per ClientManager
-# TODO: dependency injection - pass ProxyPool as an argument to the constructor (maybe)
+from ._exceptions import AdjustmentError, ProxiesUnavailable
+from ._metrics import Metrics
+from ._token_bucket import TokenBucket
+from ._transport_pool import TransportPool
 
 
 class ClientManager:
@@ -21,37 +24,114 @@ class ClientManager:
     when making requests. The manager will also adjust how many requests a client can make based if rate-limiting occurs.
     Client managers are designed to be used with a single host.
 
+    HTTP/2 clients with requests in flight take further requests right away, sent as concurrent streams over their
+    connection up to the max concurrent streams the server advertised, instead of leasing more proxies. How many
+    requests reach the manager at once is left to its owner, e.g. a HostManager's concurrency limit.
+
+    HTTP/1.1 and HTTP/2 clients are kept in separate pools. The protocol the host negotiates for HTTP/2 requests is
+    remembered (see `negotiated_http2`): once the host has fallen back to HTTP/1.1, HTTP/2 requests are sent with
+    the HTTP/1.1 clients, and the existing HTTP/2 clients, whose connections use HTTP/1.1 as well, join their pool.
+
     :param proxies: Either an iterable collection of Proxy objects, or a mapping where keys are Proxy objects
-                        and values are booleans indicating whether the proxy failed on its last use.
+                        and values are booleans indicating whether the proxy failed on its last use. A ProxyPool
+                        (e.g. one created by a shared ProxyRegistry) is used as is.
+    :param metrics: The backend that metrics and trace spans are reported to. Nothing is reported if None.
+    :param proxy_rate: The maximum number of requests per second sent through each proxy, enforced with a token
+                       bucket per proxy. Unlimited if None.
+    :param proxy_burst: The number of requests that may be sent through a proxy at once within its rate.
+
+    Close the manager with `aclose` (or use it as an async context manager) to close its clients and connections.
     """
 
     def __init__(
-            self, proxies: typing.Iterable[Proxy] | typing.Mapping[Proxy, bool],
+            self, proxies: typing.Iterable[Proxy] | typing.Mapping[Proxy, bool] | ProxyPool,
             min_client_requests: int = 4,
-            max_client_requests: int = 21
+            max_client_requests: int = 21,
+            metrics: Metrics | None = None,
+            proxy_rate: float | None = None,
+            proxy_burst: float = 1.0,
     ):
         if max_client_requests < min_client_requests:
             raise ValueError("max_client_requests cannot be less than min_client_requests.")
         elif min_client_requests < 1:
             raise ValueError("min_client_requests must be a positive integer.")
+        elif proxy_rate is not None and proxy_rate <= 0:
+            raise ValueError("proxy_rate must be positive.")
+        elif proxy_burst < 1:
+            raise ValueError("proxy_burst must be at least 1.")
 
-        atexit.register(self._run_cleanup)
-        signal.signal(signal.SIGINT, self._on_sigint)
         self.client_delay = 1.2
-        self._proxy_pool = ProxyPool(proxies)
+        self._metrics = Metrics() if metrics is None else metrics
+        self._proxy_pool = proxies if isinstance(proxies, ProxyPool) else ProxyPool(proxies, metrics=self._metrics)
+        self._transport_pool = TransportPool()
         self._clients = {}
+        self._ready_clients = defaultdict(list)
+        self._queued_clients = set()
+        self._requests_in_flight = {}
+        self._client_sequence = itertools.count()
+        self._retired_clients = []
         self._min_client_requests = min_client_requests
         self._max_client_requests = max_client_requests
         self._last_requested = 0
+        self._proxy_rate = proxy_rate
+        self.proxy_burst = proxy_burst
+        self._proxy_buckets = {}
+        self._open_clients = set()
+        self._closing_clients = set()
+        self._proxy_pool.release_idle = self._release_idle
+        self._active_requests = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._closed = False
+        self._shut_down = False
+        self._negotiated_http2 = None
 
     @property
     def proxy_pool(self) -> ProxyPool:
         return self._proxy_pool
 
+    @property
+    def transport_pool(self) -> TransportPool:
+        return self._transport_pool
+
     @property
     def last_requested(self) -> int:
         return self._last_requested
 
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def proxy_rate(self) -> float | None:
+        return self._proxy_rate
+
+    @proxy_rate.setter
+    def proxy_rate(self, value: float | None) -> None:
+        if value is not None and value <= 0:
+            raise ValueError("proxy_rate must be positive.")
+        self._proxy_rate = value
+        if value is None:
+            self._proxy_buckets.clear()
+        else:
+            for bucket in self._proxy_buckets.values():
+                if bucket.rate != value:
+                    bucket.rate = value
+
+    @property
+    def negotiated_http2(self) -> bool | None:
+        """Whether the host negotiated HTTP/2 for HTTP/2 requests, or None if it hasn't been sent one yet."""
+        return self._negotiated_http2
+
+    @negotiated_http2.setter
+    def negotiated_http2(self, value: bool | None) -> None:
+        self._negotiated_http2 = value
+        if value is False and self._ready_clients[True]:
+            # The connections of the HTTP/2 clients fell back to HTTP/1.1, so they're reused for HTTP/1.1 requests
+            # rather than rotated out
+            for entry in self._ready_clients.pop(True):
+                heapq.heappush(self._ready_clients[False], entry)
+
     @property
     def min_client_requests(self) -> int:
         return self._min_client_requests
@@ -82,48 +162,309 @@ class ClientManager:
             url: str,
             headers: httpx._types.HeaderTypes,
             event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
-            http2: bool = True,
+            http2: bool | None = True,
+    ) -> httpx.Response:
+        """
+        Send a GET request.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2, which is only used while the host doesn't negotiate HTTP/1.1 instead.
+                      None selects the protocol automatically, the same as True.
+        :return: The response.
+        """
+        with self._track_request():
+            return await self._request(url, headers, event_hooks, http2)
+
+    async def _request(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None,
+            http2: bool | None,
     ) -> httpx.Response:
-        client = self._get_client(http2)
+        client = await self._get_client(http2)
         self._prepare_client(client)
         status_code = None
+        start = time.monotonic()
         try:
-            response = await client.get(url, headers=headers, event_hooks=event_hooks)
+            await self._throttle(client.proxy)
+            with self._metrics.span("client.request", url=url, proxy=client.proxy.url):
+                response = await client.get(url, headers=headers, event_hooks=event_hooks)
             status_code = response.status_code
-            self._handle_status(client, response.status_code)
+            self._record_protocol(client, response)
+            self._handle_status(client, response.status_code, time.monotonic() - start)
             return response
 
         except httpx.HTTPStatusError as e:
             status_code = e.response.status_code
-            self._handle_status(client, status_code)
+            self._record_protocol(client, e.response)
+            self._handle_status(client, status_code, time.monotonic() - start)
+            raise e
+
+        except httpx.TransportError as e:
+            self._handle_error(client, e, time.monotonic() - start)
             raise e
 
         finally:
-            if not (client in self._clients or client.pending_requests):
-                await client.aclose()
-                self._proxy_pool.free(client.proxy, status_code)
+            await self._release_client(client, status_code)
 
-    def _get_client(self, http2: bool) -> Client:
-        client = next(iter(self._clients), None)
-        if client is None or client.http2 is not http2 or self._calc_wait_time(client) > 0:
-            client = self._create_client(http2)
+    @contextlib.asynccontextmanager
+    async def stream(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
+            http2: bool | None = True,
+    ) -> typing.AsyncIterator[httpx.Response]:
+        """
+        Send a GET request and stream the response body instead of loading it into memory at once.
+        The client and its proxy stay leased until the stream is closed.
 
-        return client
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2, see `request`.
+        :return: An async context manager yielding a response whose body has not been read.
+        """
+        with self._track_request():
+            async with self._stream(url, headers, event_hooks, http2) as response:
+                yield response
+
+    @contextlib.asynccontextmanager
+    async def _stream(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None,
+            http2: bool | None,
+    ) -> typing.AsyncIterator[httpx.Response]:
+        client = await self._get_client(http2)
+        self._prepare_client(client)
+        status_code = None
+        start = time.monotonic()
+        try:
+            await self._throttle(client.proxy)
+            async with client.stream("GET", url, headers=headers, event_hooks=event_hooks) as response:
+                status_code = response.status_code
+                self._record_protocol(client, response)
+                self._handle_status(client, response.status_code, time.monotonic() - start)
+                yield response
+
+        except httpx.HTTPStatusError as e:
+            if status_code is None:
+                status_code = e.response.status_code
+                self._record_protocol(client, e.response)
+                self._handle_status(client, status_code, time.monotonic() - start)
+            raise e
+
+        except httpx.TransportError as e:
+            self._handle_error(client, e, time.monotonic() - start)
+            raise e
+
+        finally:
+            await self._release_client(client, status_code)
+
+    async def aclose(self, timeout: float | None = 10.0) -> None:
+        """
+        Close the manager. New requests are refused, requests in flight get up to `timeout` seconds to finish, and
+        then every client and connection is closed. Requests still in flight after the timeout fail.
+
+        :param timeout: The number of seconds to wait for requests in flight. Waits indefinitely if None.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+        self._shut_down = True
+        clients, self._open_clients = self._open_clients, set()
+        self._clients.clear()
+        self._ready_clients.clear()
+        self._queued_clients.clear()
+        self._requests_in_flight.clear()
+        self._retired_clients.clear()
+        await asyncio.gather(*(client.aclose() for client in clients), self._transport_pool.aclose())
+        for client in clients:
+            self._proxy_pool.free(client.proxy)
+
+    async def __aenter__(self) -> "ClientManager":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    @contextlib.contextmanager
+    def _track_request(self) -> typing.Iterator[None]:
+        if self._closed:
+            raise RuntimeError("Cannot send a request, as the client manager has been closed.")
+        self._active_requests += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._active_requests -= 1
+            if not self._active_requests:
+                self._idle.set()
+
+    async def _get_client(self, http2: bool | None) -> Client:
+        # _ready_clients maps each protocol to a heap of (ready_at, sequence, client) entries ordered by when each
+        # client may be reused. Entries of clients that have since been removed from _clients are stale and dropped
+        # lazily, so the head of a heap is always the next client of its protocol to become ready.
+        while True:
+            # The host may have negotiated HTTP/1.1 while the request waited, which merges the pools
+            uses_http2 = self._uses_http2(http2)
+            ready_clients = self._ready_clients[uses_http2]
+            if uses_http2:
+                client = self._get_multiplexed_client()
+                if client is not None:
+                    return client
+
+            now = time.time()
+            other_clients = self._ready_clients[not uses_http2]
+            for heap in (ready_clients, other_clients):
+                while heap and heap[0][2] not in self._clients:
+                    self._queued_clients.discard(heapq.heappop(heap)[2])
+            if ready_clients and ready_clients[0][0] <= now:
+                client = heapq.heappop(ready_clients)[2]
+                self._queued_clients.discard(client)
+                return client
+
+            # Idle clients waiting out their delay hold on to their proxies, so if they hold every proxy, waiting for
+            # a proxy would never end. Only wait until the next client of either protocol becomes ready instead, and
+            # if it's one of the other protocol, retire it to free its proxy.
+            ready_at = min((heap[0][0] for heap in (ready_clients, other_clients) if heap), default=None)
+            try:
+                return await self._create_client(uses_http2, None if ready_at is None else ready_at - now)
+            except ProxiesUnavailable:
+                now = time.time()
+                if (
+                        not (ready_clients and ready_clients[0][0] <= now)
+                        and other_clients
+                        and other_clients[0][0] <= now
+                        and other_clients[0][2] in self._clients
+                ):
+                    self._retire_client(heapq.heappop(other_clients)[2])
+                continue
+
+    def _uses_http2(self, http2: bool | None) -> bool:
+        # The pool a request or client belongs to. Hosts that negotiated HTTP/1.1 only get HTTP/1.1 requests.
+        return http2 is not False and self._negotiated_http2 is not False
 
-    def _create_client(self, http2: bool) -> Client:
-        proxy = self._proxy_pool.get()
-        client = Client(proxy=proxy, http2=http2)
+    def _record_protocol(self, client: Client, response: httpx.Response) -> None:
+        if client.http2:
+            negotiated_http2 = response.http_version == "HTTP/2"
+            if negotiated_http2 != self._negotiated_http2:
+                self.negotiated_http2 = negotiated_http2
+
+    def _get_multiplexed_client(self) -> Client | None:
+        # _requests_in_flight maps clients to their requests in flight. The connections of those with HTTP/2 are open,
+        # so another request can be sent over one of them as a concurrent stream without waiting out the client delay.
+        # The stream limit is unknown until a connection is established, so only one request is sent until then.
+        for client, streams in self._requests_in_flight.items():
+            if (
+                    client.http2
+                    and client in self._clients
+                    and streams < (self._transport_pool.max_streams(client.proxy) or 1)
+            ):
+                self._metrics.increment("client.multiplexed")
+                return client
+        return None
+
+    async def _create_client(self, http2: bool, timeout: float | None = None) -> Client:
+        start = time.monotonic()
+        proxy = await self._proxy_pool.acquire(timeout)
+        self._metrics.observe("proxy.acquire_wait", time.monotonic() - start)
+        if self._shut_down:
+            self._proxy_pool.free(proxy)
+            raise RuntimeError("The client manager was closed while the request waited for a proxy.")
+        client = Client(proxy=proxy, http2=http2, transport=self._transport_pool.get(proxy, http2))
+        self._open_clients.add(client)
         requests_allowed = random.randint(self._min_client_requests, self._max_client_requests)
         self._clients[client] = {"requests_allowed": requests_allowed, "requests_left": requests_allowed}
         return client
 
+    async def _throttle(self, proxy: Proxy) -> None:
+        # Wait until the proxy's token bucket allows another request
+        if self._proxy_rate is None:
+            return
+        bucket = self._proxy_buckets.get(proxy)
+        if bucket is None:
+            bucket = self._proxy_buckets[proxy] = TokenBucket(self._proxy_rate, self.proxy_burst)
+        delay = bucket.consume()
+        if delay:
+            self._metrics.observe("proxy.throttle_wait", delay, proxy=proxy.url)
+        while delay:
+            await asyncio.sleep(delay)
+            delay = bucket.consume()
+
     def _prepare_client(self, client):
-        client_data = self._clients.pop(client)
+        client_data = self._clients[client]
+        self._requests_in_flight[client] = self._requests_in_flight.get(client, 0) + 1
         if client_data["requests_left"] > 1:
             client_data["requests_left"] -= 1
-            self._clients[client] = client_data
+            # Multiplexed clients are still queued from their previous request
+            if client not in self._queued_clients:
+                self._queued_clients.add(client)
+                ready_at = time.time() + self.client_delay
+                ready_clients = self._ready_clients[self._uses_http2(client.http2)]
+                heapq.heappush(ready_clients, (ready_at, next(self._client_sequence), client))
         else:
             assert client_data["requests_left"] == 1
+            del self._clients[client]
+
+    async def _release_client(self, client: Client, status_code: int | None) -> None:
+        requests = self._requests_in_flight.pop(client, 0) - 1
+        if requests > 0:
+            self._requests_in_flight[client] = requests
+        if not (client in self._clients or client in self._requests_in_flight or client.pending_requests):
+            await self._close_client(client, status_code)
+
+        # Idle clients removed by _handle_429 have no request of their own to close them
+        retired_clients, self._retired_clients = self._retired_clients, []
+        for retired_client in retired_clients:
+            if retired_client is not client and not (
+                    retired_client in self._requests_in_flight or retired_client.pending_requests
+            ):
+                await self._close_client(retired_client, None)
+
+    def _release_idle(self, proxy: Proxy) -> bool:
+        # Called by the proxy pool when another host waits for the proxy at its registry lease limit. An idle client
+        # would only free its proxy when it's used again, so it's retired instead.
+        client = next((client for client in self._open_clients if client.proxy == proxy), None)
+        if client is None or client in self._requests_in_flight or client.pending_requests:
+            return False
+        self._retire_client(client)
+        return True
+
+    def _retire_client(self, client: Client) -> None:
+        # A retired client with requests in flight is closed once they finish, and an idle one is closed right away
+        self._clients.pop(client, None)
+        self._queued_clients.discard(client)
+        if client in self._requests_in_flight or client.pending_requests:
+            return
+        self._open_clients.discard(client)
+        self._metrics.increment("client.rotations")
+        self._proxy_pool.free(client.proxy)
+        # The client's transport is shared, so closing the client leaves the connections open
+        task = asyncio.ensure_future(client.aclose())
+        self._closing_clients.add(task)
+        task.add_done_callback(self._closing_clients.discard)
+
+    async def _close_client(self, client: Client, status_code: int | None) -> None:
+        if client not in self._open_clients:
+            # The manager was closed and has closed the client already
+            return
+        self._open_clients.discard(client)
+        self._queued_clients.discard(client)
+        self._metrics.increment("client.rotations")
+        await client.aclose()
+        self._proxy_pool.free(client.proxy, status_code)
+        if client.proxy not in self._proxy_pool:
+            self._proxy_buckets.pop(client.proxy, None)
+            await self._transport_pool.discard(client.proxy)
 
     def _handle_429(self, client_data: dict[str, int]) -> None:
         self._max_client_requests = client_data["requests_allowed"] - client_data["requests_left"] - 1
@@ -135,28 +476,20 @@ class ClientManager:
         for client in list(self._clients):
             if self._clients[client]["requests_allowed"] > self._max_client_requests:
                 del self._clients[client]
+                self._retired_clients.append(client)
 
-    def _handle_status(self, client: Client, status_code: int):
+    def _handle_status(self, client: Client, status_code: int, latency: float | None = None):
+        self._proxy_pool.record(client.proxy, latency, status_code)
+        if latency is not None and self._metrics.enabled:
+            self._metrics.observe("proxy.latency", latency, proxy=client.proxy.url)
         if client in self._clients and status_code >= 400:
             client_data = self._clients.pop(client)
             if status_code == 429:
                 self._handle_429(client_data)
 
-    async def _cleanup(self):
-        for client in self._clients:
-            await client.aclose()
-            self._proxy_pool.free(client)
-
-    def _run_cleanup(self):
-        asyncio.run(self._cleanup())
-
-    def _on_sigint(self, sig, frame):
-        self._run_cleanup()
-        raise SystemExit(0)
-
-    @staticmethod
-    def _calc_wait_time(client: Client) -> float:
-        client_delay = 1.2
-        elapsed = time.time() - client.last_requested
-        return client_delay - elapsed
-
+    def _handle_error(self, client: Client, error: httpx.TransportError, latency: float | None = None):
+        self._proxy_pool.record(client.proxy, latency, error=error)
+        if latency is not None and self._metrics.enabled:
+            self._metrics.observe("proxy.latency", latency, proxy=client.proxy.url)
+        # Connection and proxy errors are likely caused by the proxy, so rotate it out
+        self._clients.pop(client, None)
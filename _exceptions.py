@@ -20,3 +20,11 @@ class ProxiesExhausted(Exception):
 class AdjustmentError(Exception):
     """Raise this exception when an adjustment results in an invalid state"""
 
+
+
+class DeadlineExceeded(Exception):
+    """Raise this exception when a request does not complete within its deadline"""
+
+
+class WorkerError(Exception):
+    """Raise this exception when a worker process fails to complete a request"""
@@ -1,34 +1,136 @@
 import asyncio
+import contextlib
+import enum
+import heapq
+import itertools
 import time
 import typing
 import httpx
 import validators
 
-from collections import deque
-
 from ._client_manager import ClientManager
+from ._metrics import Metrics
 from ._proxy import Proxy
+from ._proxy_pool import ProxyPool
+from ._rate_controller import RateController
+from ._token_bucket import TokenBucket
+
+
+class Priority(enum.IntEnum):
+    """
+    The priority of a request. Requests with a lower value are sent first when a host's rate budget frees up.
+    """
+
+    #: Requests a user is waiting for.
+    INTERACTIVE = 0
+    #: Requests that refresh data that is already known.
+    REFRESH = 1
+    #: Bulk requests that may wait, e.g. backfilling historical data.
+    BACKFILL = 2
+
+
+class HostState(typing.NamedTuple):
+    """
+    A compact snapshot of what a host manager has learned about its host, used to restore a host after it was evicted.
+
+    :param rate: The request rate of the rate controller in requests per second.
+    :param concurrency: The concurrency limit of the rate controller.
+    :param average_response_time: The average response time in seconds, or None if no response was received.
+    :param max_client_requests: The number of requests a client may make before it's rotated.
+    :param time: When the snapshot was taken (time.time()).
+    :param http2: Whether the host negotiated HTTP/2, or None if it wasn't sent an HTTP/2 request.
+    """
+
+    rate: float
+    concurrency: float
+    average_response_time: float | None
+    max_client_requests: int
+    time: float
+    http2: bool | None = None
 
 
 class HostManager:
     """
     A Class that manages requests to a single host.
-    The manager will automatically adjust request delays based on response times.
+    The manager will automatically adjust request delays and concurrency based on response times and rate-limiting
+    responses.
+
+    The request rate is enforced with a token bucket refilled at the rate controller's rate, so up to `burst` requests
+    may start at once, and up to the concurrency limit may be in flight. Targets often rate-limit by IP address, so
+    with `per_proxy` the rate applies to each proxy instead of the host as a whole.
+
+    Close the manager with `aclose` (or use it as an async context manager) to close its connections.
+
+    Waiting requests are scheduled by priority. With aging, a request waits at most `aging` seconds longer than a
+    request with the next higher priority that was queued at the same time, so low-priority requests aren't starved.
 
     :param host: The host to manage requests for.
     :param proxies: Either an iterable collection of Proxy objects, or a mapping where keys are Proxy objects
-                    and values are booleans indicating whether the proxy failed on its last use.
+                    and values are booleans indicating whether the proxy failed on its last use. A ProxyPool
+                    (e.g. one created by a shared ProxyRegistry) is used as is.
+    :param rate_controller: The controller used to adjust the request rate and concurrency of the host. A new
+                            RateController with default settings is used if None.
+    :param metrics: The backend that metrics and trace spans are reported to. Nothing is reported if None.
+    :param aging: The number of seconds of waiting that make up for one priority level.
+    :param burst: The number of requests that may start at once within the rate budget.
+    :param per_proxy: Whether the rate applies to each proxy instead of the host.
     """
-    def __init__(self, host: str, proxies: typing.Collection[Proxy] | typing.Mapping[Proxy, bool]):
+    def __init__(
+            self,
+            host: str,
+            proxies: typing.Collection[Proxy] | typing.Mapping[Proxy, bool] | ProxyPool,
+            rate_controller: RateController | None = None,
+            metrics: Metrics | None = None,
+            aging: float = 5.0,
+            burst: float = 1.0,
+            per_proxy: bool = False,
+    ):
         if not (validators.domain(host) or validators.ipv4(host)):
             raise ValueError(f"host: {host} is not a valid host.")
-        self._client_manager = ClientManager(proxies)
+        elif aging < 0:
+            raise ValueError("aging must not be negative.")
+        self._metrics = Metrics() if metrics is None else metrics
+        self._rate_controller = RateController() if rate_controller is None else rate_controller
+        self._client_manager = ClientManager(
+            proxies,
+            metrics=self._metrics,
+            proxy_rate=self._rate_controller.rate if per_proxy else None,
+            proxy_burst=burst,
+        )
         self.host = host
-        self._last_requested = 0
-        self._host_delay = 1.0
-        self._requests_semaphore = asyncio.Semaphore(50)
-        self._host_timeout_lock = asyncio.Lock()
-        self._recent_response_times = deque(maxlen=100)
+        self._bucket = TokenBucket(self._rate_controller.rate, burst)
+        self._per_proxy = per_proxy
+        self.aging = aging
+        self._active_requests = 0
+        self._waiters = []
+        self._waiter_sequence = itertools.count()
+        self._dispatch_handle = None
+        self._closed = False
+
+    @property
+    def rate_controller(self) -> RateController:
+        return self._rate_controller
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def per_proxy(self) -> bool:
+        return self._per_proxy
+
+    @property
+    def bucket(self) -> TokenBucket:
+        """The token bucket enforcing the host's request rate. It's unused with `per_proxy`."""
+        return self._bucket
+
+    @property
+    def active_requests(self) -> int:
+        return self._active_requests
+
+    @property
+    def waiting_requests(self) -> int:
+        return sum(not waiter.done() for _, _, waiter in self._waiters)
 
     async def get(
             self,
@@ -36,17 +138,198 @@ class HostManager:
             headers: httpx._types.HeaderTypes,
             event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
             http2: bool | None = True,
+            priority: Priority = Priority.REFRESH,
     ) -> httpx.Response:
-        async with self._requests_semaphore:
-            await self.timeout(url)
-            self._last_requested = time.time()
-            return await self._client_manager.request(url, headers=headers, event_hooks=event_hooks, http2=http2)
-
-    async def timeout(self, url: str) -> None:
-        async with self._host_timeout_lock:
-            elapsed = time.time() - self._last_requested
-            timeout = self._host_delay - elapsed
-
-            if timeout > 0:
-                print(f"Waiting {timeout} seconds before requesting {url}")
-                await asyncio.sleep(timeout)
+        """
+        Send a GET request once the host's rate budget allows it.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2. Hosts that negotiated HTTP/1.1 are sent HTTP/1.1 requests either way.
+        :param priority: The priority of the request.
+        :return: The response.
+        """
+        async with self._request_slot(url, priority):
+            return await self._request(url, headers, event_hooks, http2)
+
+    def state(self) -> HostState:
+        """Take a snapshot of the learned rate and protocol state, see `restore`."""
+        return HostState(
+            self._rate_controller.rate,
+            self._rate_controller.concurrency_limit,
+            self._rate_controller.average_response_time,
+            self._client_manager.max_client_requests,
+            time.time(),
+            self._client_manager.negotiated_http2,
+        )
+
+    def restore(self, state: HostState) -> None:
+        """
+        Restore the learned rate and protocol state of an earlier manager of the host.
+
+        :param state: The snapshot to restore.
+        """
+        self._rate_controller.restore(state.rate, state.concurrency, state.average_response_time)
+        self._bucket.rate = self._rate_controller.rate
+        if state.max_client_requests >= self._client_manager.min_client_requests:
+            self._client_manager.max_client_requests = state.max_client_requests
+        if state.http2 is not None:
+            self._client_manager.negotiated_http2 = state.http2
+
+    @contextlib.asynccontextmanager
+    async def stream(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
+            http2: bool | None = True,
+            priority: Priority = Priority.REFRESH,
+    ) -> typing.AsyncIterator[httpx.Response]:
+        """
+        Send a GET request and stream the response body instead of loading it into memory at once.
+        The request keeps its concurrency slot, client and proxy until the stream is closed.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2. Hosts that negotiated HTTP/1.1 are sent HTTP/1.1 requests either way.
+        :param priority: The priority of the request.
+        :return: An async context manager yielding a response whose body has not been read.
+        """
+        async with self._request_slot(url, priority):
+            with self._metrics.span("host.request", host=self.host, url=url, stream=True):
+                start = time.monotonic()
+                recorded = False
+                try:
+                    async with self._client_manager.stream(url, headers, event_hooks, http2) as response:
+                        self._record(start, response.status_code)
+                        recorded = True
+                        yield response
+                except httpx.HTTPStatusError as e:
+                    if not recorded:
+                        self._record(start, e.response.status_code)
+                    raise e
+                except httpx.TransportError as e:
+                    self._record(start, error=e)
+                    raise e
+
+    async def aclose(self, timeout: float | None = 10.0) -> None:
+        """
+        Close the manager. Waiting requests fail with a RuntimeError, requests in flight get up to `timeout` seconds
+        to finish, and then every client and connection is closed.
+
+        :param timeout: The number of seconds to wait for requests in flight. Waits indefinitely if None.
+        """
+        self._closed = True
+        if self._dispatch_handle is not None:
+            self._dispatch_handle.cancel()
+            self._dispatch_handle = None
+        waiters, self._waiters = self._waiters, []
+        for _, _, waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError("The host manager was closed."))
+        await self._client_manager.aclose(timeout)
+
+    async def __aenter__(self) -> "HostManager":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    @contextlib.asynccontextmanager
+    async def _request_slot(self, url: str, priority: Priority) -> typing.AsyncIterator[None]:
+        if self._closed:
+            raise RuntimeError("Cannot send a request, as the host manager has been closed.")
+        # Waiters are ordered by their queue time, pushed back by `aging` seconds per priority level
+        start = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (start + priority * self.aging, next(self._waiter_sequence), waiter))
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted, but we were cancelled before we could use it
+                self._release_slot()
+            else:
+                waiter.cancel()
+            raise e
+
+        if self._metrics.enabled:
+            self._metrics.observe("host.queue_wait", time.monotonic() - start, host=self.host, priority=priority.name)
+            self._metrics.gauge("host.active_requests", self._active_requests, host=self.host)
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    def _dispatch(self) -> None:
+        # Grant slots to the highest-priority waiters while the concurrency limit and the request rate allow it
+        rate = self._rate_controller.rate
+        if self._per_proxy:
+            self._client_manager.proxy_rate = rate
+        elif self._bucket.rate != rate:
+            self._bucket.rate = rate
+
+        while self._waiters and self._active_requests < self._rate_controller.concurrency:
+            if self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+                continue
+
+            delay = 0 if self._per_proxy else self._bucket.consume()
+            if delay:
+                if self._dispatch_handle is None:
+                    self._metrics.observe("host.delay_sleep", delay, host=self.host)
+                    self._dispatch_handle = asyncio.get_running_loop().call_later(delay, self._dispatch_later)
+                return
+
+            _, _, waiter = heapq.heappop(self._waiters)
+            self._active_requests += 1
+            waiter.set_result(None)
+
+    def _dispatch_later(self) -> None:
+        self._dispatch_handle = None
+        self._dispatch()
+
+    def _release_slot(self) -> None:
+        self._active_requests -= 1
+        if not self._closed:
+            self._dispatch()
+
+    async def _request(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None,
+            http2: bool | None,
+    ) -> httpx.Response:
+        with self._metrics.span("host.request", host=self.host, url=url):
+            start = time.monotonic()
+            try:
+                response = await self._client_manager.request(
+                    url, headers=headers, event_hooks=event_hooks, http2=http2
+                )
+            except httpx.HTTPStatusError as e:
+                self._record(start, e.response.status_code)
+                raise e
+            except httpx.TransportError as e:
+                self._record(start, error=e)
+                raise e
+
+            self._record(start, response.status_code)
+            return response
+
+    def _record(self, start: float, status_code: int | None = None, error: httpx.TransportError | None = None):
+        latency = time.monotonic() - start
+        if error is None:
+            self._rate_controller.record(latency, status_code)
+        elif isinstance(error, httpx.TimeoutException):
+            self._rate_controller.record(None, timed_out=True)
+
+        if self._metrics.enabled:
+            self._metrics.observe("request.latency", latency, host=self.host)
+            if error is None:
+                self._metrics.increment("request.status", host=self.host, status_code=status_code)
+            else:
+                self._metrics.increment("request.errors", host=self.host, error=type(error).__name__)
@@ -0,0 +1,166 @@
+import asyncio
+import time
+import typing
+
+from collections import OrderedDict
+
+from ._host_manager import HostManager, HostState
+
+
+class HostRegistry(typing.Mapping[str, HostManager]):
+    """
+    A bounded registry of host managers. Managers are kept in least recently used order. Once there are more than
+    `max_hosts`, or a manager hasn't been used for `idle_ttl` seconds, the manager is closed and evicted. Its learned
+    rate state is kept as a `HostState`, so a manager created for the host later starts where the evicted one left off.
+    Managers with requests in flight or waiting are never evicted. Idle managers are swept by a timer on the event
+    loop, so they are evicted even if no new host is requested.
+
+    :param factory: A callable that creates the manager of a host from the host name.
+    :param max_hosts: The maximum number of managers to keep. Unlimited if None.
+    :param idle_ttl: The number of seconds a manager may be unused before it's evicted. Managers are only evicted for
+                     space if None.
+    :param max_states: The maximum number of states of evicted hosts to keep. The least recently evicted are dropped.
+    """
+
+    def __init__(
+            self,
+            factory: typing.Callable[[str], HostManager],
+            max_hosts: int | None = 10_000,
+            idle_ttl: float | None = 600.0,
+            max_states: int = 100_000,
+    ):
+        if max_hosts is not None and max_hosts < 1:
+            raise ValueError("max_hosts must be a positive integer.")
+        elif idle_ttl is not None and idle_ttl <= 0:
+            raise ValueError("idle_ttl must be positive.")
+        elif max_states < 0:
+            raise ValueError("max_states must not be negative.")
+
+        self._factory = factory
+        self.max_hosts = max_hosts
+        self.idle_ttl = idle_ttl
+        self.max_states = max_states
+        # Host names to (manager, last used) in least recently used order
+        self._hosts = OrderedDict()
+        self._states = OrderedDict()
+        self._closing = set()
+        self._sweep_handle = None
+
+    def __getitem__(self, host: str) -> HostManager:
+        return self._hosts[host][0]
+
+    def __len__(self) -> int:
+        return len(self._hosts)
+
+    def __iter__(self) -> typing.Iterator[str]:
+        return iter(self._hosts)
+
+    @property
+    def states(self) -> dict[str, HostState]:
+        """The learned rate states of evicted hosts."""
+        return dict(self._states)
+
+    def snapshot(self) -> dict[str, HostState]:
+        """Get the learned rate states of every host, whether it's evicted or not."""
+        states = dict(self._states)
+        states.update((host, manager.state()) for host, (manager, _) in self._hosts.items())
+        return states
+
+    def restore(self, states: typing.Mapping[str, HostState]) -> None:
+        """
+        Add learned rate states, e.g. ones saved by an earlier run. Hosts that have a manager already are skipped, the
+        others are restored from their state once they're requested.
+
+        :param states: A mapping of host names to states.
+        """
+        for host, state in states.items():
+            if host not in self._hosts:
+                self._states[host] = state
+        while len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+
+    def acquire(self, host: str) -> HostManager:
+        """
+        Get the manager of a host, creating it if it doesn't exist, and mark it as used. Creating a manager evicts
+        cold managers.
+
+        :param host: The host name.
+        :return: The manager of the host.
+        """
+        now = time.monotonic()
+        entry = self._hosts.get(host)
+        if entry is not None:
+            self._hosts[host] = entry[0], now
+            self._hosts.move_to_end(host)
+            return entry[0]
+
+        self._evict(now, room=1)
+        manager = self._factory(host)
+        state = self._states.pop(host, None)
+        if state is not None:
+            manager.restore(state)
+        self._hosts[host] = manager, now
+        self._schedule_sweep(now)
+        return manager
+
+    def evict(self) -> None:
+        """Evict managers that have been idle for too long or exceed `max_hosts`."""
+        self._evict(time.monotonic())
+
+    async def aclose(self, timeout: float | None = 10.0) -> None:
+        """
+        Close every manager concurrently, including evicted ones that are still closing. The learned states of the
+        managers are kept in `states`.
+
+        :param timeout: The number of seconds to wait for requests in flight. Waits indefinitely if None.
+        """
+        if self._sweep_handle is not None:
+            self._sweep_handle.cancel()
+            self._sweep_handle = None
+        hosts = [(host, manager) for host, (manager, _) in self._hosts.items()]
+        self._hosts.clear()
+        await asyncio.gather(*(manager.aclose(timeout) for _, manager in hosts), *self._closing)
+        # Keep what the closed managers learned, so it can still be saved
+        self.restore({host: manager.state() for host, manager in hosts})
+
+    def _schedule_sweep(self, now: float) -> None:
+        # Arm a timer for when the least recently used manager becomes idle for too long
+        if self.idle_ttl is None or self._sweep_handle is not None or not self._hosts:
+            return
+        _, last_used = next(iter(self._hosts.values()))
+        delay = max(last_used + self.idle_ttl - now, 0)
+        self._sweep_handle = asyncio.get_running_loop().call_later(delay, self._sweep)
+
+    def _sweep(self) -> None:
+        self._sweep_handle = None
+        now = time.monotonic()
+        self._evict(now)
+        self._schedule_sweep(now)
+
+    def _evict(self, now: float, room: int = 0) -> None:
+        # Make room for `room` more managers, and evict idle managers from the cold end
+        busy = []
+        while self._hosts:
+            host, (manager, last_used) = next(iter(self._hosts.items()))
+            expired = self.idle_ttl is not None and now - last_used >= self.idle_ttl
+            full = self.max_hosts is not None and len(self._hosts) + len(busy) + room > self.max_hosts
+            if not (expired or full):
+                break
+            del self._hosts[host]
+            if manager.active_requests or manager.waiting_requests:
+                busy.append((host, (manager, now)))
+            else:
+                self._evict_manager(host, manager)
+
+        # Busy managers count as used, since they obviously are
+        for host, entry in busy:
+            self._hosts[host] = entry
+
+    def _evict_manager(self, host: str, manager: HostManager) -> None:
+        if self.max_states:
+            self._states[host] = manager.state()
+            while len(self._states) > self.max_states:
+                self._states.popitem(last=False)
+        task = asyncio.ensure_future(manager.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
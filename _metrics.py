@@ -0,0 +1,139 @@
+import contextlib
+import contextvars
+import time
+import typing
+
+from collections import defaultdict, deque
+
+
+class Span:
+    """
+    A timed operation within a trace. Spans opened while another span is open become its children.
+
+    :param name: The name of the operation.
+    :param tags: Tags describing the operation, e.g. the host or proxy.
+    :param parent: The span that was open when this span was opened, if any.
+    """
+
+    def __init__(self, name: str, tags: dict[str, typing.Any], parent: "Span | None" = None):
+        self.name = name
+        self.tags = tags
+        self.parent = parent
+        self.start = time.monotonic()
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self) -> float | None:
+        """The duration of the span in seconds, or None if it hasn't finished."""
+        return None if self.end is None else self.end - self.start
+
+    def set_tag(self, key: str, value: typing.Any) -> None:
+        self.tags[key] = value
+
+    def __repr__(self):
+        return f"Span(name={self.name}, tags={self.tags}, duration={self.duration}, error={self.error!r})"
+
+
+class Metrics:
+    """
+    A metrics and tracing backend. This base class discards everything, so instrumentation costs close to nothing
+    unless a backend is configured. Subclass it and override its methods to export metrics, e.g. to Prometheus or
+    StatsD, or use `InMemoryMetrics` to inspect them in-process.
+
+    Metrics recorded by webber:
+
+    * host.queue_wait (histogram, host, priority): Seconds a request waited for its host to schedule it.
+    * host.delay_sleep (histogram, host): Seconds the host's scheduler paused until its token bucket refilled.
+    * host.active_requests (gauge, host): Requests in flight for the host.
+    * request.latency (histogram, host): Seconds a request took, from sending it until it completed.
+    * request.status (counter, host, status_code): Responses per status code.
+    * request.errors (counter, host, error): Requests that failed with an exception.
+    * request.retries (counter, reason): Retried attempts per status code or exception name.
+    * request.coalesced (counter, host): Requests that joined an identical request already in flight.
+    * proxy.acquire_wait (histogram): Seconds spent waiting for a proxy.
+    * proxy.latency (histogram, proxy): Seconds a request took per proxy.
+    * proxy.throttle_wait (histogram, proxy): Seconds a request waited for its proxy's rate limit (see `per_proxy`).
+    * client.rotations (counter): Clients that were closed and replaced.
+    * client.multiplexed (counter): Requests sent as another concurrent stream over an HTTP/2 client's connection.
+    * proxy.quarantines (counter), proxy.revivals (counter), proxy.evictions (counter): Proxy state changes.
+    * cache.hits (counter, revalidated), cache.misses (counter), cache.revalidations (counter): Response cache
+      lookups. Revalidated hits are stale responses that a 304 response confirmed.
+
+    Spans: webber.get, host.request and client.request, tagged with the url, host and proxy.
+    """
+
+    #: Whether the backend records anything. Instrumentation skips work that is only needed for metrics if False.
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **tags: typing.Any) -> None:
+        """Increment a counter."""
+
+    def observe(self, name: str, value: float, **tags: typing.Any) -> None:
+        """Record a value in a histogram."""
+
+    def gauge(self, name: str, value: float, **tags: typing.Any) -> None:
+        """Set a gauge to a value."""
+
+    def span(self, name: str, **tags: typing.Any) -> typing.ContextManager[Span | None]:
+        """Open a trace span that finishes when the context exits."""
+        return _NULL_SPAN
+
+
+_NULL_SPAN = contextlib.nullcontext()
+_current_span = contextvars.ContextVar("webber_current_span", default=None)
+
+
+class InMemoryMetrics(Metrics):
+    """
+    A metrics backend that keeps everything in memory, for inspection, debugging and tests.
+
+    :param max_spans: The maximum number of finished spans to keep.
+    """
+
+    enabled = True
+
+    def __init__(self, max_spans: int = 10000):
+        self.counters = defaultdict(float)
+        self.histograms = defaultdict(list)
+        self.gauges = {}
+        self.spans = deque(maxlen=max_spans)
+
+    def increment(self, name: str, value: float = 1, **tags: typing.Any) -> None:
+        self.counters[self._key(name, tags)] += value
+
+    def observe(self, name: str, value: float, **tags: typing.Any) -> None:
+        self.histograms[self._key(name, tags)].append(value)
+
+    def gauge(self, name: str, value: float, **tags: typing.Any) -> None:
+        self.gauges[self._key(name, tags)] = value
+
+    @contextlib.contextmanager
+    def span(self, name: str, **tags: typing.Any) -> typing.Iterator[Span]:
+        span = Span(name, tags, _current_span.get())
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = e
+            raise e
+        finally:
+            span.end = time.monotonic()
+            _current_span.reset(token)
+            self.spans.append(span)
+
+    def counter(self, name: str, **tags: typing.Any) -> float:
+        """Get the value of a counter, summed over all tag sets that include the given tags."""
+        return sum(value for key, value in self.counters.items() if self._matches(key, name, tags))
+
+    def values(self, name: str, **tags: typing.Any) -> list[float]:
+        """Get the values of a histogram, over all tag sets that include the given tags."""
+        return [value for key, values in self.histograms.items() if self._matches(key, name, tags) for value in values]
+
+    @staticmethod
+    def _key(name: str, tags: dict[str, typing.Any]) -> tuple:
+        return name, tuple(sorted(tags.items()))
+
+    @staticmethod
+    def _matches(key: tuple, name: str, tags: dict[str, typing.Any]) -> bool:
+        return key[0] == name and tags.items() <= dict(key[1]).items()
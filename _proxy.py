@@ -1,23 +1,68 @@
+import sys
+import types
+import typing
+
 import validators
 
 from dataclasses import dataclass
 
+def intern_user_agent(user_agent: typing.Mapping[str, str] | None) -> typing.Mapping[str, str] | None:
+    """
+    Get a read-only copy of a set of user-agent headers with interned header names and values. Generated user agents
+    are mostly distinct, but they share their header names and many of their values (e.g. the platform), so large
+    pools only store those strings once. Nothing is cached, so user agents are freed with their proxies.
+
+    :param user_agent: A mapping of user-agent related headers, or None.
+    :return: A read-only mapping equal to `user_agent`, or None.
+    """
+    if user_agent is None:
+        return None
+    return types.MappingProxyType({sys.intern(name): sys.intern(value) for name, value in user_agent.items()})
+
 
-@dataclass(frozen=True, eq=False)
+@dataclass(frozen=True, eq=False, slots=True)
 class Proxy:
     """
-    A class for representing a proxy.
+    A class for representing a proxy. Proxies are slotted and the strings of their user agents are interned (see
+    `intern_user_agent`), so pools of hundreds of thousands of proxies stay small. Use `Proxy.trusted` to skip the
+    url validation for proxies from a trusted source, e.g. a file written by webber.
 
     :param url: The url of the proxy.
-    :param user_agent: a dictionary of user-agent related headers.
+    :param user_agent: a mapping of user-agent related headers, or None if none has been assigned yet (see
+                       `ProxyRegistry`'s user_agent_factory).
     """
 
     url: str
-    user_agent: dict[str, str]
+    user_agent: typing.Mapping[str, str] | None = None
 
     def __post_init__(self):
         if not validators.url(self.url):
             raise ValueError(f"proxy: {repr(self.url)} is not a valid url.")
+        object.__setattr__(self, "user_agent", intern_user_agent(self.user_agent))
+
+    @classmethod
+    def trusted(cls, url: str, user_agent: typing.Mapping[str, str] | None = None) -> "Proxy":
+        """
+        Create a proxy without validating its url.
+
+        :param url: The url of the proxy, which must be valid.
+        :param user_agent: a mapping of user-agent related headers, or None if none has been assigned yet.
+        :return: The proxy.
+        """
+        proxy = object.__new__(cls)
+        object.__setattr__(proxy, "url", url)
+        object.__setattr__(proxy, "user_agent", intern_user_agent(user_agent))
+        return proxy
+
+    def assign_user_agent(self, user_agent: typing.Mapping[str, str]) -> None:
+        """
+        Assign user-agent headers to a proxy that has none yet. A proxy keeps its user agent once it has one.
+
+        :param user_agent: A mapping of user-agent related headers.
+        """
+        if self.user_agent is not None:
+            raise ValueError(f"proxy: {self.url} already has a user agent.")
+        object.__setattr__(self, "user_agent", intern_user_agent(user_agent))
 
     def __eq__(self, other):
         if isinstance(other, Proxy):
@@ -28,4 +73,4 @@ class Proxy:
         return hash(self.url)
 
     def __str__(self):
-        return f"Proxy(url={self.url}, user_agent={self.user_agent})"
+        return f"Proxy(url={self.url}, user_agent={None if self.user_agent is None else dict(self.user_agent)})"
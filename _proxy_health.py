@@ -0,0 +1,133 @@
+import time
+import typing
+
+from collections import Counter
+
+
+class ProxyHealthState(typing.NamedTuple):
+    """
+    A snapshot of a proxy's health record, used to restore it in a later run.
+
+    :param latency: The EWMA of the proxy's latency in seconds, or None if no latency has been recorded.
+    :param successes: The number of successful requests.
+    :param failures: The number of failed requests.
+    :param error_counts: A mapping of error classes to how often they occurred.
+    :param last_failure: The time of the proxy's last failure (time.time()), or None if it never failed.
+    """
+
+    latency: float | None
+    successes: int
+    failures: int
+    error_counts: dict[str, int]
+    last_failure: float | None
+
+
+class ProxyHealth:
+    """
+    A health record of a proxy. The record tracks the exponentially weighted moving average (EWMA) of the proxy's
+    latency, its success rate, how often each class of error occurred and when it last failed.
+
+    :param alpha: The smoothing factor of the latency EWMA. Higher values give recent requests more weight.
+    :param default_latency: The latency in seconds assumed for proxies that haven't completed a request yet.
+    """
+
+    __slots__ = ("alpha", "default_latency", "_latency", "_successes", "_failures", "_error_counts", "_last_failure")
+
+    def __init__(self, alpha: float = 0.3, default_latency: float = 1.0):
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be between 0 and 1.")
+
+        self.alpha = alpha
+        self.default_latency = default_latency
+        self._latency = None
+        self._successes = 0
+        self._failures = 0
+        # Created on the first failure, since most proxies of a large pool never fail
+        self._error_counts = None
+        self._last_failure = None
+
+    @property
+    def latency(self) -> float | None:
+        """The EWMA of the proxy's latency in seconds, or None if no latency has been recorded."""
+        return self._latency
+
+    @property
+    def successes(self) -> int:
+        return self._successes
+
+    @property
+    def failures(self) -> int:
+        return self._failures
+
+    @property
+    def success_rate(self) -> float:
+        """The smoothed success rate of the proxy. Proxies without any requests have a success rate of 0.5."""
+        return (self._successes + 1) / (self._successes + self._failures + 2)
+
+    @property
+    def error_counts(self) -> dict[str, int]:
+        """A mapping of error classes (status codes and exception names) to how often they occurred."""
+        return dict(self._error_counts or {})
+
+    @property
+    def last_failure(self) -> float | None:
+        """The time of the proxy's last failure (time.time()), or None if it never failed."""
+        return self._last_failure
+
+    @property
+    def score(self) -> float:
+        """The expected latency per successful request in seconds. Lower is better."""
+        latency = self.default_latency if self._latency is None else self._latency
+        return latency / self.success_rate
+
+    def state(self) -> ProxyHealthState:
+        """Take a snapshot of the record, see `restore`."""
+        return ProxyHealthState(
+            self._latency, self._successes, self._failures, self.error_counts, self._last_failure
+        )
+
+    def restore(self, state: ProxyHealthState) -> None:
+        """
+        Replace the record with a snapshot, e.g. one saved by an earlier run.
+
+        :param state: The snapshot to restore.
+        """
+        self._latency = state.latency
+        self._successes = state.successes
+        self._failures = state.failures
+        self._error_counts = Counter(state.error_counts) if state.error_counts else None
+        self._last_failure = state.last_failure
+
+    def record(
+            self,
+            latency: float | None = None,
+            status_code: int | None = None,
+            error: BaseException | None = None,
+    ) -> None:
+        """
+        Record the outcome of a request made through the proxy.
+
+        :param latency: The time in seconds the request took, or None if it wasn't measured.
+        :param status_code: The status code of the response, or None if no response was received.
+        :param error: The exception raised by the request, if any.
+        """
+        if latency is not None:
+            self._latency = latency if self._latency is None else self._latency + self.alpha * (latency - self._latency)
+
+        if error is not None:
+            self._record_failure(type(error).__name__)
+        elif status_code is not None and status_code >= 400:
+            self._record_failure(str(status_code))
+        elif status_code is not None:
+            self._successes += 1
+
+    def _record_failure(self, error_class: str) -> None:
+        self._failures += 1
+        if self._error_counts is None:
+            self._error_counts = Counter()
+        self._error_counts[error_class] += 1
+        self._last_failure = time.time()
+
+    def __repr__(self):
+        return (f"ProxyHealth(latency={self._latency}, success_rate={self.success_rate:.2f}, "
+                f"error_counts={self.error_counts}, last_failure={self._last_failure})")
@@ -1,22 +1,71 @@
 import asyncio
+import contextlib
+import heapq
+import itertools
+import random
+import time
 import typing
 
+from collections import deque
+
+from ._metrics import Metrics
 from ._proxy import Proxy
+from ._proxy_health import ProxyHealth
 from ._exceptions import ProxiesUnavailable, ProxiesExhausted
 
+if typing.TYPE_CHECKING:
+    from ._proxy_registry import ProxyRegistry
+
 
 class ProxyPool:
-    def __init__(self, proxies: typing.Collection[Proxy], max_bad_responses: int = 1):
+    def __init__(
+            self,
+            proxies: typing.Collection[Proxy],
+            max_bad_responses: int = 1,
+            choice_window: int = 16,
+            quarantine_cooldown: float | None = 30.0,
+            max_quarantine_cooldown: float = 1800.0,
+            max_quarantines: int | None = None,
+            probe: typing.Callable[[Proxy], typing.Awaitable[bool]] | None = None,
+            max_leases: int | None = None,
+            registry: "ProxyRegistry | None" = None,
+            metrics: Metrics | None = None,
+    ):
         """
         A proxy pool with rotating proxies. The pool will not allow a proxy to be reused by another client until
-        it has been freed. Proxies that get two consecutive 4xx status codes will be removed from the pool.
+        it has been freed. Proxies that get two consecutive 4xx status codes will be quarantined.
         A proxy pool can be shared between multiple hosts, but it is generally recommended to keep a separate pool
         for each host (but reusing the same proxies is fine).
 
+        Every proxy has a health record (see `ProxyHealth`) that is updated with `record`. Proxies are selected with
+        the power of two choices: the least recently used proxy is compared with a random proxy among the next least
+        recently used ones, and the healthier of the two is selected. Fast, reliable proxies therefore get more
+        traffic, while proxies of equal health are rotated in least recently used order.
+
+        Quarantined proxies are taken out of rotation for a cool-down that doubles with every consecutive quarantine.
+        After the cool-down (and a successful probe, if a probe is given) they return on probation: a single bad
+        response quarantines them again, while a good response clears their quarantine history.
+
         :param proxies: A collection of Proxy objects.
         :param max_bad_responses: The maximum number of consecutive 4xx and 5xx status codes a proxy can get before
-                                  being removed from the pool. Proxies will never be removed from the pool if the
+                                  being quarantined. Proxies will never be removed from the pool if the
                                   value is 0
+        :param choice_window: The number of least recently used proxies the second choice is picked from.
+        :param quarantine_cooldown: The cool-down in seconds of a proxy's first consecutive quarantine. Proxies are
+                                    removed from the pool instead of being quarantined if None.
+        :param max_quarantine_cooldown: The maximum cool-down in seconds of a quarantine.
+        :param max_quarantines: The maximum number of consecutive quarantines before a proxy is removed from the pool.
+                                Proxies are quarantined indefinitely if None.
+        :param probe: An async callable that checks whether a proxy works again (see `HttpProbe`). Proxies whose
+                      probe fails are quarantined again instead of returning to rotation.
+        :param max_leases: The maximum number of proxies that may be in use at once. Unlimited if None.
+        :param registry: A registry shared with the pools of other hosts (see `ProxyRegistry.pool`). The pool uses
+                         the registry's health records and respects its per-proxy lease limit.
+        :param metrics: The backend that proxy quarantines, revivals and evictions are reported to.
+
+        The owner of a pool that shares a registry may set `release_idle` to a callable that frees a leased proxy if
+        it's only held by an idle client, and returns whether it did. The registry calls it when another pool waits
+        for a proxy that is at its lease limit (see `ProxyRegistry`).
         """
 
         if proxies is None:
@@ -24,10 +73,38 @@ class ProxyPool:
         elif not proxies:
             raise ValueError("proxies must not be empty.")
 
+        if choice_window < 2:
+            raise ValueError("choice_window must be 2 or higher.")
+        elif quarantine_cooldown is not None and not 0 < quarantine_cooldown <= max_quarantine_cooldown:
+            raise ValueError("quarantine_cooldown must be positive and not greater than max_quarantine_cooldown.")
+        elif max_leases is not None and max_leases < 1:
+            raise ValueError("max_leases must be a positive integer.")
+
         self._available_proxies = dict.fromkeys(proxies, 0)
         self._proxies_in_use = {}
+        self._registry = registry
+        self._metrics = Metrics() if metrics is None else metrics
+        if registry is None:
+            self._health = {proxy: ProxyHealth() for proxy in self._available_proxies}
+        else:
+            # The registry's health records are used as is, so pools sharing a registry don't copy them
+            for proxy in self._available_proxies:
+                registry.health(proxy)
+            self._health = registry._health
+        self.max_leases = max_leases
+        self.choice_window = choice_window
         self._proxies_available_event = asyncio.Event()
+        self._waiters = deque()
         self.max_bad_responses = max_bad_responses
+        self.quarantine_cooldown = quarantine_cooldown
+        self.max_quarantine_cooldown = max_quarantine_cooldown
+        self.max_quarantines = max_quarantines
+        self.probe = probe
+        self.release_idle: typing.Callable[[Proxy], bool] | None = None
+        self._quarantined_proxies = {}
+        self._quarantine_heap = []
+        self._quarantine_counts = {}
+        self._probe_tasks = set()
 
     @property
     def proxies_remaining(self) -> dict[Proxy, int]:
@@ -38,54 +115,176 @@ class ProxyPool:
         """
         return self._available_proxies | self._proxies_in_use
 
+    @property
+    def quarantined_proxies(self) -> dict[Proxy, float]:
+        """
+        Get the quarantined proxies. Quarantined proxies are not part of the pool until they are revived.
+
+        :return: A dictionary of proxies to the number of seconds left of their cool-down
+        """
+        self._revive_due()
+        now = time.monotonic()
+        return {proxy: max(release_at - now, 0) for proxy, release_at in self._quarantined_proxies.items()}
+
+    def health(self, proxy: Proxy) -> ProxyHealth:
+        """
+        Get the health record of a proxy.
+
+        :param proxy: The proxy to get the health record of.
+        :raises KeyError: If the proxy is not in the pool.
+        :return: The health record of the proxy.
+        """
+        return self._health[proxy]
+
+    def record(
+            self,
+            proxy: Proxy,
+            latency: float | None = None,
+            status_code: int | None = None,
+            error: BaseException | None = None,
+    ) -> None:
+        """
+        Record the outcome of a request made through a proxy in its health record.
+        Outcomes of proxies that are no longer in the pool are ignored.
+
+        :param proxy: The proxy the request was made through.
+        :param latency: The time in seconds the request took, or None if it wasn't measured.
+        :param status_code: The status code of the response, or None if no response was received.
+        :param error: The exception raised by the request, if any.
+        """
+        health = self._health.get(proxy)
+        if health is not None:
+            health.record(latency, status_code, error)
+            if self._registry is not None:
+                self._registry._changed.add(proxy)
+
     def get(self) -> Proxy:
         """
         Retrieve a proxy from the pool.
 
-        This method returns the least recently used proxy from the pool. If all proxies are currently in use,
-        it will raise a `ProxiesUnavailable` exception, which includes an `asyncio.Event` that will be set
-        when a proxy becomes available. If all proxies have been exhausted, a `ProxiesExhausted` exception will be raised.
+        This method returns the healthier of the least recently used proxy and a random other proxy from the pool.
+        If all proxies are currently in use (or at their lease limits), it will raise a `ProxiesUnavailable`
+        exception, which includes an `asyncio.Event` that will be set when a proxy becomes available. If all proxies
+        have been exhausted, a `ProxiesExhausted` exception will be raised.
 
         :raises ProxiesUnavailable: If all proxies are in use.
         :raises ProxiesExhausted: If all proxies have been exhausted.
-        :return: The least recently used proxy from the pool.
+        :return: A proxy from the pool.
         """
-        if not self._available_proxies:
-            if self._proxies_in_use:
+        self._revive_due()
+        proxy = self._choose()
+        if proxy is None:
+            if self or self._quarantined_proxies:
                 self._proxies_available_event.clear()
                 raise ProxiesUnavailable("all proxies are in use.", self._proxies_available_event)
             raise ProxiesExhausted("proxies have been exhausted.")
 
-        proxy = next(iter(self._available_proxies))
-        self._proxies_in_use[proxy] = self._available_proxies.pop(proxy)
+        self._lease(proxy, self._available_proxies.pop(proxy))
         return proxy
 
+    def _choose(self) -> Proxy | None:
+        if self.max_leases is not None and len(self._proxies_in_use) >= self.max_leases:
+            return None
+
+        proxies = iter(self._available_proxies)
+        if self._registry is not None and self._registry.max_leases_per_proxy is not None:
+            proxies = filter(self._registry.can_lease, proxies)
+        proxy = next(proxies, None)
+        others = list(itertools.islice(proxies, self.choice_window - 1))
+        if others:
+            other = random.choice(others)
+            if self._health[other].score < self._health[proxy].score:
+                return other
+        return proxy
+
+    async def acquire(self, timeout: float | None = None) -> Proxy:
+        """
+        Wait for a proxy and retrieve it from the pool.
+
+        This method selects proxies like `get`. If all proxies are currently in use, it waits
+        until one is freed. Waiters are served in FIFO order and a freed proxy is handed directly to the next waiter,
+        so only one waiter is woken per freed proxy. A proxy handed to a waiter that is cancelled is freed again.
+
+        :param timeout: The maximum number of seconds to wait. Waits indefinitely if None.
+        :raises ProxiesUnavailable: If no proxy became available within the timeout.
+        :raises ProxiesExhausted: If all proxies have been exhausted.
+        :return: A proxy from the pool.
+        """
+        self._revive_due()
+        if not self._waiters:
+            proxy = self._choose()
+            if proxy is not None:
+                self._lease(proxy, self._available_proxies.pop(proxy))
+                return proxy
+        if not (self or self._quarantined_proxies):
+            raise ProxiesExhausted("proxies have been exhausted.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        if self._registry is not None:
+            self._registry._wait(self)
+        try:
+            async with asyncio.timeout(timeout):
+                return await waiter
+        except BaseException as e:
+            if not waiter.done():
+                waiter.cancel()
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # The proxy was handed over, but we were cancelled before we could use it
+                self.free(waiter.result())
+
+            if isinstance(e, TimeoutError):
+                raise ProxiesUnavailable(f"no proxy became available within {timeout} seconds.") from e
+            raise e
+
+    @contextlib.asynccontextmanager
+    async def lease(self, timeout: float | None = None) -> typing.AsyncIterator[Proxy]:
+        """
+        Acquire a proxy and free it when the context exits.
+
+        :param timeout: The maximum number of seconds to wait. Waits indefinitely if None.
+        :raises ProxiesUnavailable: If no proxy became available within the timeout.
+        :raises ProxiesExhausted: If all proxies have been exhausted.
+        :return: An async context manager yielding the acquired proxy.
+        """
+        proxy = await self.acquire(timeout)
+        try:
+            yield proxy
+        finally:
+            self.free(proxy)
+
     def add(self, proxy: Proxy) -> bool:
         """
         Add a proxy to the pool.
 
         :param proxy: The proxy to add.
-        :return: True if the proxy was added, False if the proxy is already in the pool.
+        :return: True if the proxy was added, False if the proxy is already in the pool or quarantined.
         """
-        if proxy in self:
+        if proxy in self or proxy in self._quarantined_proxies:
             return False
         else:
-            self._available_proxies[proxy] = 0
+            self._health[proxy] = self._new_health(proxy)
+            self._make_available(proxy, 0)
             return True
 
     def remove(self, proxy: Proxy) -> None:
         """
-        Remove a proxy from the pool.
+        Remove a proxy from the pool or from quarantine.
 
         :param proxy:
         :raises ValueError: If the proxy is not in the pool.
         """
         if proxy in self._proxies_in_use:
-            del self._proxies_in_use[proxy]
+            self._release(proxy)
+            if self._registry is not None:
+                self._registry._offer(proxy)
         elif proxy in self._available_proxies:
             del self._available_proxies[proxy]
+        elif proxy in self._quarantined_proxies:
+            del self._quarantined_proxies[proxy]
         else:
             raise ValueError(f"proxy {proxy.url} is not in the pool.")
+        self._evict(proxy)
 
     def free(self, proxy: Proxy, last_status_code: int | None = None) -> None:
         """
@@ -98,13 +297,133 @@ class ProxyPool:
         if proxy not in self._proxies_in_use:
             return
 
-        consecutive_bad_responses = self._proxies_in_use.pop(proxy)
-        if last_status_code is not None:
-            consecutive_bad_responses = consecutive_bad_responses + 1 if last_status_code >= 400 else 0
+        consecutive_bad_responses = self._release(proxy)
+        if last_status_code is not None and last_status_code >= 400:
+            consecutive_bad_responses += 1
+        elif last_status_code is not None:
+            consecutive_bad_responses = 0
+            self._quarantine_counts.pop(proxy, None)
+
         if consecutive_bad_responses <= self.max_bad_responses:
+            self._make_available(proxy, consecutive_bad_responses)
+        else:
+            self._quarantine(proxy)
+
+        if self._registry is not None and proxy not in self._proxies_in_use:
+            self._registry._offer(proxy)
+
+    def _quarantine(self, proxy: Proxy) -> None:
+        quarantines = self._quarantine_counts.get(proxy, 0) + 1
+        if self.quarantine_cooldown is None or (self.max_quarantines is not None and quarantines > self.max_quarantines):
+            self._evict(proxy)
+            return
+
+        self._quarantine_counts[proxy] = quarantines
+        self._metrics.increment("proxy.quarantines")
+        cooldown = min(self.quarantine_cooldown * 2 ** (quarantines - 1), self.max_quarantine_cooldown)
+        release_at = time.monotonic() + cooldown
+        self._quarantined_proxies[proxy] = release_at
+        heapq.heappush(self._quarantine_heap, (release_at, id(proxy), proxy))
+        try:
+            asyncio.get_running_loop().call_later(cooldown, self._revive_due)
+        except RuntimeError:
+            pass  # Without a running loop, quarantined proxies are revived when the pool is next used
+
+    def _revive_due(self) -> None:
+        if self.probe is not None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return  # Probes need a running loop
+
+        now = time.monotonic()
+        while self._quarantine_heap and self._quarantine_heap[0][0] <= now:
+            release_at, _, proxy = heapq.heappop(self._quarantine_heap)
+            if self._quarantined_proxies.get(proxy) != release_at:
+                continue  # Stale entry of a proxy that has since been removed or re-quarantined
+            if self.probe is None:
+                self._revive(proxy)
+            else:
+                # The proxy stays quarantined until the probe completes
+                self._quarantined_proxies[proxy] = float("inf")
+                task = asyncio.get_running_loop().create_task(self._probe_and_revive(proxy))
+                self._probe_tasks.add(task)
+                task.add_done_callback(self._probe_tasks.discard)
+
+    async def _probe_and_revive(self, proxy: Proxy) -> None:
+        try:
+            success = await self.probe(proxy)
+        except Exception:
+            success = False
+        if proxy not in self._quarantined_proxies:
+            return
+        elif success:
+            self._revive(proxy)
+        else:
+            del self._quarantined_proxies[proxy]
+            self._quarantine(proxy)
+
+    def _revive(self, proxy: Proxy) -> None:
+        del self._quarantined_proxies[proxy]
+        self._metrics.increment("proxy.revivals")
+        # Revived proxies are on probation, so a single bad response quarantines them again
+        self._make_available(proxy, self.max_bad_responses)
+
+    def _evict(self, proxy: Proxy) -> None:
+        self._metrics.increment("proxy.evictions")
+        if self._registry is None:
+            del self._health[proxy]
+        self._quarantine_counts.pop(proxy, None)
+        self._check_exhausted()
+
+    def _make_available(self, proxy: Proxy, consecutive_bad_responses: int) -> None:
+        if not self._hand_over(proxy, consecutive_bad_responses):
             self._available_proxies[proxy] = consecutive_bad_responses
             self._proxies_available_event.set()
 
+    def _hand_over(self, proxy: Proxy, consecutive_bad_responses: int) -> bool:
+        if self.max_leases is not None and len(self._proxies_in_use) >= self.max_leases:
+            return False
+        elif self._registry is not None and not self._registry.can_lease(proxy):
+            return False
+
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self._lease(proxy, consecutive_bad_responses)
+                waiter.set_result(proxy)
+                return True
+        return False
+
+    def _offer(self, proxy: Proxy) -> bool:
+        # Called by the registry when another pool releases a proxy. Returns whether the pool is still waiting.
+        if proxy in self._available_proxies and self._hand_over(proxy, self._available_proxies[proxy]):
+            del self._available_proxies[proxy]
+        while self._waiters and self._waiters[0].done():
+            self._waiters.popleft()
+        return bool(self._waiters)
+
+    def _lease(self, proxy: Proxy, consecutive_bad_responses: int) -> None:
+        self._proxies_in_use[proxy] = consecutive_bad_responses
+        if self._registry is not None:
+            self._registry._lease(proxy)
+
+    def _release(self, proxy: Proxy) -> int:
+        if self._registry is not None:
+            self._registry._release(proxy)
+        return self._proxies_in_use.pop(proxy)
+
+    def _new_health(self, proxy: Proxy) -> ProxyHealth:
+        return ProxyHealth() if self._registry is None else self._registry.health(proxy)
+
+    def _check_exhausted(self) -> None:
+        if self or self._quarantined_proxies:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(ProxiesExhausted("proxies have been exhausted."))
+
     def __len__(self) -> int:
         return len(self._available_proxies) + len(self._proxies_in_use)
 
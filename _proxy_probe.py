@@ -0,0 +1,33 @@
+import httpx
+
+from ._proxy import Proxy
+
+
+class HttpProbe:
+    """
+    A probe that checks whether a proxy works by making a cheap request through it. Pass it to a ProxyPool to
+    probe quarantined proxies before they return to rotation.
+
+    :param url: The url to request. A small static resource works best.
+    :param method: The HTTP method of the request. HEAD avoids downloading a body.
+    :param timeout: The timeout of the request in seconds.
+    """
+
+    def __init__(self, url: str, method: str = "HEAD", timeout: float = 10.0):
+        self.url = url
+        self.method = method
+        self.timeout = timeout
+
+    async def __call__(self, proxy: Proxy) -> bool:
+        """
+        Probe a proxy.
+
+        :param proxy: The proxy to probe.
+        :return: True if the request succeeded with a status code below 400, False otherwise.
+        """
+        try:
+            async with httpx.AsyncClient(proxy=proxy.url, timeout=self.timeout) as client:
+                response = await client.request(self.method, self.url, headers=proxy.user_agent or {})
+        except httpx.HTTPError:
+            return False
+        return response.status_code < 400
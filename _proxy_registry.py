@@ -0,0 +1,162 @@
+import typing
+import weakref
+
+from collections import Counter
+
+from ._metrics import Metrics
+from ._proxy import Proxy
+from ._proxy_health import ProxyHealth
+from ._proxy_pool import ProxyPool
+
+
+class ProxyRegistry:
+    """
+    A registry of proxies shared by the proxy pools of multiple hosts. Pools created by the registry share the
+    health records of their proxies, so a proxy that performs badly for one host is deprioritised for every host.
+    The registry also limits how many pools may lease the same proxy at once and how many proxies a single pool
+    may lease at once.
+
+    Pools share the registry's proxy objects and health records instead of copying them. With `pool_size`, every pool
+    only rotates through a slice of the proxies, with consecutive pools getting consecutive slices, so the memory of a
+    pool doesn't grow with the number of proxies and the hosts are spread evenly across them.
+
+    :param proxies: A collection of Proxy objects.
+    :param max_leases_per_proxy: The maximum number of pools that may lease a proxy at once. Unlimited if None.
+    :param max_leases_per_host: The maximum number of proxies a single pool may lease at once. Unlimited if None.
+    :param metrics: The backend that the pools report proxy quarantines, revivals and evictions to.
+    :param user_agent_factory: A callable that creates the user-agent headers of a proxy from its url. It's called
+                               when a proxy without a user agent is leased for the first time, so user agents of
+                               proxies that are never used aren't generated.
+    :param pool_size: The number of proxies of each pool created by `pool`. Every pool gets all proxies if None.
+
+    Idle clients keep their proxies leased until they're used again, which may be never for a host that is done. So
+    when a pool waits for a proxy that is at its lease limit, the pools leasing it are asked to give it back if an
+    idle client holds it (see `ProxyPool.release_idle`).
+    """
+
+    def __init__(
+            self,
+            proxies: typing.Iterable[Proxy],
+            max_leases_per_proxy: int | None = None,
+            max_leases_per_host: int | None = None,
+            metrics: Metrics | None = None,
+            user_agent_factory: typing.Callable[[str], dict[str, str]] | None = None,
+            pool_size: int | None = None,
+    ):
+        if max_leases_per_proxy is not None and max_leases_per_proxy < 1:
+            raise ValueError("max_leases_per_proxy must be a positive integer.")
+        elif max_leases_per_host is not None and max_leases_per_host < 1:
+            raise ValueError("max_leases_per_host must be a positive integer.")
+        elif pool_size is not None and pool_size < 1:
+            raise ValueError("pool_size must be a positive integer.")
+
+        self._health = {proxy: ProxyHealth() for proxy in proxies}
+        self._proxies = list(self._health)
+        self.pool_size = pool_size
+        self._next_slice = 0
+        self.max_leases_per_proxy = max_leases_per_proxy
+        self.max_leases_per_host = max_leases_per_host
+        self.metrics = metrics
+        self.user_agent_factory = user_agent_factory
+        self._leases = Counter()
+        self._waiting_pools = {}
+        self._pools = weakref.WeakSet()
+        self._changed = set()
+
+    @property
+    def proxies(self) -> tuple[Proxy, ...]:
+        return tuple(self._health)
+
+    def health(self, proxy: Proxy) -> ProxyHealth:
+        """
+        Get the shared health record of a proxy, creating it if the proxy isn't registered yet.
+
+        :param proxy: The proxy to get the health record of.
+        :return: The health record of the proxy.
+        """
+        health = self._health.get(proxy)
+        if health is None:
+            health = self._health[proxy] = ProxyHealth()
+            self._proxies.append(proxy)
+        return health
+
+    def changed_health(self) -> dict[Proxy, ProxyHealth]:
+        """
+        Get the health records that were updated since the last call, e.g. to save only what changed.
+
+        :return: A mapping of proxies to their health records.
+        """
+        changed, self._changed = self._changed, set()
+        return {proxy: self._health[proxy] for proxy in changed}
+
+    def leases(self, proxy: Proxy) -> int:
+        """
+        Get the number of pools currently leasing a proxy.
+
+        :param proxy: The proxy to get the number of leases of.
+        :return: The number of leases.
+        """
+        return self._leases[proxy]
+
+    def can_lease(self, proxy: Proxy) -> bool:
+        """
+        Check whether a proxy may be leased by another pool.
+
+        :param proxy: The proxy to check.
+        :return: True if the proxy is below its lease limit.
+        """
+        return self.max_leases_per_proxy is None or self._leases[proxy] < self.max_leases_per_proxy
+
+    def pool(self, **kwargs) -> ProxyPool:
+        """
+        Create a proxy pool for a host that shares this registry's proxies, health records and lease limits. The pool
+        gets the next slice of `pool_size` proxies, or all of them.
+
+        :param kwargs: Keyword arguments passed to the ProxyPool.
+        :return: A new proxy pool.
+        """
+        kwargs.setdefault("max_leases", self.max_leases_per_host)
+        kwargs.setdefault("metrics", self.metrics)
+        if self.pool_size is None or self.pool_size >= len(self._proxies):
+            pool = ProxyPool(self._proxies, registry=self, **kwargs)
+        else:
+            start = self._next_slice
+            self._next_slice = (start + self.pool_size) % len(self._proxies)
+            proxies = self._proxies[start:start + self.pool_size]
+            proxies += self._proxies[:self.pool_size - len(proxies)]
+            pool = ProxyPool(proxies, registry=self, **kwargs)
+        self._pools.add(pool)
+        return pool
+
+    def _lease(self, proxy: Proxy) -> None:
+        if proxy.user_agent is None and self.user_agent_factory is not None:
+            proxy.assign_user_agent(self.user_agent_factory(proxy.url))
+        self._leases[proxy] += 1
+
+    def _release(self, proxy: Proxy) -> None:
+        self._leases[proxy] -= 1
+        if not self._leases[proxy]:
+            del self._leases[proxy]
+
+    def _wait(self, pool: ProxyPool) -> None:
+        self._waiting_pools[pool] = None
+        if self.max_leases_per_proxy is None:
+            return
+        elif pool.max_leases is not None and len(pool._proxies_in_use) >= pool.max_leases:
+            return
+        # The pool may be waiting for proxies at their lease limit. Free one held by an idle client of another pool,
+        # which offers it to the waiting pools.
+        for other in list(self._pools):
+            if other is pool or other.release_idle is None:
+                continue
+            for proxy in list(other._proxies_in_use):
+                if proxy in pool._available_proxies and not self.can_lease(proxy) and other.release_idle(proxy):
+                    return
+
+    def _offer(self, proxy: Proxy) -> None:
+        # Let pools that are waiting for a proxy blocked by its lease limit take it, oldest waiting pool first
+        for pool in list(self._waiting_pools):
+            if not self.can_lease(proxy):
+                return
+            if not pool._offer(proxy):
+                del self._waiting_pools[pool]
@@ -0,0 +1,92 @@
+import json
+import os
+import typing
+
+import validators
+
+
+class ProxyStore:
+    """
+    A line-delimited JSON file of proxies and their user-agent headers. Every line is a record like
+    `{"url": "http://proxy:8080", "user_agent": {...}}`, where a null user agent means one hasn't been assigned yet.
+    Records are only ever appended: a later record of a url replaces the earlier ones, so adding proxies or assigning
+    user agents doesn't rewrite the file. `compact` drops the replaced records.
+
+    Files in the older format, a single JSON object mapping proxy urls to user-agent headers, are read as well and
+    are appended to in the new format.
+
+    :param path: The path of the file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict[str, dict[str, str] | None]:
+        """
+        Read the proxies line by line.
+
+        :return: A mapping of proxy urls to their user-agent headers, or None if no user agent was assigned yet.
+        """
+        proxies = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if isinstance(record.get("url"), str):
+                        proxies[record["url"]] = record.get("user_agent")
+                    else:
+                        # A file in the older format
+                        proxies.update(record)
+        except FileNotFoundError:
+            pass
+        return proxies
+
+    def add(self, urls: typing.Iterable[str]) -> dict[str, dict[str, str] | None]:
+        """
+        Append proxies that aren't in the file yet, without user agents.
+
+        :param urls: The proxy urls.
+        :raises ValueError: If a url is invalid. Nothing is appended then.
+        :return: A mapping of every proxy url in the file to its user-agent headers, see `load`.
+        """
+        proxies = self.load()
+        new_urls = []
+        for url in urls:
+            if url in proxies:
+                continue
+            elif not validators.url(url):
+                url = url.replace("\n", "\\n")
+                raise ValueError(f"proxy: {url} is not a valid url.")
+            proxies[url] = None
+            new_urls.append(url)
+        self.append((url, None) for url in new_urls)
+        return proxies
+
+    def append(self, records: typing.Iterable[tuple[str, dict[str, str] | None]]) -> None:
+        """
+        Append records to the file.
+
+        :param records: Pairs of proxy urls and their user-agent headers.
+        """
+        lines = [json.dumps({"url": url, "user_agent": user_agent}) + "\n" for url, user_agent in records]
+        if not lines:
+            return
+        with open(self.path, "a+b") as f:
+            # Files in the older format don't end with a newline
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write("".join(lines).encode())
+
+    def compact(self) -> None:
+        """Rewrite the file with only the latest record of every proxy. The file is replaced atomically."""
+        proxies = self.load()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as f:
+            f.writelines(
+                json.dumps({"url": url, "user_agent": user_agent}) + "\n" for url, user_agent in proxies.items()
+            )
+        os.replace(temp_path, self.path)
@@ -0,0 +1,175 @@
+import time
+import typing
+
+from collections import deque
+
+
+class RateSample(typing.NamedTuple):
+    """
+    A snapshot of a rate controller's state, taken after every adjustment.
+
+    :param time: The time of the adjustment (time.time()).
+    :param rate: The request rate in requests per second after the adjustment.
+    :param concurrency: The concurrency limit after the adjustment.
+    :param reason: The reason for the adjustment ("increase", "rate_limited", "timeout" or "latency").
+    """
+
+    time: float
+    rate: float
+    concurrency: float
+    reason: str
+
+
+class RateController:
+    """
+    An adaptive rate controller for a single host. The controller uses additive increase / multiplicative decrease
+    (AIMD) to tune the request rate and concurrency of a host at runtime. Every successful response increases the rate
+    and concurrency additively, while rate-limiting status codes, timeouts and rising response times decrease them
+    multiplicatively.
+
+    :param rate: The initial request rate in requests per second.
+    :param min_rate: The lowest rate the controller will back off to.
+    :param max_rate: The highest rate the controller will increase to.
+    :param concurrency: The initial number of concurrent requests allowed.
+    :param min_concurrency: The lowest concurrency the controller will back off to.
+    :param max_concurrency: The highest concurrency the controller will increase to.
+    :param increase: The number of requests per second added to the rate after each successful response.
+    :param decrease: The factor the rate and concurrency are multiplied by when the host signals rate-limiting.
+    :param latency_decrease: The factor the rate is multiplied by when response times are rising.
+    :param latency_tolerance: How many times slower than the fastest recent response time the average response time
+                              may become before it is treated as congestion.
+    :param rate_limit_status_codes: Status codes that signal rate-limiting.
+    :param history_size: The number of adjustments to keep in the history.
+    """
+
+    def __init__(
+            self,
+            rate: float = 1.0,
+            min_rate: float = 0.05,
+            max_rate: float = 100.0,
+            concurrency: float = 10,
+            min_concurrency: float = 1,
+            max_concurrency: float = 50,
+            increase: float = 0.05,
+            decrease: float = 0.5,
+            latency_decrease: float = 0.9,
+            latency_tolerance: float = 2.0,
+            rate_limit_status_codes: typing.Collection[int] = (429, 503),
+            history_size: int = 1000,
+    ):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError("rates must satisfy 0 < min_rate <= rate <= max_rate.")
+        elif not 1 <= min_concurrency <= concurrency <= max_concurrency:
+            raise ValueError("concurrencies must satisfy 1 <= min_concurrency <= concurrency <= max_concurrency.")
+        elif not (0 < decrease < 1 and 0 < latency_decrease < 1):
+            raise ValueError("decrease and latency_decrease must be between 0 and 1.")
+        elif increase <= 0:
+            raise ValueError("increase must be positive.")
+        elif latency_tolerance <= 1:
+            raise ValueError("latency_tolerance must be greater than 1.")
+
+        self._rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_decrease = latency_decrease
+        self.latency_tolerance = latency_tolerance
+        self.rate_limit_status_codes = frozenset(rate_limit_status_codes)
+        self._response_times = deque(maxlen=100)
+        self._average_response_time = None
+        self._last_decrease = 0
+        self._history = deque(maxlen=history_size)
+
+    @property
+    def rate(self) -> float:
+        """The current request rate in requests per second."""
+        return self._rate
+
+    @property
+    def delay(self) -> float:
+        """The current delay between requests in seconds."""
+        return 1 / self._rate
+
+    @property
+    def concurrency(self) -> int:
+        """The current number of concurrent requests allowed."""
+        return int(self._concurrency)
+
+    @property
+    def concurrency_limit(self) -> float:
+        """The unrounded concurrency limit, including the progress of additive increases towards the next request."""
+        return self._concurrency
+
+    @property
+    def response_times(self) -> tuple[float, ...]:
+        """The most recent response times in seconds."""
+        return tuple(self._response_times)
+
+    @property
+    def average_response_time(self) -> float | None:
+        """The exponentially weighted moving average of recent response times in seconds."""
+        return self._average_response_time
+
+    @property
+    def history(self) -> tuple[RateSample, ...]:
+        """The most recent adjustments, oldest first."""
+        return tuple(self._history)
+
+    def record(self, response_time: float | None, status_code: int | None = None, timed_out: bool = False) -> None:
+        """
+        Record the outcome of a request and adjust the rate and concurrency accordingly.
+
+        :param response_time: The response time of the request in seconds, or None if no response was received.
+        :param status_code: The status code of the response, or None if no response was received.
+        :param timed_out: Whether the request timed out.
+        """
+        if response_time is not None:
+            self._response_times.append(response_time)
+            if self._average_response_time is None:
+                self._average_response_time = response_time
+            else:
+                self._average_response_time += 0.3 * (response_time - self._average_response_time)
+
+        if timed_out:
+            self._back_off(self.decrease, "timeout")
+        elif status_code in self.rate_limit_status_codes:
+            self._back_off(self.decrease, "rate_limited")
+        elif self._is_congested():
+            self._back_off(self.latency_decrease, "latency")
+        elif status_code is not None and status_code < 400:
+            self._rate = min(self._rate + self.increase, self.max_rate)
+            self._concurrency = min(self._concurrency + 1 / self._concurrency, self.max_concurrency)
+            self._history.append(RateSample(time.time(), self._rate, self._concurrency, "increase"))
+
+    def restore(self, rate: float, concurrency: float, average_response_time: float | None = None) -> None:
+        """
+        Restore state learned earlier, e.g. by the controller of a host that was evicted. The values are clamped to the
+        controller's limits.
+
+        :param rate: The request rate in requests per second.
+        :param concurrency: The concurrency limit.
+        :param average_response_time: The average response time in seconds.
+        """
+        self._rate = min(max(rate, self.min_rate), self.max_rate)
+        self._concurrency = min(max(concurrency, self.min_concurrency), self.max_concurrency)
+        self._average_response_time = average_response_time
+
+    def _is_congested(self) -> bool:
+        if len(self._response_times) < 10:
+            return False
+        return self._average_response_time > min(self._response_times) * self.latency_tolerance
+
+    def _back_off(self, factor: float, reason: str) -> None:
+        # Requests that were already in flight when we backed off report the same condition, so only back off once
+        # per delay window to avoid collapsing the rate on a single burst of bad responses.
+        now = time.time()
+        if now - self._last_decrease < max(self.delay, self._average_response_time or 0):
+            return
+        self._last_decrease = now
+        self._rate = max(self._rate * factor, self.min_rate)
+        self._concurrency = max(self._concurrency * factor, self.min_concurrency)
+        self._history.append(RateSample(now, self._rate, self._concurrency, reason))
@@ -0,0 +1,142 @@
+import asyncio
+import email.utils
+import random
+import time
+import typing
+import httpx
+
+from collections import Counter
+
+from ._exceptions import DeadlineExceeded
+from ._metrics import Metrics
+
+
+class RetryPolicy:
+    """
+    A policy for retrying requests. Status codes and exception types are mapped to the number of times a request may
+    be retried after receiving them. Retries are delayed with jittered exponential backoff, or by the duration of the
+    Retry-After header if it is longer.
+
+    :param retries: A mapping of status codes and exception types to the maximum number of retries. Exception types
+                    also match their subclasses, the most specific type in the mapping is used.
+    :param backoff_base: The base delay in seconds of the exponential backoff.
+    :param backoff_max: The maximum delay in seconds of the exponential backoff (Retry-After may exceed it).
+    :param deadline: The maximum number of seconds all attempts and backoffs may take together. No deadline if None.
+    :param respect_retry_after: Whether to wait at least as long as the Retry-After header of a response asks for.
+    :param max_retry_after: The longest Retry-After in seconds that is honoured. Responses asking for a longer wait
+                            aren't retried. Unbounded if None.
+    :param metrics: The backend that retries are reported to. Nothing is reported if None.
+    """
+
+    def __init__(
+            self,
+            retries: typing.Mapping[int | type[Exception], int | float],
+            backoff_base: float = 0.5,
+            backoff_max: float = 30.0,
+            deadline: float | None = None,
+            respect_retry_after: bool = True,
+            max_retry_after: float | None = 300.0,
+            metrics: Metrics | None = None,
+    ):
+        if backoff_base < 0 or backoff_max < 0:
+            raise ValueError("backoff_base and backoff_max must not be negative.")
+        elif deadline is not None and deadline <= 0:
+            raise ValueError("deadline must be positive.")
+        elif max_retry_after is not None and max_retry_after < 0:
+            raise ValueError("max_retry_after must not be negative.")
+
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.metrics = Metrics() if metrics is None else metrics
+
+    async def execute(self, send: typing.Callable[[], typing.Awaitable[httpx.Response]]) -> httpx.Response:
+        """
+        Send a request until it succeeds, its retries are exhausted or the deadline is reached.
+
+        :param send: A callable that sends the request and returns the response. It is called once per attempt.
+        :raises DeadlineExceeded: If the deadline is reached while an attempt is in progress.
+        :return: The response of the last attempt. Exceptions of the last attempt are raised instead.
+        """
+        start = time.monotonic()
+        attempts = Counter()
+        attempt = 0
+        while True:
+            response = error = None
+            try:
+                async with asyncio.timeout(self._remaining(start)) as timeout:
+                    response = await send()
+                key = response.status_code
+            except TimeoutError as e:
+                if not timeout.expired():
+                    raise e
+                raise DeadlineExceeded(f"deadline of {self.deadline} seconds exceeded.") from e
+            except httpx.HTTPStatusError as e:
+                response, error = e.response, e
+                key = response.status_code
+            except Exception as e:
+                error = e
+                key = self._match_exception(e)
+                if key is None:
+                    raise e
+
+            attempts[key] += 1
+            if attempts[key] > self.retries.get(key, 0):
+                return self._result(response, error)
+
+            delay = self._calc_delay(attempt, response)
+            remaining = self._remaining(start)
+            if delay is None or remaining is not None and delay >= remaining:
+                return self._result(response, error)
+
+            if self.metrics.enabled:
+                self.metrics.increment("request.retries", reason=key if isinstance(key, int) else key.__name__)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _match_exception(self, exception: Exception) -> type[Exception] | None:
+        for cls in type(exception).__mro__:
+            if cls in self.retries:
+                return cls
+        return None
+
+    def _calc_delay(self, attempt: int, response: httpx.Response | None) -> float | None:
+        # None means the response asks for a longer wait than max_retry_after, so it shouldn't be retried
+        # The exponent is capped, since the float power overflows after about 1024 attempts and backoff_max is
+        # reached long before that
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** min(attempt, 64)))
+        if self.respect_retry_after and response is not None:
+            retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                if self.max_retry_after is not None and retry_after > self.max_retry_after:
+                    return None
+                delay = max(delay, retry_after)
+        return delay
+
+    def _remaining(self, start: float) -> float | None:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - (time.monotonic() - start), 0)
+
+    @staticmethod
+    def _parse_retry_after(value: str | None) -> float | None:
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            retry_at = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(retry_at.timestamp() - time.time(), 0)
+
+    @staticmethod
+    def _result(response: httpx.Response | None, error: Exception | None) -> httpx.Response:
+        if error is not None:
+            raise error
+        return response
@@ -0,0 +1,367 @@
+from __future__ import annotations
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import queue
+import typing
+import httpx
+
+from ._exceptions import WorkerError
+from ._host_manager import Priority
+from ._webber import Webber
+
+
+class HashRing:
+    """
+    A consistent hash ring. Keys are mapped to the node that follows their hash on the ring, and every node is placed
+    on the ring several times to spread keys evenly. Adding or removing a node only remaps the keys of that node.
+
+    :param nodes: The nodes to place on the ring.
+    :param replicas: The number of times each node is placed on the ring.
+    """
+
+    def __init__(self, nodes: typing.Iterable[typing.Hashable] = (), replicas: int = 100):
+        if replicas < 1:
+            raise ValueError("replicas must be a positive integer.")
+        self.replicas = replicas
+        self._hashes = []
+        self._nodes = {}
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> set[typing.Hashable]:
+        return set(self._nodes.values())
+
+    def add(self, node: typing.Hashable) -> None:
+        for replica in range(self.replicas):
+            node_hash = self._hash(f"{node}-{replica}")
+            if node_hash not in self._nodes:
+                bisect.insort(self._hashes, node_hash)
+            self._nodes[node_hash] = node
+
+    def remove(self, node: typing.Hashable) -> None:
+        for replica in range(self.replicas):
+            node_hash = self._hash(f"{node}-{replica}")
+            if self._nodes.get(node_hash) == node:
+                del self._nodes[node_hash]
+                self._hashes.remove(node_hash)
+
+    def node(self, key: str) -> typing.Hashable:
+        """
+        Get the node a key is mapped to.
+
+        :param key: The key to look up.
+        :raises LookupError: If the ring is empty.
+        :return: The node of the key.
+        """
+        if not self._hashes:
+            raise LookupError("the ring has no nodes.")
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[self._hashes[index]]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # hash() is salted per process, so use a stable hash that every process agrees on
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class ShardedWebber:
+    """
+    A Webber that spreads hosts across worker processes to use more than one CPU core. Each worker runs its own
+    event loop and Webber, hosts are assigned to workers by consistent hashing, and proxies are partitioned so that
+    no two workers lease the same proxy. Responses are streamed back to the parent process.
+
+    Responses are transferred with their status code, headers, url, HTTP version and decoded body; the
+    Content-Encoding header is dropped since the body is already decoded. Exceptions that can't be transferred are
+    raised as a `WorkerError`.
+
+    :param non_ua_proxies: Proxy urls to assign user-agents to. Proxies that aren't in ua_proxies_path yet are
+                           appended to it.
+    :param ua_proxies_path: The path of a line-delimited JSON file of proxy urls and their user-agent headers (see
+                            `ProxyStore`). Workers generate the user agents of proxies that have none when they first
+                            use them, but don't save them.
+    :param use_proxies: Whether to use proxies.
+    :param workers: The number of worker processes. Defaults to the number of CPU cores, but never more than the
+                    number of proxies, so every worker has at least one.
+    :param replicas: The number of times each worker is placed on the hash ring.
+    :param ua_proxies: A mapping of proxy urls to user-agent headers, used instead of loading the proxies from
+                       ua_proxies_path.
+    :param webber_options: Further keyword arguments of the Webber of each worker. They must be picklable.
+    """
+
+    def __init__(
+            self,
+            non_ua_proxies: list[str] | tuple[str, ...] | set[str] | None = None,
+            ua_proxies_path: str | None = None,
+            use_proxies: bool = True,
+            workers: int | None = None,
+            replicas: int = 100,
+            ua_proxies: typing.Mapping[str, dict[str, str]] | None = None,
+            **webber_options: typing.Any,
+    ):
+        workers = (os.cpu_count() or 1) if workers is None else workers
+        if workers < 1:
+            raise ValueError("workers must be a positive integer.")
+
+        self.proxies = Webber._load_proxies(non_ua_proxies, ua_proxies_path, use_proxies, ua_proxies)
+        self.num_workers = min(workers, len(self.proxies)) if self.proxies else workers
+        self._webber_options = webber_options
+        self._ring = HashRing(range(self.num_workers), replicas)
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = []
+        self._request_queues = []
+        self._result_queue = None
+        self._reader = None
+        self._requests = {}
+        self._request_ids = itertools.count()
+        self._closed = False
+
+    def worker_proxies(self, worker: int) -> dict[str, dict[str, str]]:
+        """
+        Get the proxies of a worker. The partitions of all workers are disjoint.
+
+        :param worker: The index of the worker.
+        :return: A mapping of proxy urls to user-agent headers.
+        """
+        return dict(itertools.islice(sorted(self.proxies.items()), worker, None, self.num_workers))
+
+    def worker(self, url: str) -> int:
+        """
+        Get the index of the worker whose shard includes the host of a url.
+
+        :param url: The url.
+        :return: The index of the worker.
+        """
+        return self._ring.node(httpx.URL(url).host)
+
+    async def start(self) -> None:
+        """Start the worker processes. This is done automatically on the first request."""
+        if self._closed:
+            raise RuntimeError("ShardedWebber has been closed.")
+        elif self._processes:
+            return
+
+        self._result_queue = self._context.Queue()
+        for worker in range(self.num_workers):
+            request_queue = self._context.Queue()
+            process = self._context.Process(
+                target=_run_worker,
+                args=(self.worker_proxies(worker), self._webber_options, request_queue, self._result_queue),
+                name=f"webber-worker-{worker}",
+                daemon=True,
+            )
+            process.start()
+            self._request_queues.append(request_queue)
+            self._processes.append(process)
+        self._reader = asyncio.create_task(self._read_results())
+
+    async def aclose(self) -> None:
+        """Stop the worker processes. Requests that are still in flight fail with a `WorkerError`."""
+        if self._closed:
+            return
+        self._closed = True
+
+        for request_queue in self._request_queues:
+            request_queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, 10)
+            if process.is_alive():
+                process.terminate()
+
+        if self._reader is not None:
+            self._reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reader
+        self._fail_requests(lambda _: True, "ShardedWebber was closed.")
+
+    async def __aenter__(self) -> ShardedWebber:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def get(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes | None = None,
+            retries: dict[int | type[Exception], int | float] | None = None,
+            http2: bool | None = True,
+            deadline: float | None = None,
+            priority: Priority = Priority.REFRESH,
+    ) -> httpx.Response:
+        """
+        Send a GET request from the worker that owns the host of the url. See `Webber.get`.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param retries: A mapping of status codes and exception types to the maximum number of retries.
+        :param http2: Whether to use HTTP/2.
+        :param deadline: The maximum number of seconds all attempts and backoffs may take together.
+        :param priority: The priority of the request in its host's queue.
+        :raises WorkerError: If the worker died or its exception couldn't be transferred.
+        :return: The response of the last attempt.
+        """
+        await self.start()
+        worker = self.worker(url)
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._requests[request_id] = worker, future
+        self._request_queues[worker].put((request_id, url, headers, retries, http2, deadline, priority))
+        try:
+            return await future
+        finally:
+            self._requests.pop(request_id, None)
+
+    async def fetch_many(
+            self,
+            urls: typing.Iterable[str] | typing.AsyncIterable[str],
+            headers: httpx._types.HeaderTypes | None = None,
+            retries: dict[int | type[Exception], int | float] | None = None,
+            http2: bool | None = True,
+            deadline: float | None = None,
+            concurrency: int = 100,
+            return_exceptions: bool = False,
+            priority: Priority = Priority.REFRESH,
+    ) -> typing.AsyncIterator[httpx.Response | Exception]:
+        """
+        Send GET requests for many urls across the workers and yield the responses as they complete. Urls are read
+        lazily and at most `concurrency` requests are in flight across all workers.
+
+        :param urls: An iterable or async iterable of urls to request.
+        :param headers: The headers to send with every request.
+        :param retries: A mapping of status codes and exception types to the maximum number of retries.
+        :param http2: Whether to use HTTP/2.
+        :param deadline: The maximum number of seconds all attempts and backoffs of a request may take together.
+        :param concurrency: The maximum number of requests in flight across all workers.
+        :param return_exceptions: Whether to yield exceptions of failed requests instead of raising them.
+        :param priority: The priority of the requests in their hosts' queues.
+        :return: An async iterator of responses (and exceptions if return_exceptions is True) in completion order.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer.")
+
+        url_iterator = aiter(urls) if isinstance(urls, typing.AsyncIterable) else aiter(Webber._to_async_iterable(urls))
+        tasks = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(tasks) < concurrency:
+                    try:
+                        url = await anext(url_iterator)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    tasks.add(asyncio.create_task(self.get(url, headers, retries, http2, deadline, priority)))
+
+                if not tasks:
+                    return
+
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise e
+                        result = e
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _read_results(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                request_id, failed, payload = await loop.run_in_executor(None, self._result_queue.get, True, 0.5)
+            except queue.Empty:
+                dead_workers = {worker for worker, process in enumerate(self._processes) if not process.is_alive()}
+                if dead_workers:
+                    self._fail_requests(lambda worker: worker in dead_workers, "the worker process died.")
+                continue
+
+            _, future = self._requests.get(request_id, (None, None))
+            if future is None or future.done():
+                continue
+            elif failed:
+                future.set_exception(payload)
+            else:
+                future.set_result(_unpack_response(payload))
+
+    def _fail_requests(self, predicate: typing.Callable[[int], bool], message: str) -> None:
+        for worker, future in list(self._requests.values()):
+            if predicate(worker) and not future.done():
+                future.set_exception(WorkerError(message))
+
+
+def _run_worker(
+        proxies: dict[str, dict[str, str]],
+        webber_options: dict[str, typing.Any],
+        request_queue: multiprocessing.Queue,
+        result_queue: multiprocessing.Queue,
+) -> None:
+    asyncio.run(_serve_worker(proxies, webber_options, request_queue, result_queue))
+
+
+async def _serve_worker(
+        proxies: dict[str, dict[str, str]],
+        webber_options: dict[str, typing.Any],
+        request_queue: multiprocessing.Queue,
+        result_queue: multiprocessing.Queue,
+) -> None:
+    webber = Webber(ua_proxies=proxies, **webber_options)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    async def handle(request_id: int, url: str, *args: typing.Any) -> None:
+        try:
+            response = await webber.get(url, *args)
+        except Exception as e:
+            result_queue.put((request_id, True, _picklable_exception(e)))
+        else:
+            result_queue.put((request_id, False, _pack_response(response)))
+
+    while (request := await loop.run_in_executor(None, request_queue.get)) is not None:
+        request_id, url, headers, retries, http2, deadline, priority = request
+        task = asyncio.create_task(handle(request_id, url, headers or {}, retries, None, http2, deadline, priority))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await webber.aclose()
+
+
+def _pack_response(response: httpx.Response) -> tuple:
+    headers = [
+        (name, value) for name, value in response.headers.multi_items()
+        if name.lower() not in ("content-encoding", "content-length")
+    ]
+    return response.status_code, headers, response.content, str(response.url), response.http_version
+
+
+def _unpack_response(payload: tuple) -> httpx.Response:
+    status_code, headers, content, url, http_version = payload
+    return httpx.Response(
+        status_code,
+        headers=headers,
+        content=content,
+        request=httpx.Request("GET", url),
+        extensions={"http_version": http_version.encode()},
+    )
+
+
+def _picklable_exception(exception: Exception) -> Exception:
+    try:
+        pickle.loads(pickle.dumps(exception))
+    except Exception:
+        return WorkerError(f"{type(exception).__name__}: {exception}")
+    return exception
@@ -0,0 +1,61 @@
+import asyncio
+import typing
+
+T = typing.TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key, so only the first one runs and every caller receives its result
+    or exception. A call is no longer shared once it has finished, so later calls with the same key run again.
+
+    The shared call runs in its own task, so a cancelled caller doesn't cancel it for the others. It is cancelled
+    once every caller has been cancelled.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def __contains__(self, key: typing.Hashable) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: typing.Hashable, func: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        """
+        Run a call, or join the call with the same key that is already in flight.
+
+        :param key: The key identifying the call.
+        :param func: A callable returning the awaitable to run if no call with the key is in flight.
+        :return: The result of the shared call.
+        """
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(func())
+            call = self._calls[key] = [task, 0]
+            task.add_done_callback(lambda _: self._forget(key, call))
+
+        task = call[0]
+        call[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            call[1] -= 1
+            if not call[1] and not task.done():
+                self._forget(key, call)
+                task.cancel()
+
+    def joined(self, key: typing.Hashable) -> int:
+        """
+        Get the number of callers waiting for a call.
+
+        :param key: The key identifying the call.
+        :return: The number of callers, 0 if no call with the key is in flight.
+        """
+        call = self._calls.get(key)
+        return 0 if call is None else call[1]
+
+    def _forget(self, key: typing.Hashable, call: list) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
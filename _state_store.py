@@ -0,0 +1,98 @@
+import json
+import os
+import tempfile
+import time
+import typing
+import warnings
+
+from ._host_manager import HostState
+from ._proxy_health import ProxyHealthState
+
+
+class LearnedState(typing.NamedTuple):
+    """
+    What webber has learned about hosts and proxies, as saved by a `StateStore`.
+
+    :param hosts: A mapping of host names to their learned rate states.
+    :param proxies: A mapping of proxy urls to their health records.
+    """
+
+    hosts: dict[str, HostState]
+    proxies: dict[str, ProxyHealthState]
+
+
+class StateStore:
+    """
+    A JSON file that persists learned host rate limits and proxy health across runs, so a new run doesn't hit the
+    rate limits of every host again while it relearns them.
+
+    The file is replaced atomically, so a run that is killed while saving leaves the previous file intact. Its methods
+    block, so call them in a thread from async code, e.g. with `asyncio.to_thread`.
+
+    :param path: The path of the JSON file.
+    :param flush_interval: The number of seconds between periodic saves by the owner of the store (see Webber).
+    :param max_age: The number of seconds after which a host's learned state is no longer loaded, since the host may
+                    have changed its limits. States are kept forever if None.
+    """
+
+    #: The version of the file format. Files of other versions are ignored.
+    VERSION = 1
+
+    def __init__(self, path: str, flush_interval: float = 60.0, max_age: float | None = 7 * 24 * 3600):
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be positive.")
+        elif max_age is not None and max_age <= 0:
+            raise ValueError("max_age must be positive.")
+
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+
+    def load(self) -> LearnedState:
+        """
+        Load the saved state. A missing file loads as an empty state, and an unreadable one as well, with a warning.
+
+        :return: The learned state, with the hosts ordered from least to most recently updated.
+        """
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return LearnedState({}, {})
+        except (OSError, ValueError) as e:
+            warnings.warn(f"Ignoring the unreadable state file {self.path}: {e}")
+            return LearnedState({}, {})
+        if not isinstance(data, dict) or data.get("version") != self.VERSION:
+            warnings.warn(f"Ignoring the state file {self.path} of an unsupported version.")
+            return LearnedState({}, {})
+
+        oldest = None if self.max_age is None else time.time() - self.max_age
+        hosts = sorted(
+            ((host, HostState(**state)) for host, state in data["hosts"].items()),
+            key=lambda item: item[1].time,
+        )
+        return LearnedState(
+            hosts={host: state for host, state in hosts if oldest is None or state.time >= oldest},
+            proxies={url: ProxyHealthState(**state) for url, state in data["proxies"].items()},
+        )
+
+    def save(self, state: LearnedState) -> None:
+        """
+        Save a state, replacing the file atomically.
+
+        :param state: The state to save.
+        """
+        data = {
+            "version": self.VERSION,
+            "hosts": {host: host_state._asdict() for host, host_state in state.hosts.items()},
+            "proxies": {url: health._asdict() for url, health in state.proxies.items()},
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".webber-state-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        except BaseException as e:
+            os.unlink(temp_path)
+            raise e
@@ -0,0 +1,83 @@
+import time
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter. The bucket refills at `rate` tokens per second up to `burst` tokens, and every request
+    takes one token, so up to `burst` requests may be sent at once while the long-term rate never exceeds `rate`.
+    The bucket uses the monotonic clock, so it isn't affected by changes of the system time.
+
+    The bucket doesn't sleep itself: `consume` either takes a token or returns how long to wait for one, so the caller
+    decides how to wait.
+
+    :param rate: The number of tokens added per second.
+    :param burst: The capacity of the bucket. The bucket starts full.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive.")
+        elif burst < 1:
+            raise ValueError("burst must be at least 1.")
+
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float) -> None:
+        if value <= 0:
+            raise ValueError("rate must be positive.")
+        # Tokens added so far are added at the old rate
+        self._refill(time.monotonic())
+        self._rate = value
+
+    @property
+    def burst(self) -> float:
+        return self._burst
+
+    @burst.setter
+    def burst(self, value: float) -> None:
+        if value < 1:
+            raise ValueError("burst must be at least 1.")
+        self._refill(time.monotonic())
+        self._burst = value
+        self._tokens = min(self._tokens, value)
+
+    @property
+    def tokens(self) -> float:
+        """The number of tokens currently in the bucket."""
+        self._refill(time.monotonic())
+        return self._tokens
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """
+        Get the number of seconds until the bucket holds enough tokens.
+
+        :param tokens: The number of tokens needed.
+        :return: The number of seconds to wait, 0 if the tokens are available now.
+        """
+        self._refill(time.monotonic())
+        return max(tokens - self._tokens, 0) / self._rate
+
+    def consume(self, tokens: float = 1.0) -> float:
+        """
+        Take tokens from the bucket if it holds enough of them.
+
+        :param tokens: The number of tokens to take.
+        :return: 0 if the tokens were taken, otherwise the number of seconds until they are available. Nothing is
+                 taken in that case.
+        """
+        delay = self.delay(tokens)
+        if not delay:
+            self._tokens -= tokens
+        return delay
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._tokens + (now - self._updated_at) * self._rate, self._burst)
+        self._updated_at = now
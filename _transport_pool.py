@@ -0,0 +1,106 @@
+import asyncio
+import httpcore
+import httpx
+
+from httpx._config import DEFAULT_LIMITS
+
+from ._proxy import Proxy
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    A transport that shares the connection pool of another transport. Closing a shared transport leaves the
+    underlying transport open, so clients using it can be closed without closing their connections.
+
+    :param transport: The transport to share.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    @property
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return self._transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class TransportPool:
+    """
+    A pool of proxied transports with one transport per proxy and HTTP version. Clients that use the same proxy share
+    its transport, so connections (and their TCP, TLS and HTTP/2 handshakes) are reused when clients are rotated.
+    Cookies are stored by the clients, so every client still gets a fresh identity.
+
+    :param limits: The connection limits of each transport.
+    """
+
+    def __init__(self, limits: httpx.Limits = DEFAULT_LIMITS):
+        self._limits = limits
+        self._transports = {}
+
+    def get(self, proxy: Proxy, http2: bool) -> SharedTransport:
+        """
+        Get the transport for a proxy, creating it if it doesn't exist.
+
+        :param proxy: The proxy the transport should connect through.
+        :param http2: Whether the transport should use HTTP/2.
+        :return: A shared transport that can be passed to a client and closed with it.
+        """
+        transport = self._transports.get((proxy, http2))
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(proxy=proxy.url, http2=http2, limits=self._limits)
+            self._transports[proxy, http2] = transport
+        return SharedTransport(transport)
+
+    def max_streams(self, proxy: Proxy) -> int | None:
+        """
+        Get the number of requests that can be sent concurrently over one HTTP/2 connection of a proxy, i.e. the max
+        concurrent streams advertised by the server. Connections that negotiated HTTP/1.1 carry one request at a time.
+
+        :param proxy: The proxy.
+        :return: The lowest limit of the proxy's HTTP/2 transport's connections, or None if the transport has no
+                 established connection yet.
+        """
+        transport = self._transports.get((proxy, True))
+        if transport is None:
+            return None
+        limits = []
+        for connection in transport._pool.connections:
+            # Proxied connections wrap the connection to the host, which is only created once it is established
+            while not isinstance(connection, (httpcore.AsyncHTTP2Connection, httpcore.AsyncHTTP11Connection)):
+                connection = getattr(connection, "_connection", None)
+                if connection is None:
+                    break
+            if isinstance(connection, httpcore.AsyncHTTP11Connection):
+                limits.append(1)
+            elif isinstance(connection, httpcore.AsyncHTTP2Connection):
+                # Set once the connection is initialised, and updated when the server's settings arrive
+                max_streams = getattr(connection, "_max_streams", None)
+                if max_streams is not None:
+                    limits.append(max_streams)
+        return min(limits, default=None)
+
+    async def discard(self, proxy: Proxy) -> None:
+        """
+        Close and remove the transports of a proxy.
+
+        :param proxy: The proxy whose transports should be closed.
+        """
+        transports = [self._transports.pop(key) for key in ((proxy, True), (proxy, False)) if key in self._transports]
+        await asyncio.gather(*(transport.aclose() for transport in transports))
+
+    async def aclose(self) -> None:
+        """Close and remove all transports."""
+        transports = list(self._transports.values())
+        self._transports.clear()
+        await asyncio.gather(*(transport.aclose() for transport in transports))
+
+    def __len__(self) -> int:
+        return len(self._transports)
+
+    def __contains__(self, proxy) -> bool:
+        return (proxy, True) in self._transports or (proxy, False) in self._transports
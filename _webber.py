@@ -1,13 +1,27 @@
 from __future__ import annotations
-import json
+import asyncio
+import contextlib
+import inspect
 import math
 import typing
 import httpx
 import os
 import ua_generator
-import validators
+import warnings
 
-from ._host_manager import HostManager
+from collections import Counter, deque
+
+from ._cache import CacheEntry, ResponseCache
+from ._host_manager import HostManager, Priority
+from ._host_registry import HostRegistry
+from ._metrics import Metrics
+from ._proxy import Proxy
+from ._proxy_registry import ProxyRegistry
+from ._proxy_store import ProxyStore
+from ._rate_controller import RateController
+from ._retry import RetryPolicy
+from ._single_flight import SingleFlight
+from ._state_store import LearnedState, StateStore
 
 
 class Webber:
@@ -15,41 +29,162 @@ class Webber:
             self,
             non_ua_proxies: list[str] | tuple[str, ...] | set[str] | None = None,
             ua_proxies_path: str | None = None,
-            use_proxies: bool = True
+            use_proxies: bool = True,
+            max_leases_per_proxy: int | None = None,
+            max_leases_per_host: int | None = None,
+            metrics: Metrics | None = None,
+            rate_controller_factory: typing.Callable[[str], RateController] | None = None,
+            ua_proxies: typing.Mapping[str, dict[str, str]] | None = None,
+            cache: ResponseCache | None = None,
+            coalesce: bool = True,
+            burst: float = 1.0,
+            per_proxy: bool = False,
+            max_hosts: int | None = 10_000,
+            host_idle_ttl: float | None = 600.0,
+            state_store: StateStore | None = None,
+            proxies_per_host: int | None = 256,
     ) -> None:
-        if non_ua_proxies is not None:
-            if not use_proxies:
-                raise ValueError("use_proxies is set to False, but proxies were passed.")
-            if ua_proxies_path is None:
-                raise ValueError("non_ua_proxies were passed, but ua_proxies_path is missing.")
-            for proxy in non_ua_proxies:
-                if not validators.url(proxy):
-                    proxy = proxy.replace("\n", "\\n")
-                    raise ValueError(f"proxy: {proxy} is not a valid url.")
+        """
+        :param non_ua_proxies: Proxy urls to assign user-agents to. Proxies that aren't in ua_proxies_path yet are
+                               appended to it, and get their user agents when they are first used.
+        :param ua_proxies_path: The path of a line-delimited JSON file of proxy urls and their user-agent headers (see
+                                `ProxyStore`). Files mapping proxy urls to user-agent headers in one JSON object are
+                                read as well. User agents assigned to proxies are appended to the file in batches.
+        :param use_proxies: Whether to use proxies.
+        :param max_leases_per_proxy: The maximum number of hosts that may use a proxy at once. Unlimited if None.
+        :param max_leases_per_host: The maximum number of proxies a host may use at once. Unlimited if None.
+        :param metrics: The backend that metrics and trace spans are reported to. Nothing is reported if None.
+        :param rate_controller_factory: A callable that creates the rate controller of a host from the host name.
+                                        Hosts use a RateController with default settings if None.
+        :param ua_proxies: A mapping of proxy urls to user-agent headers, used instead of loading the proxies from
+                           ua_proxies_path. Proxies mapped to None get generated user agents when they are first used.
+        :param cache: The cache that `get` serves fresh responses from and revalidates stale responses with. Nothing is
+                      cached if None.
+        :param coalesce: Whether concurrent `get` calls for the same url, headers and HTTP version share one
+                         upstream request. Every caller then receives the same response object or exception, produced
+                         with the retries and deadline of the first caller. Calls with event hooks are never shared.
+        :param burst: The number of requests to a host that may start at once within its rate budget.
+        :param per_proxy: Whether a host's rate applies to each proxy instead of the host as a whole.
+        :param max_hosts: The maximum number of hosts to keep managers for. Cold hosts are closed and evicted, keeping
+                          only their learned rate state. Unlimited if None.
+        :param host_idle_ttl: The number of seconds a host may be unused before it's evicted. Hosts are only evicted
+                              for space if None.
+        :param state_store: The store that learned host rate limits and proxy health are loaded from, and saved to
+                            every `flush_interval` seconds and when the Webber is closed. Nothing is persisted if None.
+        :param proxies_per_host: The number of proxies each host rotates through. Hosts get consecutive slices of the
+                                 proxies, so the memory of a host doesn't grow with the number of proxies. Every host
+                                 uses all proxies if None.
+        """
+        self.proxies = self._load_proxies(non_ua_proxies, ua_proxies_path, use_proxies, ua_proxies)
+        self._proxy_store = ProxyStore(ua_proxies_path) if ua_proxies is None and ua_proxies_path else None
+        # User agents assigned to proxies are appended to the store in batches, at most every
+        # user_agent_flush_interval seconds
+        self.user_agent_flush_interval = 1.0
+        self._assigned_user_agents = []
+        self._user_agent_flush_task = None
+        self._user_agent_lock = asyncio.Lock()
 
-            if os.path.isfile(ua_proxies_path):
-                os.replace(ua_proxies_path, ua_proxies_path + ".backup")
-            with open(ua_proxies_path, "w") as f:
-                self.proxies = {proxy: self._generate_user_agent() for proxy in non_ua_proxies}
-                json.dump(self.proxies, f)
+        self._metrics = Metrics() if metrics is None else metrics
+        # Proxies read from the store were validated when they were added to it
+        make_proxy = Proxy if self._proxy_store is None else Proxy.trusted
+        self._proxy_registry = ProxyRegistry(
+            (make_proxy(url, user_agent) for url, user_agent in self.proxies.items()),
+            max_leases_per_proxy=max_leases_per_proxy,
+            max_leases_per_host=max_leases_per_host,
+            metrics=self._metrics,
+            user_agent_factory=self._assign_user_agent,
+            pool_size=proxies_per_host,
+        )
+        self._rate_controller_factory = rate_controller_factory
+        self._cache = cache
+        self.coalesce = coalesce
+        self.burst = burst
+        self.per_proxy = per_proxy
+        self._in_flight = SingleFlight()
+        self._hosts = HostRegistry(self._create_host, max_hosts=max_hosts, idle_ttl=host_idle_ttl)
+        self._closed = False
+        self._state_store = state_store
+        self._flush_task = None
+        # The saved health records of the proxies that were restored or used, see _learned_state
+        self._proxy_states = {}
+        if state_store is not None:
+            self._restore_state(state_store.load())
 
-        elif ua_proxies_path is not None:
-            if not use_proxies:
-                raise ValueError("use_proxies is set to False, but proxies were passed.")
+    @property
+    def proxy_registry(self) -> ProxyRegistry:
+        return self._proxy_registry
+
+    @property
+    def cache(self) -> ResponseCache | None:
+        return self._cache
 
-            with open(ua_proxies_path) as file:
-                self.proxies = json.load(file)
+    @property
+    def hosts(self) -> HostRegistry:
+        return self._hosts
 
-        self._hosts = {}
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    async def aclose(self, timeout: float | None = 10.0) -> None:
+        """
+        Close every host concurrently. Requests in flight get up to `timeout` seconds to finish before the clients and
+        connections are closed, and new requests are refused. The cache is left open, since it's owned by the caller.
+
+        :param timeout: The number of seconds to wait for requests in flight. Waits indefinitely if None.
+        """
+        self._closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flush_task
+        await self._hosts.aclose(timeout)
+        if self._user_agent_flush_task is not None:
+            self._user_agent_flush_task.cancel()
+            self._user_agent_flush_task = None
+        if self._proxy_store is not None:
+            await self._flush_user_agents()
+        if self._state_store is not None:
+            await self.save_state()
+
+    async def save_state(self) -> None:
+        """Save the learned host rate limits and proxy health to the state store without blocking the loop."""
+        if self._state_store is None:
+            raise RuntimeError("Webber has no state store.")
+        # The snapshot is taken on the loop, only the serialization and the write run in a thread
+        await asyncio.to_thread(self._state_store.save, self._learned_state())
+
+    async def __aenter__(self) -> Webber:
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
 
     async def get(
             self,
             url: str,
             headers: httpx._types.HeaderTypes,
-            retries: dict[int | Exception, int] | None = None,
+            retries: dict[int | type[Exception], int | float] | None = None,
             event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
-            http2: bool | None = True
-    ) -> None:
+            http2: bool | None = True,
+            deadline: float | None = None,
+            priority: Priority = Priority.REFRESH,
+    ) -> httpx.Response:
+        """
+        Send a GET request. Failed requests are retried on a fresh proxy with jittered exponential backoff. If a cache
+        is configured, fresh cached responses are returned without a request and stale ones are revalidated.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param retries: A mapping of status codes and exception types to the maximum number of retries.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2. Hosts that negotiated HTTP/1.1 are sent HTTP/1.1 requests either way.
+        :param deadline: The maximum number of seconds all attempts and backoffs may take together.
+        :param priority: The priority of the request in its host's queue. Coalesced requests keep the priority of the
+                         request they joined.
+        :raises DeadlineExceeded: If the deadline is reached while an attempt is in progress.
+        :return: The response of the last attempt.
+        """
         if retries is None:
             retries = {
                 403: 5,
@@ -61,9 +196,312 @@ class Webber:
                 httpx.ProxyError: math.inf,
             }
 
-        host_name = httpx.URL(url).host
-        host = self._hosts.setdefault(host_name, HostManager(self.proxies))
-        response = await host.get(url, headers, event_hooks, http2)
+        entry = None
+        if self._cache is not None:
+            # Fresh responses are served before a host is even looked up, so they skip the host delay and proxies
+            entry = await asyncio.to_thread(self._cache.get, url, headers)
+            if entry is not None and entry.is_fresh():
+                self._metrics.increment("cache.hits")
+                return entry.to_response()
+
+        if not self.coalesce or event_hooks is not None:
+            return await self._fetch(url, headers, entry, retries, event_hooks, http2, deadline, priority)
+
+        # Concurrent identical requests share one upstream request, and with it one rate-limit slot and proxy lease
+        key = url, tuple(sorted(httpx.Headers(headers).multi_items())), http2
+        if key in self._in_flight:
+            self._metrics.increment("request.coalesced", host=httpx.URL(url).host)
+        return await self._in_flight.do(
+            key, lambda: self._fetch(url, headers, entry, retries, event_hooks, http2, deadline, priority)
+        )
+
+    @contextlib.asynccontextmanager
+    async def stream(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes | None = None,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
+            http2: bool | None = True,
+            priority: Priority = Priority.REFRESH,
+    ) -> typing.AsyncIterator[httpx.Response]:
+        """
+        Send a GET request and stream the response body instead of loading it into memory at once. The body can be
+        read with `response.aiter_bytes()`. The proxy stays leased until the stream is closed. Streamed requests are
+        not retried.
+
+        :param url: The url to request.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2.
+        :param priority: The priority of the request in its host's queue.
+        :return: An async context manager yielding a response whose body has not been read.
+        """
+        async with self._get_host(url).stream(url, headers, event_hooks, http2, priority) as response:
+            yield response
+
+    async def download(
+            self,
+            url: str,
+            sink: str | os.PathLike | typing.Any,
+            headers: httpx._types.HeaderTypes | None = None,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
+            http2: bool | None = True,
+            chunk_size: int | None = 65536,
+            priority: Priority = Priority.REFRESH,
+    ) -> httpx.Response:
+        """
+        Send a GET request and write the response body to a file or sink as it arrives, without buffering it.
+
+        :param url: The url to request.
+        :param sink: A file path, or an object with a (sync or async) `write` method that is passed each chunk.
+        :param headers: The headers to send with the request.
+        :param event_hooks: Event hooks to run for the request.
+        :param http2: Whether to use HTTP/2.
+        :param chunk_size: The maximum size of the chunks passed to the sink.
+        :param priority: The priority of the request in its host's queue.
+        :return: The closed response. Its body is not available.
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            response = await stack.enter_async_context(self.stream(url, headers, event_hooks, http2, priority))
+            if isinstance(sink, (str, os.PathLike)):
+                sink = stack.enter_context(open(sink, "wb"))
+            async for chunk in response.aiter_bytes(chunk_size):
+                result = sink.write(chunk)
+                if inspect.isawaitable(result):
+                    await result
+        return response
+
+    async def fetch_many(
+            self,
+            urls: typing.Iterable[str] | typing.AsyncIterable[str],
+            headers: httpx._types.HeaderTypes | None = None,
+            retries: dict[int | type[Exception], int | float] | None = None,
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None = None,
+            http2: bool | None = True,
+            deadline: float | None = None,
+            concurrency: int = 100,
+            host_concurrency: int | None = None,
+            return_exceptions: bool = False,
+            priority: Priority = Priority.REFRESH,
+    ) -> typing.AsyncIterator[httpx.Response | Exception]:
+        """
+        Send GET requests for many urls and yield the responses as they complete. Urls are read lazily, so at most
+        `concurrency` requests are in flight and at most `concurrency` urls are held back waiting for a busy host,
+        however long the input is.
+
+        :param urls: An iterable or async iterable of urls to request.
+        :param headers: The headers to send with every request.
+        :param retries: A mapping of status codes and exception types to the maximum number of retries.
+        :param event_hooks: Event hooks to run for every request.
+        :param http2: Whether to use HTTP/2.
+        :param deadline: The maximum number of seconds all attempts and backoffs of a request may take together.
+        :param concurrency: The maximum number of requests in flight across all hosts.
+        :param host_concurrency: The maximum number of requests in flight for a single host. Defaults to concurrency.
+        :param return_exceptions: Whether to yield exceptions of failed requests instead of raising them.
+        :param priority: The priority of the requests in their hosts' queues.
+        :return: An async iterator of responses (and exceptions if return_exceptions is True) in completion order.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be a positive integer.")
+        host_concurrency = concurrency if host_concurrency is None else host_concurrency
+        if host_concurrency < 1:
+            raise ValueError("host_concurrency must be a positive integer.")
+
+        url_iterator = aiter(urls) if isinstance(urls, typing.AsyncIterable) else aiter(self._to_async_iterable(urls))
+        tasks = {}
+        host_requests = Counter()
+        held_back = {}
+        num_held_back = 0
+        exhausted = False
+        # Finished tasks whose results haven't been yielded yet
+        unread = []
+
+        def start(url: str, host_name: str) -> None:
+            task = asyncio.create_task(self.get(url, headers, retries, event_hooks, http2, deadline, priority))
+            tasks[task] = host_name
+            host_requests[host_name] += 1
+
+        try:
+            while True:
+                while not exhausted and len(tasks) < concurrency and num_held_back < concurrency:
+                    try:
+                        url = await anext(url_iterator)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+
+                    host_name = httpx.URL(url).host
+                    if host_requests[host_name] < host_concurrency:
+                        start(url, host_name)
+                    else:
+                        held_back.setdefault(host_name, deque()).append(url)
+                        num_held_back += 1
+
+                if not tasks:
+                    return
+
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                unread.extend(done)
+                while unread:
+                    task = unread.pop()
+                    host_name = tasks.pop(task)
+                    host_requests[host_name] -= 1
+                    if host_name in held_back:
+                        start(held_back[host_name].popleft(), host_name)
+                        num_held_back -= 1
+                        if not held_back[host_name]:
+                            del held_back[host_name]
+                    elif not host_requests[host_name]:
+                        del host_requests[host_name]
+
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            raise e
+                        result = e
+                    yield result
+        finally:
+            # Retrieve the exceptions of finished tasks that weren't read, so they aren't logged as never retrieved
+            for task in unread:
+                if not task.cancelled():
+                    task.exception()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _get_host(self, url: str) -> HostManager:
+        if self._closed:
+            raise RuntimeError("Cannot send a request, as the Webber has been closed.")
+        if self._state_store is not None and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+        return self._hosts.acquire(httpx.URL(url).host)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._state_store.flush_interval)
+            try:
+                await self.save_state()
+            except OSError as e:
+                warnings.warn(f"Failed to save the learned state to {self._state_store.path}: {e}")
+
+    def _learned_state(self) -> LearnedState:
+        # Only the health records updated since the last save are snapshotted, so the work on the loop scales with
+        # the proxies that were used rather than with the registry
+        for proxy, health in self._proxy_registry.changed_health().items():
+            self._proxy_states[proxy.url] = health.state()
+        return LearnedState(hosts=self._hosts.snapshot(), proxies=dict(self._proxy_states))
+
+    def _restore_state(self, state: LearnedState) -> None:
+        self._hosts.restore(state.hosts)
+        for proxy in self._proxy_registry.proxies:
+            health = state.proxies.get(proxy.url)
+            if health is not None:
+                self._proxy_registry.health(proxy).restore(health)
+                self._proxy_states[proxy.url] = health
+
+    def _create_host(self, host_name: str) -> HostManager:
+        rate_controller = None
+        if self._rate_controller_factory is not None:
+            rate_controller = self._rate_controller_factory(host_name)
+        return HostManager(
+            host_name,
+            self._proxy_registry.pool(),
+            rate_controller,
+            metrics=self._metrics,
+            burst=self.burst,
+            per_proxy=self.per_proxy,
+        )
+
+    async def _fetch(
+            self,
+            url: str,
+            headers: httpx._types.HeaderTypes,
+            entry: CacheEntry | None,
+            retries: dict[int | type[Exception], int | float],
+            event_hooks: typing.Mapping[str, list[httpx._client.EventHook]] | None,
+            http2: bool | None,
+            deadline: float | None,
+            priority: Priority,
+    ) -> httpx.Response:
+        if self._cache is not None:
+            self._metrics.increment("cache.misses" if entry is None else "cache.revalidations")
+
+        request_headers = headers
+        if entry is not None:
+            request_headers = httpx.Headers(headers)
+            request_headers.update(entry.validators())
+        retry_policy = RetryPolicy(retries, deadline=deadline, metrics=self._metrics)
+        # The host is looked up for every attempt, since it may be evicted while the retry policy backs off
+        with self._metrics.span("webber.get", url=url, host=httpx.URL(url).host):
+            response = await retry_policy.execute(
+                lambda: self._get_host(url).get(url, request_headers, event_hooks, http2, priority)
+            )
+
+        if self._cache is None:
+            return response
+        elif entry is not None and response.status_code == 304:
+            self._metrics.increment("cache.hits", revalidated=True)
+            entry = await asyncio.to_thread(self._cache.refresh, entry, headers, response)
+            return entry.to_response()
+        await asyncio.to_thread(self._cache.put, url, headers, response)
+        return response
+
+    @staticmethod
+    async def _to_async_iterable(iterable: typing.Iterable[str]) -> typing.AsyncIterator[str]:
+        for item in iterable:
+            yield item
+
+    @classmethod
+    def _load_proxies(
+            cls,
+            non_ua_proxies: typing.Iterable[str] | None,
+            ua_proxies_path: str | None,
+            use_proxies: bool,
+            ua_proxies: typing.Mapping[str, dict[str, str] | None] | None = None,
+    ) -> dict[str, dict[str, str] | None]:
+        if ua_proxies is not None:
+            if not use_proxies:
+                raise ValueError("use_proxies is set to False, but proxies were passed.")
+            elif non_ua_proxies is not None or ua_proxies_path is not None:
+                raise ValueError("ua_proxies cannot be combined with non_ua_proxies or ua_proxies_path.")
+            return dict(ua_proxies)
+
+        elif non_ua_proxies is not None:
+            if not use_proxies:
+                raise ValueError("use_proxies is set to False, but proxies were passed.")
+            if ua_proxies_path is None:
+                raise ValueError("non_ua_proxies were passed, but ua_proxies_path is missing.")
+            # New proxies are appended without user agents, which are generated when the proxies are first used
+            return ProxyStore(ua_proxies_path).add(non_ua_proxies)
+
+        elif ua_proxies_path is not None:
+            if not use_proxies:
+                raise ValueError("use_proxies is set to False, but proxies were passed.")
+            return ProxyStore(ua_proxies_path).load()
+
+        return {}
+
+    def _assign_user_agent(self, url: str) -> dict[str, str]:
+        # Called while a proxy is leased, so the assignment is buffered and appended to the store in a batch later
+        user_agent = self.proxies[url] = self._generate_user_agent()
+        if self._proxy_store is not None:
+            self._assigned_user_agents.append((url, user_agent))
+            if self._user_agent_flush_task is None:
+                self._user_agent_flush_task = asyncio.ensure_future(self._flush_user_agents_later())
+        return user_agent
+
+    async def _flush_user_agents_later(self) -> None:
+        await asyncio.sleep(self.user_agent_flush_interval)
+        # The task is only cancelled by aclose while it sleeps, so a started write isn't interrupted
+        self._user_agent_flush_task = None
+        await self._flush_user_agents()
+
+    async def _flush_user_agents(self) -> None:
+        async with self._user_agent_lock:
+            records, self._assigned_user_agents = self._assigned_user_agents, []
+            if records:
+                await asyncio.to_thread(self._proxy_store.append, records)
 
     @staticmethod
     def _generate_user_agent():
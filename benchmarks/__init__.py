@@ -0,0 +1,3 @@
+from ._memory import *
+from ._runner import *
+from ._servers import *
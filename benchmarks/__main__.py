@@ -0,0 +1,111 @@
+import argparse
+import json
+import sys
+
+from ._memory import measure_proxy_memory
+from ._runner import SCENARIOS, run_suite, compare
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark webber against local stand-in servers.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and write a JSON report.")
+    run_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    run_parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 10, 100])
+    run_parser.add_argument("--requests", type=int, default=1000, help="Requests per run.")
+    run_parser.add_argument("--proxies", type=int, default=50, help="Number of stand-in proxies.")
+    run_parser.add_argument("--url", help="Benchmark against this url instead of a local stand-in origin.")
+    run_parser.add_argument("--http2", action="store_true")
+    run_parser.add_argument("--trace-memory", action="store_true", help="Measure the peak heap with tracemalloc.")
+    run_parser.add_argument("--no-isolate", action="store_true", help="Run every benchmark in this process.")
+    run_parser.add_argument("--latency", type=float, default=0.01, help="Origin latency in seconds.")
+    run_parser.add_argument("--jitter", type=float, default=0.0, help="Origin latency jitter in seconds.")
+    run_parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 500 responses.")
+    run_parser.add_argument("--rate-limit", type=float, help="Requests per second before the origin sends 429.")
+    run_parser.add_argument("--retry-after", type=float, default=1.0)
+    run_parser.add_argument("--body-size", type=int, default=1024)
+    run_parser.add_argument("--cpu-rounds", type=int, default=0, help="SHA-256 rounds per request.")
+    run_parser.add_argument("--proxy-latency", type=float, default=0.0)
+    run_parser.add_argument("--proxy-failure-rate", type=float, default=0.0, help="Fraction of 502 responses.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", "-o", help="The path of the report. Printed to stdout if omitted.")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two JSON reports.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    memory_parser = subparsers.add_parser("memory", help="Measure the memory of a large proxy registry.")
+    memory_parser.add_argument("--proxies", type=int, default=500_000)
+    memory_parser.add_argument("--hosts", type=int, default=1000)
+    memory_parser.add_argument("--pool-size", type=int, default=256, help="Proxies per host, 0 for all.")
+    memory_parser.add_argument(
+        "--user-agents", type=int, default=None, help="Distinct user agents. One per proxy by default."
+    )
+    memory_parser.add_argument("--validate", action="store_true", help="Validate the proxy urls.")
+
+    args = parser.parse_args(argv)
+    if args.command == "memory":
+        report = measure_proxy_memory(
+            proxies=args.proxies,
+            hosts=args.hosts,
+            pool_size=args.pool_size or None,
+            user_agents=args.user_agents,
+            validate=args.validate,
+        )
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        _print_comparison(compare(baseline, current))
+        return
+
+    report = run_suite(
+        scenarios=args.scenarios,
+        concurrency_levels=args.concurrency,
+        requests=args.requests,
+        proxies=args.proxies,
+        url=args.url,
+        http2=args.http2,
+        trace_memory=args.trace_memory,
+        isolate=not args.no_isolate,
+        origin_options={
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "rate_limit": args.rate_limit,
+            "retry_after": args.retry_after,
+            "body_size": args.body_size,
+            "cpu_rounds": args.cpu_rounds,
+            "seed": args.seed,
+        },
+        proxy_options={
+            "latency": args.proxy_latency,
+            "failure_rate": args.proxy_failure_rate,
+            "seed": args.seed,
+        },
+    )
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def _print_comparison(rows: list[dict]) -> None:
+    columns = ("throughput", "p50", "p99", "peak_rss_bytes")
+    print(f"{'scenario':<16}{'concurrency':>12}" + "".join(f"{column:>16}" for column in columns))
+    for row in rows:
+        changes = "".join(
+            f"{'n/a' if row[column] is None else f'{row[column]:+.1%}':>16}" for column in columns
+        )
+        print(f"{row['scenario']:<16}{row['concurrency']:>12}{changes}")
+
+
+if __name__ == "__main__":
+    main()
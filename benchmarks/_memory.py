@@ -0,0 +1,77 @@
+import gc
+import json
+import time
+import tracemalloc
+import typing
+
+from .._proxy import Proxy
+from .._proxy_registry import ProxyRegistry
+from .._webber import Webber
+
+
+def measure_proxy_memory(
+        proxies: int = 500_000,
+        hosts: int = 1000,
+        pool_size: int | None = 256,
+        user_agents: int | None = None,
+        validate: bool = False,
+) -> dict[str, typing.Any]:
+    """
+    Measure the Python heap used by a large proxy registry shared by many hosts, i.e. the proxies, the registry with
+    their health records and one pool per host.
+
+    :param proxies: The number of proxies.
+    :param hosts: The number of pools, as created for every host by a Webber.
+    :param pool_size: The number of proxies of each pool. Every pool gets all proxies if None.
+    :param user_agents: The number of distinct user agents the proxies are assigned, generated like Webber assigns
+                        them. Every proxy gets a user agent of its own if None, which is close to what Webber
+                        generates, but takes about 30 µs per proxy to set up.
+    :param validate: Whether to validate the proxy urls, instead of constructing the proxies as trusted.
+    :return: The memory in bytes after each step, and per proxy and host.
+    """
+    distinct = proxies if user_agents is None else min(user_agents, proxies)
+    # The user agents are serialized like in a ProxyStore, so the measured proxies hold strings of their own, as
+    # proxies loaded from a store do
+    user_agent_lines = [json.dumps(Webber._generate_user_agent()) for _ in range(distinct)]
+    make_proxy = Proxy if validate else Proxy.trusted
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        proxy_list = [
+            make_proxy(
+                f"http://10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}:8080", json.loads(user_agent_lines[i % distinct])
+            )
+            for i in range(proxies)
+        ]
+        construction_time = time.perf_counter() - start
+        proxies_bytes = tracemalloc.get_traced_memory()[0]
+
+        registry = ProxyRegistry(proxy_list, pool_size=pool_size)
+        registry_bytes = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        pools = [registry.pool() for _ in range(hosts)]
+        pools_time = time.perf_counter() - start
+        total_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del pools
+
+    return {
+        "proxies": proxies,
+        "hosts": hosts,
+        "pool_size": pool_size,
+        "user_agents": user_agents,
+        "validate": validate,
+        "proxies_bytes": proxies_bytes,
+        "registry_bytes": registry_bytes - proxies_bytes,
+        "pools_bytes": total_bytes - registry_bytes,
+        "total_bytes": total_bytes,
+        "peak_bytes": peak_bytes,
+        "bytes_per_proxy": registry_bytes / proxies,
+        "bytes_per_host": (total_bytes - registry_bytes) / hosts,
+        "construction_seconds": construction_time,
+        "pools_seconds": pools_time,
+    }
@@ -0,0 +1,322 @@
+import asyncio
+import concurrent.futures
+import dataclasses
+import datetime
+import functools
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import typing
+import httpx
+
+from collections import Counter
+
+from ._servers import OriginServer, ForwardProxy
+from .._client_manager import ClientManager
+from .._host_manager import HostManager
+from .._proxy import Proxy
+from .._rate_controller import RateController
+from .._sharding import ShardedWebber
+from .._webber import Webber
+
+#: The version of the report format. It is incremented whenever fields are renamed or change their meaning.
+REPORT_VERSION = 1
+
+SCENARIOS = ("client_manager", "host_manager", "webber", "sharded_webber")
+
+
+@dataclasses.dataclass(frozen=True)
+class RunConfig:
+    """
+    The configuration of a single benchmark run, i.e. one scenario at one concurrency level.
+
+    :param scenario: The component to drive, one of SCENARIOS.
+    :param concurrency: The number of requests in flight at once.
+    :param requests: The number of requests to send.
+    :param url: The url to request.
+    :param proxies: The urls of the proxies to route requests through.
+    :param http2: Whether to use HTTP/2.
+    :param rate: The fixed request rate in requests per second of the rate controllers. Rate control is effectively
+                 disabled, so the components run as fast as the proxies allow.
+    :param trace_memory: Whether to measure the peak Python heap with tracemalloc. This slows the run down.
+    :param workers: The number of worker processes of the sharded_webber scenario. Defaults to the number of CPU
+                    cores. The memory of the workers is not included in the result.
+    """
+
+    scenario: str
+    concurrency: int
+    requests: int
+    url: str
+    proxies: tuple[str, ...]
+    http2: bool = False
+    rate: float = 1000.0
+    trace_memory: bool = False
+    workers: int | None = None
+
+
+def run(config: RunConfig) -> dict[str, typing.Any]:
+    """
+    Run a benchmark in the current process.
+
+    :param config: The configuration of the run.
+    :return: The result of the run.
+    """
+    if config.scenario not in SCENARIOS:
+        raise ValueError(f"scenario must be one of {SCENARIOS}.")
+    elif config.concurrency < 1 or config.requests < 1:
+        raise ValueError("concurrency and requests must be positive integers.")
+
+    if config.trace_memory:
+        tracemalloc.start()
+    try:
+        result = asyncio.run(_drive(config))
+        if config.trace_memory:
+            result["memory"]["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if config.trace_memory:
+            tracemalloc.stop()
+
+    result["memory"]["peak_rss_bytes"] = _peak_rss()
+    return result
+
+
+def run_isolated(config: RunConfig) -> dict[str, typing.Any]:
+    """
+    Run a benchmark in a fresh process, so its memory usage isn't skewed by earlier runs or the stand-in servers.
+
+    :param config: The configuration of the run.
+    :return: The result of the run.
+    """
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run, config).result()
+
+
+def run_suite(
+        scenarios: typing.Iterable[str] = SCENARIOS,
+        concurrency_levels: typing.Iterable[int] = (1, 10, 100),
+        requests: int = 1000,
+        proxies: int = 50,
+        url: str | None = None,
+        http2: bool = False,
+        trace_memory: bool = False,
+        isolate: bool = True,
+        origin_options: dict[str, typing.Any] | None = None,
+        proxy_options: dict[str, typing.Any] | None = None,
+) -> dict[str, typing.Any]:
+    """
+    Start the stand-in servers and run every scenario at every concurrency level.
+
+    :param scenarios: The scenarios to run.
+    :param concurrency_levels: The concurrency levels to run each scenario at.
+    :param requests: The number of requests per run.
+    :param proxies: The number of stand-in proxies.
+    :param url: The url to request. A local OriginServer is started if None.
+    :param http2: Whether to use HTTP/2. The local servers only speak HTTP/1.1, so this only matters with url.
+    :param trace_memory: Whether to measure the peak Python heap with tracemalloc.
+    :param isolate: Whether to run every benchmark in a fresh process.
+    :param origin_options: Keyword arguments of the OriginServer.
+    :param proxy_options: Keyword arguments of the ForwardProxy.
+    :return: The report, see `compare` for comparing two reports.
+    """
+    origin = OriginServer(**(origin_options or {})) if url is None else None
+    forward_proxy = ForwardProxy(proxies, **(proxy_options or {}))
+    servers = [server for server in (origin, forward_proxy) if server is not None]
+
+    results = []
+    with _ServerThread(servers):
+        for scenario in scenarios:
+            for concurrency in concurrency_levels:
+                config = RunConfig(
+                    scenario=scenario,
+                    concurrency=concurrency,
+                    requests=requests,
+                    url=origin.url + "/" if url is None else url,
+                    proxies=tuple(forward_proxy.urls),
+                    http2=http2,
+                    trace_memory=trace_memory,
+                )
+                result = run_isolated(config) if isolate else run(config)
+                results.append({"scenario": scenario, "concurrency": concurrency, **result})
+
+    return {
+        "version": REPORT_VERSION,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "requests": requests,
+            "proxies": proxies,
+            "url": url,
+            "http2": http2,
+            "origin": origin_options or {},
+            "proxy": proxy_options or {},
+        },
+        "results": results,
+        "servers": {
+            "origin": dict(origin.stats) if origin is not None else None,
+            "proxy": dict(forward_proxy.stats),
+        },
+    }
+
+
+def compare(
+        baseline: dict[str, typing.Any],
+        current: dict[str, typing.Any],
+) -> list[dict[str, typing.Any]]:
+    """
+    Compare the results of two reports run by scenario and concurrency level.
+
+    :param baseline: The report to compare against, e.g. of the previous release.
+    :param current: The report to compare.
+    :return: One row per run found in both reports, with the relative change of throughput, latency percentiles and
+             peak memory. Positive changes mean the value increased.
+    """
+    baseline_results = {(result["scenario"], result["concurrency"]): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = result["scenario"], result["concurrency"]
+        if key not in baseline_results:
+            continue
+        old = baseline_results[key]
+        rows.append({
+            "scenario": key[0],
+            "concurrency": key[1],
+            "throughput": _change(old["throughput"], result["throughput"]),
+            "p50": _change(old["latency"]["p50"], result["latency"]["p50"]),
+            "p99": _change(old["latency"]["p99"], result["latency"]["p99"]),
+            "peak_rss_bytes": _change(old["memory"]["peak_rss_bytes"], result["memory"]["peak_rss_bytes"]),
+        })
+    return rows
+
+
+async def _drive(config: RunConfig) -> dict[str, typing.Any]:
+    proxies = [Proxy(url, {"User-Agent": "webber-benchmark"}) for url in config.proxies]
+    host = httpx.URL(config.url).host
+
+    if config.scenario == "client_manager":
+        component = ClientManager(proxies)
+        send = lambda url: component.request(url, {}, http2=config.http2)  # noqa: E731
+    elif config.scenario == "host_manager":
+        component = HostManager(host, proxies, _fixed_rate_controller(config.rate))
+        send = lambda url: component.get(url, {}, http2=config.http2)  # noqa: E731
+    elif config.scenario == "webber":
+        component = Webber(
+            ua_proxies={proxy.url: dict(proxy.user_agent) for proxy in proxies},
+            rate_controller_factory=functools.partial(_fixed_rate_controller, config.rate),
+        )
+        send = lambda url: component.get(url, {}, retries={}, http2=config.http2)  # noqa: E731
+    else:
+        component = ShardedWebber(
+            workers=config.workers,
+            ua_proxies={proxy.url: dict(proxy.user_agent) for proxy in proxies},
+            rate_controller_factory=functools.partial(_fixed_rate_controller, config.rate),
+        )
+        await component.start()
+        send = lambda url: component.get(url, {}, retries={}, http2=config.http2)  # noqa: E731
+
+    latencies = []
+    status_codes = Counter()
+    errors = Counter()
+    remaining = iter(range(config.requests))
+
+    async def worker() -> None:
+        # Every request gets its own url, so identical concurrent requests aren't coalesced
+        for i in remaining:
+            url = str(httpx.URL(config.url).copy_merge_params({"benchmark_request": i}))
+            start = time.perf_counter()
+            try:
+                response = await send(url)
+            except httpx.HTTPStatusError as e:
+                status_codes[e.response.status_code] += 1
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            else:
+                status_codes[response.status_code] += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+    duration = time.perf_counter() - start
+    await component.aclose()
+
+    latencies.sort()
+    return {
+        "requests": config.requests,
+        "succeeded": sum(count for status_code, count in status_codes.items() if status_code < 400),
+        "status_codes": {str(status_code): count for status_code, count in sorted(status_codes.items())},
+        "errors": dict(errors),
+        "duration": duration,
+        "throughput": config.requests / duration,
+        "latency": {
+            "mean": sum(latencies) / len(latencies),
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "max": latencies[-1],
+        },
+        "memory": {"peak_rss_bytes": None, "tracemalloc_peak_bytes": None},
+    }
+
+
+def _fixed_rate_controller(rate: float, host: str | None = None) -> RateController:
+    return RateController(rate=rate, min_rate=rate, max_rate=rate, concurrency=50, max_concurrency=50)
+
+
+def _percentile(sorted_values: list[float], percentile: float) -> float:
+    # Nearest-rank percentile, so the value is always one that was actually measured
+    index = max(round(percentile / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def _change(old: float | None, new: float | None) -> float | None:
+    if not old or new is None:
+        return None
+    return (new - old) / old
+
+
+def _peak_rss() -> int:
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class _ServerThread:
+    """Runs servers on an event loop in a background thread, so they don't compete with the benchmarked loop."""
+
+    def __init__(self, servers: list[OriginServer | ForwardProxy]):
+        self._servers = servers
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+
+    def __enter__(self) -> "_ServerThread":
+        self._thread.start()
+        for server in self._servers:
+            asyncio.run_coroutine_threadsafe(server.start(), self._loop).result()
+        return self
+
+    def __exit__(self, *args) -> None:
+        for server in self._servers:
+            asyncio.run_coroutine_threadsafe(server.aclose(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
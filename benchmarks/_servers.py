@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import random
+import time
+import typing
+
+from collections import Counter
+
+
+class _HttpServer:
+    """
+    A minimal HTTP/1.1 server on top of asyncio streams. Subclasses implement `_handle` to answer requests.
+
+    :param host: The address to listen on.
+    :param ports: The number of ports to listen on. Each port is bound to a free port chosen by the OS.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", ports: int = 1):
+        if ports < 1:
+            raise ValueError("ports must be a positive integer.")
+        self.host = host
+        self.num_ports = ports
+        self.stats = Counter()
+        self._servers = []
+        self._connections = {}
+
+    @property
+    def ports(self) -> list[int]:
+        return [server.sockets[0].getsockname()[1] for server in self._servers]
+
+    @property
+    def urls(self) -> list[str]:
+        return [f"http://{self.host}:{port}" for port in self.ports]
+
+    @property
+    def url(self) -> str:
+        return self.urls[0]
+
+    async def start(self) -> None:
+        for _ in range(self.num_ports):
+            self._servers.append(await asyncio.start_server(self._serve, self.host, 0))
+
+    async def aclose(self) -> None:
+        for server in self._servers:
+            server.close()
+        for writer in self._connections:
+            writer.close()
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        for server in self._servers:
+            await server.wait_closed()
+        self._servers.clear()
+
+    async def __aenter__(self) -> typing.Self:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                head = await _read_head(reader)
+                if head is None:
+                    break
+                request_line, headers = head
+                keep_alive = await self._handle(request_line, headers, reader, writer)
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _handle(
+            self,
+            request_line: str,
+            headers: dict[str, str],
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> bool:
+        raise NotImplementedError
+
+
+class OriginServer(_HttpServer):
+    """
+    A stand-in for the hosts webber scrapes. Every GET request is answered after a configurable latency with a
+    fixed-size body, a server error or a 429 response.
+
+    :param latency: The mean number of seconds the server waits before responding.
+    :param jitter: The maximum number of seconds the latency randomly deviates from its mean, in either direction.
+    :param error_rate: The fraction of requests that are answered with a 500 status code.
+    :param rate_limit: The maximum number of requests per second the server answers. Requests beyond the limit are
+                       answered with a 429 status code and a Retry-After header. Unlimited if None.
+    :param retry_after: The value of the Retry-After header of 429 responses in seconds.
+    :param body_size: The size of successful response bodies in bytes.
+    :param cpu_rounds: The number of SHA-256 rounds computed per request to simulate a CPU-bound endpoint, like
+                       server/app.py does.
+    :param seed: The seed of the random number generator, so runs are reproducible.
+    :param host: The address to listen on.
+    """
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            rate_limit: float | None = None,
+            retry_after: float = 1.0,
+            body_size: int = 1024,
+            cpu_rounds: int = 0,
+            seed: int | None = None,
+            host: str = "127.0.0.1",
+    ):
+        if latency < 0 or jitter < 0:
+            raise ValueError("latency and jitter must not be negative.")
+        elif not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1.")
+        elif rate_limit is not None and rate_limit <= 0:
+            raise ValueError("rate_limit must be positive.")
+
+        super().__init__(host)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.body = b"x" * body_size
+        self.cpu_rounds = cpu_rounds
+        self._random = random.Random(seed)
+        self._window = 0
+        self._window_requests = 0
+
+    async def _handle(
+            self,
+            request_line: str,
+            headers: dict[str, str],
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> bool:
+        self.stats["requests"] += 1
+        await _discard_body(headers, reader)
+        delay = max(self.latency + self._random.uniform(-self.jitter, self.jitter), 0)
+        if delay:
+            await asyncio.sleep(delay)
+        for _ in range(self.cpu_rounds):
+            hashlib.sha256(self.body).digest()
+
+        if self._is_rate_limited():
+            self.stats["rate_limited"] += 1
+            writer.write(_response(429, b"", {"Retry-After": f"{self.retry_after:g}"}))
+        elif self._random.random() < self.error_rate:
+            self.stats["errors"] += 1
+            writer.write(_response(500, b""))
+        else:
+            writer.write(_response(200, self.body, {"Content-Type": "application/octet-stream"}))
+        await writer.drain()
+        return True
+
+    def _is_rate_limited(self) -> bool:
+        if self.rate_limit is None:
+            return False
+        window = int(time.monotonic())
+        if window != self._window:
+            self._window = window
+            self._window_requests = 0
+        self._window_requests += 1
+        return self._window_requests > self.rate_limit
+
+
+class ForwardProxy(_HttpServer):
+    """
+    A stand-in for the forward proxies webber routes requests through. Plain HTTP requests in absolute form are
+    forwarded to their origin and CONNECT requests are tunnelled. Every port behaves as a separate proxy.
+
+    :param ports: The number of proxies, i.e. the number of ports to listen on.
+    :param latency: The number of seconds the proxy waits before forwarding a request or opening a tunnel.
+    :param failure_rate: The fraction of requests that are answered with a 502 status code instead of forwarded.
+    :param seed: The seed of the random number generator, so runs are reproducible.
+    :param host: The address to listen on.
+    """
+
+    def __init__(
+            self,
+            ports: int = 1,
+            latency: float = 0.0,
+            failure_rate: float = 0.0,
+            seed: int | None = None,
+            host: str = "127.0.0.1",
+    ):
+        if latency < 0:
+            raise ValueError("latency must not be negative.")
+        elif not 0 <= failure_rate <= 1:
+            raise ValueError("failure_rate must be between 0 and 1.")
+
+        super().__init__(host, ports)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._upstreams = {}
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Upstream connections belong to the client connection they were opened for, so they are reused for as long
+        # as the client keeps its connection alive.
+        try:
+            await super()._serve(reader, writer)
+        finally:
+            for upstream_reader, upstream_writer in self._upstreams.pop(writer, {}).values():
+                upstream_writer.close()
+
+    async def _handle(
+            self,
+            request_line: str,
+            headers: dict[str, str],
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+    ) -> bool:
+        self.stats["requests"] += 1
+        method, target, version = request_line.split(" ", 2)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            self.stats["failures"] += 1
+            await _discard_body(headers, reader)
+            writer.write(_response(502, b""))
+            await writer.drain()
+            return True
+
+        if method == "CONNECT":
+            await self._tunnel(target, reader, writer)
+            return False
+
+        if not target.startswith("http://"):
+            writer.write(_response(400, b"absolute-form request target expected"))
+            await writer.drain()
+            return False
+
+        authority, _, path = target.removeprefix("http://").partition("/")
+        upstreams = self._upstreams.setdefault(writer, {})
+        if authority not in upstreams:
+            try:
+                upstreams[authority] = await asyncio.open_connection(*_split_authority(authority, 80))
+            except OSError:
+                self.stats["failures"] += 1
+                await _discard_body(headers, reader)
+                writer.write(_response(502, b""))
+                await writer.drain()
+                return True
+        upstream_reader, upstream_writer = upstreams[authority]
+
+        upstream_writer.write(f"{method} /{path} {version}\r\n".encode())
+        upstream_writer.write(
+            "".join(f"{name}: {value}\r\n" for name, value in headers.items() if name != "proxy-connection").encode()
+        )
+        upstream_writer.write(b"\r\n")
+        await _relay_body(headers, reader, upstream_writer)
+
+        head = await _read_head(upstream_reader)
+        if head is None:
+            raise ConnectionError("upstream closed the connection.")
+        status_line, response_headers = head
+        writer.write(f"{status_line}\r\n".encode())
+        writer.write("".join(f"{name}: {value}\r\n" for name, value in response_headers.items()).encode())
+        writer.write(b"\r\n")
+        await _relay_body(response_headers, upstream_reader, writer)
+        return True
+
+    async def _tunnel(self, target: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        upstream_reader, upstream_writer = await asyncio.open_connection(*_split_authority(target, 443))
+        writer.write(b"HTTP/1.1 200 Connection established\r\n\r\n")
+        await writer.drain()
+
+        async def pipe(source: asyncio.StreamReader, sink: asyncio.StreamWriter) -> None:
+            try:
+                while data := await source.read(65536):
+                    sink.write(data)
+                    await sink.drain()
+            except ConnectionError:
+                pass
+            finally:
+                sink.close()
+
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple[str, dict[str, str]] | None:
+    try:
+        data = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise e
+        return None
+
+    first_line, *header_lines = data.decode("latin-1").rstrip("\r\n").split("\r\n")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return first_line, headers
+
+
+async def _discard_body(headers: dict[str, str], reader: asyncio.StreamReader) -> None:
+    length = int(headers.get("content-length", 0))
+    if length:
+        await reader.readexactly(length)
+
+
+async def _relay_body(headers: dict[str, str], reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    length = int(headers.get("content-length", 0))
+    while length:
+        chunk = await reader.read(min(length, 65536))
+        if not chunk:
+            raise ConnectionError("connection closed before the body was complete.")
+        writer.write(chunk)
+        length -= len(chunk)
+    await writer.drain()
+
+
+def _response(status_code: int, body: bytes, headers: dict[str, str] | None = None) -> bytes:
+    lines = [f"HTTP/1.1 {status_code} {_REASONS.get(status_code, '')}", f"Content-Length: {len(body)}"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+def _split_authority(authority: str, default_port: int) -> tuple[str, int]:
+    host, _, port = authority.rpartition(":")
+    if not host or not port.isdigit():
+        return authority, default_port
+    return host.strip("[]"), int(port)
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway"}
@@ -0,0 +1,89 @@
+import httpx
+import pytest
+
+from ..benchmarks import OriginServer, ForwardProxy, RunConfig, compare, measure_proxy_memory, run, run_suite
+
+
+@pytest.mark.asyncio
+async def test_origin_server_errors_and_rate_limits():
+    async with OriginServer(body_size=10, rate_limit=1, retry_after=5) as origin:
+        async with httpx.AsyncClient() as client:
+            responses = [await client.get(origin.url) for _ in range(3)]
+    assert responses[0].status_code == 200
+    rate_limited = [response for response in responses if response.status_code == 429]
+    assert len(rate_limited) == origin.stats["rate_limited"] >= 1
+    assert rate_limited[0].headers["Retry-After"] == "5"
+    assert responses[0].content == b"x" * 10
+
+    async with OriginServer(error_rate=1) as origin:
+        async with httpx.AsyncClient() as client:
+            assert (await client.get(origin.url)).status_code == 500
+    assert origin.stats == {"requests": 1, "errors": 1}
+
+
+@pytest.mark.asyncio
+async def test_forward_proxy_forwards_requests():
+    async with OriginServer() as origin, ForwardProxy(ports=2) as forward_proxy:
+        assert len(set(forward_proxy.urls)) == 2
+        for proxy_url in forward_proxy.urls:
+            async with httpx.AsyncClient(proxy=proxy_url) as client:
+                for _ in range(2):
+                    assert (await client.get(origin.url)).status_code == 200
+    assert origin.stats["requests"] == forward_proxy.stats["requests"] == 4
+
+
+@pytest.mark.asyncio
+async def test_forward_proxy_failures():
+    async with OriginServer() as origin, ForwardProxy(failure_rate=1) as forward_proxy:
+        async with httpx.AsyncClient(proxy=forward_proxy.url) as client:
+            assert (await client.get(origin.url)).status_code == 502
+    assert origin.stats["requests"] == 0
+
+
+@pytest.mark.parametrize("scenario", ["client_manager", "host_manager", "webber"])
+def test_run_suite_reports_every_run(scenario):
+    report = run_suite([scenario], [1, 2], requests=4, proxies=4, isolate=False, origin_options={"latency": 0})
+    assert [(result["scenario"], result["concurrency"]) for result in report["results"]] == [
+        (scenario, 1), (scenario, 2)
+    ]
+    for result in report["results"]:
+        assert result["succeeded"] == 4
+        assert result["status_codes"] == {"200": 4}
+        assert result["throughput"] > 0
+        assert 0 < result["latency"]["p50"] <= result["latency"]["p99"] <= result["latency"]["max"]
+        assert result["memory"]["peak_rss_bytes"] > 0
+    assert report["servers"]["origin"]["requests"] == 8
+
+
+def test_run_rejects_unknown_scenarios():
+    with pytest.raises(ValueError):
+        run(RunConfig("foo", 1, 1, "http://127.0.0.1", ()))
+
+
+def test_compare():
+    def report(throughput, p99):
+        return {"results": [{
+            "scenario": "webber",
+            "concurrency": 10,
+            "throughput": throughput,
+            "latency": {"p50": 0.1, "p99": p99},
+            "memory": {"peak_rss_bytes": None},
+        }]}
+
+    assert compare(report(100, 0.5), report(150, 0.25)) == [{
+        "scenario": "webber",
+        "concurrency": 10,
+        "throughput": 0.5,
+        "p50": 0.0,
+        "p99": -0.5,
+        "peak_rss_bytes": None,
+    }]
+    assert compare(report(100, 0.5), {"results": []}) == []
+
+
+def test_measure_proxy_memory():
+    report = measure_proxy_memory(proxies=1000, hosts=10, pool_size=100)
+    assert report["proxies"] == 1000 and report["hosts"] == 10
+    assert report["total_bytes"] == report["proxies_bytes"] + report["registry_bytes"] + report["pools_bytes"]
+    # A pool only holds its slice of the proxies
+    assert report["bytes_per_host"] < report["bytes_per_proxy"] * 1000
@@ -0,0 +1,150 @@
+import json
+import time
+
+import httpx
+import pytest
+import respx
+
+from .._cache import ResponseCache
+from .._webber import Webber
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"))
+    yield cache
+    cache.close()
+
+
+def response(status_code=200, content=b"foo", **headers):
+    headers = {name.replace("_", "-"): value for name, value in headers.items()}
+    return httpx.Response(status_code, headers=headers, content=content)
+
+
+def test_put_and_get(cache, url):
+    cache.put(url, {}, response(etag='"1"', last_modified="Wed, 21 Oct 2015 07:28:00 GMT"))
+    entry = cache.get(url, {})
+    assert entry.content == b"foo"
+    assert entry.etag == '"1"'
+    assert entry.validators() == {"If-None-Match": '"1"', "If-Modified-Since": "Wed, 21 Oct 2015 07:28:00 GMT"}
+    assert not entry.is_fresh()
+    assert entry.to_response().content == b"foo"
+    assert entry.to_response().extensions["from_cache"]
+    assert cache.get(url + "/bar", {}) is None
+    assert cache.get(url, {"Accept-Language": "de"}) is None
+    assert len(cache) == 1
+
+
+def test_persists_across_instances(cache, url):
+    cache.put(url, {}, response())
+    assert ResponseCache(cache.path).get(url).content == b"foo"
+
+
+@pytest.mark.parametrize("headers, status_code", [
+    ({"cache_control": "no-store"}, 200),
+    ({"vary": "*"}, 200),
+    ({}, 500),
+])
+def test_uncacheable_responses(cache, url, headers, status_code):
+    cache.put(url, {}, response(status_code, **headers))
+    assert cache.get(url, {}) is None
+
+
+def test_vary(cache, url):
+    cache.put(url, {"X-Foo": "1"}, response(vary="X-Foo"))
+    assert cache.get(url, {"X-Foo": "1"})
+    assert cache.get(url, {"X-Foo": "2"}) is None
+    assert cache.get(url, {}) is None
+
+
+@pytest.mark.parametrize("headers, fresh", [
+    ({"cache_control": "max-age=60"}, True),
+    ({"cache_control": "max-age=60", "age": "100"}, False),
+    ({"cache_control": "no-cache, max-age=60"}, False),
+    ({"expires": "Wed, 21 Oct 2015 07:28:00 GMT"}, False),
+    ({"expires": "Wed, 21 Oct 2099 07:28:00 GMT"}, True),
+    ({}, False),
+])
+def test_freshness(cache, url, headers, fresh):
+    assert cache.put(url, {}, response(**headers)).is_fresh() is fresh
+
+
+def test_refresh_restarts_freshness_and_updates_headers(cache, url):
+    entry = cache.put(url, {}, response(etag='"1"', x_foo="bar"))
+    entry = cache.refresh(entry, {}, response(304, b"", etag='"1"', cache_control="max-age=60", x_foo="baz"))
+    assert entry.is_fresh()
+    assert cache.get(url, {}).is_fresh()
+    assert entry.to_response().headers["X-Foo"] == "baz"
+    assert entry.content == b"foo"
+
+
+def test_evicts_least_recently_used_responses(tmp_path, url):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size=10)
+    for i in range(3):
+        cache.put(f"{url}/{i}", {}, response(content=b"x" * 4))
+        time.sleep(0.01)
+    assert cache.get(f"{url}/0", {}) is None
+    assert cache.size == 8
+
+    cache.get(f"{url}/1", {})
+    cache.put(f"{url}/3", {}, response(content=b"x" * 4))
+    assert cache.get(f"{url}/1", {})
+    assert cache.get(f"{url}/2", {}) is None
+
+
+def test_total_size_is_tracked_incrementally(cache, url):
+    cache.put(url, {}, response(content=b"x" * 4))
+    cache.put(url, {}, response(content=b"x" * 6))
+    cache.put(url + "/1", {}, response(content=b"x" * 3))
+    assert cache.size == 9
+    cache.delete(url, {})
+    assert cache.size == 3
+    assert ResponseCache(cache.path).size == 3
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_evicts_old_responses(tmp_path, url, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_age=60)
+    cache.put(url, {}, response())
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 61)
+    assert cache.get(url, {}) is None
+    assert len(cache) == 0
+
+
+@pytest.fixture
+def webber(tmp_path, cache):
+    path = tmp_path / "proxies.json"
+    path.write_text(json.dumps({f"https://proxy{i}.com": {} for i in range(3)}))
+    return Webber(ua_proxies_path=str(path), cache=cache)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_serves_fresh_responses_from_cache(webber, url):
+    route = respx.get(url).respond(200, content=b"foo", headers={"Cache-Control": "max-age=60"})
+    assert (await webber.get(url, {})).content == b"foo"
+    response = await webber.get(url, {})
+    assert response.content == b"foo"
+    assert response.extensions["from_cache"]
+    assert route.call_count == 1
+    assert len(webber._hosts) == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_revalidates_stale_responses(webber, url):
+    route = respx.get(url).mock(side_effect=[
+        httpx.Response(200, content=b"foo", headers={"ETag": '"1"'}),
+        httpx.Response(304, headers={"ETag": '"1"'}),
+        httpx.Response(200, content=b"bar", headers={"ETag": '"2"'}),
+    ])
+    await webber.get(url, {})
+    response = await webber.get(url, {})
+    assert route.calls[1].request.headers["If-None-Match"] == '"1"'
+    assert response.status_code == 200
+    assert response.content == b"foo"
+
+    assert (await webber.get(url, {})).content == b"bar"
+    assert webber.cache.get(url, {}).etag == '"2"'
@@ -0,0 +1,56 @@
+import httpx
+import pytest
+
+from .._client import Client
+from .._proxy import Proxy
+
+USER_AGENT = {"User-Agent": "foo", "Sec-Ch-Ua-Mobile": "?0"}
+
+
+@pytest.fixture
+def client():
+    return Client(proxy=Proxy("https://proxy0.com", USER_AGENT))
+
+
+def test_build_request_reuses_template(client):
+    request0 = client.build_request("GET", "https://example.com")
+    request1 = client.build_request("GET", "https://example.com")
+    assert request0.headers["User-Agent"] == "foo"
+    assert request0.extensions["timeout"] == client.timeout.as_dict()
+    assert request0.extensions is not request1.extensions
+    assert client._template is not None
+    template = client._template
+    client.build_request("GET", "https://example.com")
+    assert client._template is template
+
+    # Requests get copies of the template headers
+    request0.headers["User-Agent"] = "bar"
+    assert client.build_request("GET", "https://example.com").headers["User-Agent"] == "foo"
+
+
+def test_build_request_merges_arguments(client):
+    request = client.build_request(
+        "GET", "https://example.com", headers={"User-Agent": "bar", "X-Foo": "foo"}, timeout=1,
+        extensions={"foo": "bar"}
+    )
+    # The proxy's user agent takes precedence
+    assert request.headers["User-Agent"] == "foo"
+    assert request.headers["X-Foo"] == "foo"
+    assert request.extensions == {"foo": "bar", "timeout": httpx.Timeout(1).as_dict()}
+    assert "X-Foo" not in client.build_request("GET", "https://example.com").headers
+
+
+def test_template_is_recomputed(client):
+    client.build_request("GET", "https://example.com")
+    client.headers = {"X-Foo": "foo"}
+    client.timeout = 1
+    request = client.build_request("GET", "https://example.com")
+    assert request.headers["X-Foo"] == "foo"
+    assert request.headers["User-Agent"] == "foo"
+    assert request.extensions["timeout"] == httpx.Timeout(1).as_dict()
+
+    proxy = Proxy("https://proxy1.com")
+    client = Client(proxy=proxy)
+    assert client.build_request("GET", "https://example.com").headers["User-Agent"].startswith("python-httpx")
+    proxy.assign_user_agent(USER_AGENT)
+    assert client.build_request("GET", "https://example.com").headers["User-Agent"] == "foo"
@@ -1,15 +1,24 @@
 import asyncio
+import heapq
+import signal
+import time
 import httpx
 import pytest
 import respx
 from httpx import HTTPStatusError
 
-from .test_utils import raise_for_status_hook
+from .test_utils import raise_for_status_hook, HTTP2_EXTENSIONS
 from .._client_manager import ClientManager
 from .._proxy import Proxy
 from .._exceptions import AdjustmentError
 
 
+async def wait_until_ready(client_manager):
+    # Sleep until every queued client may be reused
+    ready_at = max((entry[0] for heap in client_manager._ready_clients.values() for entry in heap), default=0)
+    await asyncio.sleep(max(ready_at - time.time(), 0) + 0.1)
+
+
 @pytest.mark.parametrize("min_client_requests, max_client_requests", [(1, 1), (1, 2), (10, 1000)])
 def test_valid_initialization(min_client_requests, max_client_requests, proxies_3):
     client_manager = ClientManager(proxies_3, min_client_requests, max_client_requests)
@@ -66,7 +75,7 @@ async def test_reuses_clients_if_not_on_timeout(proxies_3, url):
     respx.get().respond(200)
     client_manager = ClientManager(proxies_3, 10, 10)
     await client_manager.request(url, {})
-    await asyncio.sleep(ClientManager._calc_wait_time(next(iter(client_manager._clients))) + 0.1)
+    await wait_until_ready(client_manager)
     await client_manager.request(url, {})
     assert len(client_manager._clients) == 1
 
@@ -74,10 +83,10 @@ async def test_reuses_clients_if_not_on_timeout(proxies_3, url):
 @respx.mock
 @pytest.mark.asyncio
 async def test_creates_new_clients_if_different_http_version(proxies_3, url):
-    respx.get().respond(200)
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
     client_manager = ClientManager(proxies_3, 10, 10)
     await client_manager.request(url, {})
-    await asyncio.sleep(ClientManager._calc_wait_time(next(iter(client_manager._clients))) + 0.1)
+    await wait_until_ready(client_manager)
     await client_manager.request(url, {}, http2=False)
     assert len(client_manager._clients) == 2
 
@@ -109,7 +118,7 @@ async def test_429_reduces_max_client_requests_and_closes_clients(url, proxies_3
         await client_manager.request(url, {}, event_hooks=event_hooks)
     except HTTPStatusError:
         pass
-    await asyncio.sleep(ClientManager._calc_wait_time(next(iter(client_manager._clients))) + 0.1)
+    await wait_until_ready(client_manager)
 
     # Reuse the first client and create 2 more
     for _ in range(3):
@@ -129,7 +138,7 @@ async def test_429_reduces_max_client_requests_and_closes_clients(url, proxies_3
     client_manager.min_client_requests = 2
 
     # Wait so me don't create a new client
-    await asyncio.sleep(ClientManager._calc_wait_time(next(iter(client_manager._clients))) + 0.1)
+    await wait_until_ready(client_manager)
 
     # The first client we created has made two clients, the next one will be unsuccessful, so max_client_requests,
     # should be reduced to 2 after the request has been made
@@ -155,3 +164,245 @@ async def test_429_handling_raises_adjustment_error_if_max_client_requests_falls
             await client_manager.request(url, {}, event_hooks=event_hooks)
         except HTTPStatusError:
             pass
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_stream_keeps_client_leased_until_closed(proxies_3, url):
+    respx.get().respond(200, content=b"foo" * 1000)
+    client_manager = ClientManager(proxies_3, 1, 1)
+    async with client_manager.stream(url, {}) as response:
+        proxy = next(iter(client_manager.proxy_pool._proxies_in_use))
+        assert len(client_manager.proxy_pool._proxies_in_use) == 1
+        assert not client_manager._clients
+        assert b"".join([chunk async for chunk in response.aiter_bytes()]) == b"foo" * 1000
+        assert len(client_manager.proxy_pool._proxies_in_use) == 1
+    assert not client_manager.proxy_pool._proxies_in_use
+    assert proxy in client_manager.proxy_pool
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_stream_closes_client_on_error_status(proxies_3, url):
+    respx.get().respond(500)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    async with client_manager.stream(url, {}) as response:
+        assert response.status_code == 500
+    assert not client_manager._clients
+    assert not client_manager.proxy_pool._proxies_in_use
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_reuses_any_ready_client_before_creating_new_ones(proxies_3, url):
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    async with asyncio.TaskGroup() as group:
+        for _ in range(3):
+            group.create_task(client_manager.request(url, {}))
+    clients = list(client_manager._clients)
+
+    # Only the last client becomes ready, the head of _clients is still on timeout
+    ready_clients = [entry for entry in client_manager._ready_clients[True] if entry[2] is not clients[-1]]
+    ready_clients.append((0, -1, clients[-1]))
+    heapq.heapify(ready_clients)
+    client_manager._ready_clients[True] = ready_clients
+    await client_manager.request(url, {})
+    assert list(client_manager._clients) == clients
+    assert client_manager._clients[clients[-1]]["requests_left"] == 8
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_429_closes_idle_removed_clients(url, proxies_3):
+    respx.get().respond(200)
+    client_manager = ClientManager(proxies_3, 3, 3)
+    async with asyncio.TaskGroup() as group:
+        for _ in range(3):
+            group.create_task(client_manager.request(url, {}))
+    clients = list(client_manager._clients)
+    await wait_until_ready(client_manager)
+
+    respx.get().respond(429)
+    client_manager.max_client_requests = 4
+    client_manager.min_client_requests = 2
+    client_manager._clients[clients[0]] = {"requests_allowed": 4, "requests_left": 2}
+    await client_manager.request(url, {})
+    assert not client_manager._clients
+    assert all(client.is_closed for client in clients)
+    assert not client_manager.proxy_pool._proxies_in_use
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_waits_for_next_ready_client_when_idle_clients_hold_all_proxies(proxies_3, url):
+    respx.get().respond(200)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    client_manager.client_delay = 0.2
+    for _ in range(3):
+        await client_manager.request(url, {})
+    clients = list(client_manager._clients)
+
+    await asyncio.wait_for(client_manager.request(url, {}), 1)
+    assert list(client_manager._clients) == clients
+    assert client_manager._clients[clients[0]]["requests_left"] == 8
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_aclose_drains_requests_and_closes_clients(proxies_3, url):
+    async def respond(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, extensions=HTTP2_EXTENSIONS)
+
+    respx.get().mock(side_effect=respond)
+    sigint_handler = signal.getsignal(signal.SIGINT)
+    client_manager = ClientManager(proxies_3)
+    assert signal.getsignal(signal.SIGINT) is sigint_handler
+
+    requests = [asyncio.create_task(client_manager.request(url, {})) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    clients = set(client_manager._open_clients)
+    await client_manager.aclose()
+    assert all(request.result().status_code == 200 for request in requests)
+    assert all(client.is_closed for client in clients)
+    assert len(client_manager.transport_pool) == 0
+    assert len(client_manager.proxy_pool.proxies_remaining) == 3
+    with pytest.raises(RuntimeError):
+        await client_manager.request(url, {})
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_aclose_stops_waiting_after_timeout(proxies_3, url):
+    async def respond(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, extensions=HTTP2_EXTENSIONS)
+
+    respx.get().mock(side_effect=respond)
+    client_manager = ClientManager(proxies_3)
+    request = asyncio.create_task(client_manager.request(url, {}))
+    await asyncio.sleep(0.01)
+    start = asyncio.get_running_loop().time()
+    await client_manager.aclose(timeout=0.01)
+    assert asyncio.get_running_loop().time() - start < 1
+    assert client_manager.closed
+    request.cancel()
+    await asyncio.gather(request, return_exceptions=True)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_ready_clients_of_the_other_protocol_are_ignored(proxies_3, url):
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    client_manager.client_delay = 0
+    await client_manager.request(url, {}, http2=False)
+    http1_client = next(iter(client_manager._clients))
+    # The HTTP/1.1 client is ready, but an HTTP/2 request needs a client of its own, which it then reuses
+    await client_manager.request(url, {}, http2=True)
+    http2_client = next(client for client in client_manager._clients if client is not http1_client)
+    await client_manager.request(url, {}, http2=True)
+    assert len(client_manager._clients) == 2
+    assert client_manager._clients[http2_client]["requests_left"] == 8
+    assert client_manager._clients[http1_client]["requests_left"] == 9
+
+
+async def _slow_response(request):
+    await asyncio.sleep(0.1)
+    return httpx.Response(200, extensions=HTTP2_EXTENSIONS)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_http2_requests_are_multiplexed_up_to_max_streams(proxies_3, url, monkeypatch):
+    respx.get().mock(side_effect=_slow_response)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    monkeypatch.setattr(client_manager.transport_pool, "max_streams", lambda proxy: 4)
+    async with asyncio.TaskGroup() as group:
+        for _ in range(8):
+            group.create_task(client_manager.request(url, {}))
+    # Each client carries up to 4 requests at once over its connection
+    assert len(client_manager._clients) == 2
+    assert all(client_data["requests_left"] == 6 for client_data in client_manager._clients.values())
+    assert not client_manager._requests_in_flight
+    assert len(client_manager._ready_clients[True]) == 2
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_http2_requests_are_not_multiplexed_before_the_stream_limit_is_known(proxies_3, url):
+    respx.get().mock(side_effect=_slow_response)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    # Without an established connection the stream limit is unknown, so every request leases a proxy
+    async with asyncio.TaskGroup() as group:
+        for _ in range(3):
+            group.create_task(client_manager.request(url, {}))
+    assert len(client_manager._clients) == 3
+    assert all(client_data["requests_left"] == 9 for client_data in client_manager._clients.values())
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_http2_requests_use_http1_clients_once_the_host_negotiated_http1(proxies_3, url):
+    respx.get().respond(200)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    client_manager.client_delay = 0
+    assert client_manager.negotiated_http2 is None
+    await client_manager.request(url, {}, http2=None)
+    assert client_manager.negotiated_http2 is False
+    # The HTTP/2 client fell back to HTTP/1.1 and is reused for every request instead of being rotated out
+    client = next(iter(client_manager._clients))
+    assert client.http2
+    await client_manager.request(url, {}, http2=False)
+    await client_manager.request(url, {}, http2=True)
+    assert list(client_manager._clients) == [client]
+    assert client_manager._clients[client]["requests_left"] == 7
+    assert not client_manager._ready_clients[True]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_negotiated_http2_is_recorded(proxies_3, url):
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    await client_manager.request(url, {}, http2=False)
+    assert client_manager.negotiated_http2 is None
+    await client_manager.request(url, {})
+    assert client_manager.negotiated_http2 is True
+
+
+@respx.mock
+@pytest.mark.asyncio
+@pytest.mark.parametrize("headers", [{}, {"Accept": "text/html"}, {"Accept": "text/html", "User-Agent": "ignored"}])
+async def test_request_sends_request_headers_and_proxy_user_agent(url, headers):
+    route = respx.get().respond(200)
+    user_agent = {"User-Agent": "agent", "Sec-CH-UA-Mobile": "?0"}
+    client_manager = ClientManager([Proxy("https://proxy.com", user_agent)], 10, 10)
+    await client_manager.request(url, headers)
+    await client_manager.request(url, headers)
+    for call in route.calls:
+        sent = call.request.headers
+        assert sent["User-Agent"] == "agent"
+        assert sent["Sec-CH-UA-Mobile"] == "?0"
+        assert sent["Accept"] == headers.get("Accept", "*/*")
+        assert len(sent.get_list("User-Agent")) == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+@pytest.mark.parametrize("http2", [False, True])
+async def test_retires_ready_clients_of_the_other_protocol_when_they_hold_all_proxies(proxies_3, url, http2):
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
+    client_manager = ClientManager(proxies_3, 10, 10)
+    client_manager.client_delay = 0.2
+    async with asyncio.TaskGroup() as group:
+        for _ in range(3):
+            group.create_task(client_manager.request(url, {}, http2=not http2))
+    other_clients = set(client_manager._clients)
+
+    await asyncio.wait_for(client_manager.request(url, {}, http2=http2), 1)
+    clients = set(client_manager._clients)
+    assert len(clients) == 3
+    assert len(clients - other_clients) == 1
+    assert all(client.http2 is not http2 for client in clients & other_clients)
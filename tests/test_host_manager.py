@@ -0,0 +1,118 @@
+import asyncio
+
+import httpx
+import pytest
+import respx
+
+from .._host_manager import HostManager, Priority
+from .._rate_controller import RateController
+
+
+def serial_host_manager(proxies, aging=5.0):
+    rate_controller = RateController(rate=100, max_rate=100, concurrency=1, max_concurrency=1)
+    return HostManager("example.com", proxies, rate_controller, aging=aging)
+
+
+async def send_in_order(host_manager, priorities, delay=0.0):
+    order = []
+
+    async def respond(request):
+        order.append(request.url.path)
+        await asyncio.sleep(0.01)
+        return httpx.Response(200)
+
+    respx.get().mock(side_effect=respond)
+    tasks = [asyncio.create_task(host_manager.get("https://example.com/first", {}))]
+    await asyncio.sleep(0)
+    for i, priority in enumerate(priorities):
+        tasks.append(asyncio.create_task(host_manager.get(f"https://example.com/{i}", {}, priority=priority)))
+        await asyncio.sleep(delay)
+    await asyncio.gather(*tasks)
+    return order[1:]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_higher_priorities_are_sent_first(proxies_3):
+    host_manager = serial_host_manager(proxies_3)
+    order = await send_in_order(host_manager, [Priority.BACKFILL, Priority.REFRESH, Priority.INTERACTIVE])
+    assert order == ["/2", "/1", "/0"]
+    assert host_manager.active_requests == 0
+    assert host_manager.waiting_requests == 0
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_equal_priorities_are_sent_in_order(proxies_3):
+    host_manager = serial_host_manager(proxies_3)
+    assert await send_in_order(host_manager, [Priority.BACKFILL] * 3) == ["/0", "/1", "/2"]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_aging_prevents_starvation(proxies_3):
+    host_manager = serial_host_manager(proxies_3, aging=0.01)
+    order = await send_in_order(host_manager, [Priority.BACKFILL, Priority.INTERACTIVE], delay=0.03)
+    assert order == ["/0", "/1"]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_cancelled_waiters_are_skipped(proxies_3):
+    async def respond(request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200)
+
+    respx.get().mock(side_effect=respond)
+    host_manager = serial_host_manager(proxies_3)
+    first = asyncio.create_task(host_manager.get("https://example.com", {}))
+    second = asyncio.create_task(host_manager.get("https://example.com", {}, priority=Priority.INTERACTIVE))
+    await asyncio.sleep(0)
+    assert host_manager.waiting_requests == 1
+    second.cancel()
+    await first
+    assert host_manager.waiting_requests == 0
+    await host_manager.get("https://example.com", {})
+    assert host_manager.active_requests == 0
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_requests_are_spaced_by_the_rate_limit(proxies_3):
+    respx.get().respond(200)
+    host_manager = HostManager("example.com", proxies_3, RateController(rate=20, max_rate=20))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.gather(*(host_manager.get("https://example.com", {}) for _ in range(4)))
+    assert loop.time() - start >= 3 / 20
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_burst_allows_concurrent_requests_within_the_budget(proxies_3):
+    async def respond(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    respx.get().mock(side_effect=respond)
+    host_manager = HostManager("example.com", proxies_3, RateController(rate=1, max_rate=1), burst=3)
+    tasks = [asyncio.create_task(host_manager.get(f"https://example.com/{i}", {})) for i in range(4)]
+    await asyncio.sleep(0.01)
+    assert host_manager.active_requests == 3
+    assert host_manager.waiting_requests == 1
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_per_proxy_rate_limits_each_proxy(proxies_3):
+    respx.get().respond(200)
+    host_manager = HostManager("example.com", proxies_3, RateController(rate=0.1, max_rate=0.1), per_proxy=True)
+    # The host itself isn't rate-limited, but each proxy has spent its only token
+    await asyncio.gather(*(host_manager.get("https://example.com", {}) for _ in range(3)))
+    assert host_manager.bucket.tokens == 1
+    buckets = host_manager._client_manager._proxy_buckets
+    assert set(buckets) == set(proxies_3)
+    assert all(bucket.tokens < 1 and bucket.rate == 0.1 for bucket in buckets.values())
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import types
+
+import httpx
+import pytest
+import respx
+
+from .. import _host_registry
+from .._host_manager import HostManager, HostState
+from .._host_registry import HostRegistry
+from .._rate_controller import RateController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(_host_registry, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def registry(proxies_3):
+    return HostRegistry(lambda host: HostManager(host, proxies_3), max_hosts=2, idle_ttl=60)
+
+
+@pytest.mark.parametrize("kwargs", [{"max_hosts": 0}, {"idle_ttl": 0}, {"max_states": -1}])
+def test_invalid_initialization(kwargs):
+    with pytest.raises(ValueError):
+        HostRegistry(lambda host: None, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_host_is_evicted(registry, clock):
+    first = registry.acquire("a.com")
+    registry.acquire("b.com")
+    clock[0] += 1
+    assert registry.acquire("a.com") is first
+    registry.acquire("c.com")
+    assert list(registry) == ["a.com", "c.com"]
+    assert set(registry.states) == {"b.com"}
+    await registry.aclose()
+    assert first.closed
+
+
+@pytest.mark.asyncio
+async def test_idle_hosts_are_evicted(registry, clock):
+    registry.acquire("a.com")
+    clock[0] += 30
+    registry.acquire("b.com")
+    clock[0] += 31
+    registry.acquire("c.com")
+    assert list(registry) == ["b.com", "c.com"]
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_idle_hosts_are_swept_without_new_hosts(proxies_3):
+    registry = HostRegistry(lambda host: HostManager(host, proxies_3), idle_ttl=0.05)
+    cold = registry.acquire("a.com")
+    warm = registry.acquire("b.com")
+    for _ in range(4):
+        await asyncio.sleep(0.02)
+        assert registry.acquire("b.com") is warm
+    assert list(registry) == ["b.com"]
+    await asyncio.sleep(0)
+    assert cold.closed
+    assert "a.com" in registry.states
+    await registry.aclose()
+
+
+@pytest.mark.asyncio
+async def test_evicted_host_state_is_restored(registry, clock):
+    host = registry.acquire("a.com")
+    learned = HostState(
+        rate=7, concurrency=3.4, average_response_time=0.2, max_client_requests=10, time=time.time(), http2=False
+    )
+    host.restore(learned)
+    clock[0] += 61
+    registry.acquire("b.com")
+    await asyncio.sleep(0)
+    assert host.closed
+    assert registry.states["a.com"][:4] == learned[:4]
+
+    restored = registry.acquire("a.com")
+    assert restored is not host
+    assert restored.state()[:4] == learned[:4]
+    assert restored.rate_controller.concurrency == 3
+    assert restored.bucket.rate == 7
+    assert restored.state().http2 is False
+    assert "a.com" not in registry.states
+    await registry.aclose()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_busy_hosts_are_not_evicted(proxies_3, clock):
+    async def respond(request):
+        await asyncio.sleep(0.01)
+        return httpx.Response(200)
+
+    respx.get().mock(side_effect=respond)
+    registry = HostRegistry(
+        lambda host: HostManager(host, proxies_3, RateController(rate=100, max_rate=100)), max_hosts=1
+    )
+    request = asyncio.create_task(registry.acquire("example.com").get("https://example.com", {}))
+    await asyncio.sleep(0)
+    registry.acquire("other.com")
+    assert set(registry) == {"example.com", "other.com"}
+    assert (await request).status_code == 200
+    await registry.aclose()
@@ -0,0 +1,85 @@
+import httpx
+import pytest
+import respx
+
+from .._client_manager import ClientManager
+from .._host_manager import HostManager
+from .._metrics import Metrics, InMemoryMetrics
+from .._proxy_pool import ProxyPool
+from .._rate_controller import RateController
+
+
+def test_null_metrics_discard_everything():
+    metrics = Metrics()
+    assert not metrics.enabled
+    metrics.increment("foo", host="bar")
+    metrics.observe("foo", 1)
+    metrics.gauge("foo", 1)
+    with metrics.span("foo") as span:
+        assert span is None
+
+
+def test_in_memory_counters_histograms_and_gauges():
+    metrics = InMemoryMetrics()
+    metrics.increment("requests", host="a", status_code=200)
+    metrics.increment("requests", 2, host="b", status_code=200)
+    metrics.increment("requests", host="b", status_code=404)
+    metrics.observe("latency", 0.1, host="a")
+    metrics.observe("latency", 0.2, host="b")
+    metrics.gauge("active", 3, host="a")
+    assert metrics.counter("requests") == 4
+    assert metrics.counter("requests", status_code=200) == 3
+    assert metrics.counter("requests", host="b", status_code=404) == 1
+    assert metrics.counter("foo") == 0
+    assert sorted(metrics.values("latency")) == [0.1, 0.2]
+    assert metrics.values("latency", host="a") == [0.1]
+    assert metrics.gauges["active", (("host", "a"),)] == 3
+
+
+def test_spans_are_nested():
+    metrics = InMemoryMetrics()
+    with metrics.span("outer", url="foo") as outer:
+        with metrics.span("inner") as inner:
+            inner.set_tag("proxy", "bar")
+    with pytest.raises(ValueError):
+        with metrics.span("failing"):
+            raise ValueError()
+
+    assert list(metrics.spans) == [inner, outer, metrics.spans[-1]]
+    assert inner.parent is outer
+    assert outer.parent is None
+    assert inner.tags == {"proxy": "bar"}
+    assert outer.duration >= inner.duration >= 0
+    assert isinstance(metrics.spans[-1].error, ValueError)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_host_manager_reports_metrics(proxies_3, url):
+    respx.get().mock(side_effect=[httpx.Response(200), httpx.Response(404), httpx.ConnectError("foo")])
+    metrics = InMemoryMetrics()
+    host_manager = HostManager("example.com", proxies_3, RateController(rate=100), metrics=metrics)
+    await host_manager.get(url, {})
+    await host_manager.get(url, {})
+    with pytest.raises(httpx.ConnectError):
+        await host_manager.get(url, {})
+
+    assert metrics.counter("request.status", host="example.com", status_code=200) == 1
+    assert metrics.counter("request.status", host="example.com", status_code=404) == 1
+    assert metrics.counter("request.errors", host="example.com", error="ConnectError") == 1
+    assert len(metrics.values("request.latency", host="example.com")) == 3
+    assert len(metrics.values("host.queue_wait", host="example.com")) == 3
+    assert len(metrics.values("proxy.latency")) == 3
+    assert len(metrics.values("proxy.acquire_wait")) >= 2
+    assert metrics.counter("client.rotations") == 2
+    assert [span.name for span in metrics.spans].count("host.request") == 3
+    client_spans = [span for span in metrics.spans if span.name == "client.request"]
+    assert all(span.parent.name == "host.request" for span in client_spans)
+
+
+def test_proxy_pool_reports_state_changes(proxies_3):
+    metrics = InMemoryMetrics()
+    pool = ProxyPool(proxies_3, 0, quarantine_cooldown=10, max_quarantines=0, metrics=metrics)
+    pool.free(pool.get(), 500)
+    pool.remove(proxies_3[1])
+    assert metrics.counter("proxy.evictions") == 2
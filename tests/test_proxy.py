@@ -1,3 +1,4 @@
+import json
 import pytest
 
 from dataclasses import FrozenInstanceError
@@ -57,3 +58,30 @@ def test_hash(proxy_u1a1, proxy_u1a2, proxy_u2a1):
 def test_immutability(proxy_u1a1):
     with pytest.raises(FrozenInstanceError):
         proxy_u1a1.url = "foo"
+
+
+def test_assign_user_agent(user_agent1):
+    proxy = Proxy("https://proxy1.com")
+    assert proxy.user_agent is None
+    proxy.assign_user_agent(user_agent1)
+    assert proxy.user_agent == user_agent1
+    with pytest.raises(ValueError):
+        proxy.assign_user_agent(user_agent1)
+
+
+def test_trusted_skips_validation(user_agent1):
+    proxy = Proxy.trusted("foo", user_agent1)
+    assert proxy.url == "foo"
+    assert proxy.user_agent == user_agent1
+    assert proxy == Proxy.trusted("foo")
+
+
+def test_user_agent_strings_are_interned(user_agent1):
+    proxy1 = Proxy("https://proxy1.com", json.loads(json.dumps(user_agent1)))
+    proxy2 = Proxy.trusted("https://proxy2.com", json.loads(json.dumps(user_agent1)))
+    assert proxy1.user_agent == proxy2.user_agent
+    for (name1, value1), (name2, value2) in zip(proxy1.user_agent.items(), proxy2.user_agent.items()):
+        assert name1 is name2 and value1 is value2
+    with pytest.raises(TypeError):
+        proxy1.user_agent["User-Agent"] = "bar"
+    assert not hasattr(proxy1, "__dict__")
@@ -0,0 +1,53 @@
+import httpx
+import pytest
+
+from .._proxy_health import ProxyHealth
+
+
+@pytest.mark.parametrize("alpha", [0, -1, 1.1])
+def test_invalid_initialization(alpha):
+    with pytest.raises(ValueError):
+        ProxyHealth(alpha)
+
+
+def test_new_record():
+    health = ProxyHealth(default_latency=2)
+    assert health.latency is None
+    assert health.success_rate == 0.5
+    assert health.score == 4
+    assert not health.error_counts
+    assert health.last_failure is None
+
+
+def test_latency_ewma():
+    health = ProxyHealth(alpha=0.5)
+    health.record(1, 200)
+    assert health.latency == 1
+    health.record(2, 200)
+    assert health.latency == 1.5
+    health.record(None, 200)
+    assert health.latency == 1.5
+
+
+def test_success_rate_and_error_counts():
+    health = ProxyHealth()
+    health.record(0.1, 200)
+    health.record(0.1, 404)
+    health.record(0.1, 429)
+    health.record(0.1, 429)
+    health.record(0.1, error=httpx.ReadTimeout("foo"))
+    assert health.successes == 1
+    assert health.failures == 4
+    assert health.success_rate == 2 / 7
+    assert health.error_counts == {"404": 1, "429": 2, "ReadTimeout": 1}
+    assert health.last_failure is not None
+
+
+def test_score_prefers_fast_reliable_proxies():
+    fast, slow, unreliable = ProxyHealth(), ProxyHealth(), ProxyHealth()
+    for _ in range(10):
+        fast.record(0.2, 200)
+        slow.record(3, 200)
+        unreliable.record(0.2, 503)
+    assert fast.score < slow.score
+    assert fast.score < unreliable.score
@@ -1,3 +1,7 @@
+import asyncio
+import random
+import time
+
 import httpx
 import pytest
 
@@ -6,6 +10,7 @@ from collections import deque
 import respx
 
 from .._proxy_pool import ProxyPool
+from .._proxy_probe import HttpProbe
 from .._exceptions import ProxiesUnavailable, ProxiesExhausted
 
 
@@ -123,3 +128,222 @@ def test_bool(proxy_u1a1):
 
 
 
+
+
+@pytest.mark.asyncio
+async def test_acquire_returns_available_proxy(proxy_pool_3):
+    proxy = await proxy_pool_3.acquire()
+    assert proxy in proxy_pool_3._proxies_in_use
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_in_fifo_order(proxies_3):
+    pool = ProxyPool(proxies_3[:1])
+    proxy = await pool.acquire()
+    order = []
+
+    async def acquire(i):
+        order.append((i, await pool.acquire()))
+        await asyncio.sleep(0)
+        pool.free(order[-1][1])
+
+    tasks = [asyncio.create_task(acquire(i)) for i in range(5)]
+    await asyncio.sleep(0)
+    pool.free(proxy)
+    await asyncio.gather(*tasks)
+    assert [i for i, _ in order] == list(range(5))
+    assert all(acquired == proxy for _, acquired in order)
+
+
+@pytest.mark.asyncio
+async def test_free_wakes_a_single_waiter(proxies_3):
+    pool = ProxyPool(proxies_3[:1])
+    proxy = await pool.acquire()
+    tasks = [asyncio.create_task(pool.acquire()) for _ in range(3)]
+    await asyncio.sleep(0)
+    pool.free(proxy)
+    await asyncio.sleep(0)
+    assert [task.done() for task in tasks] == [True, False, False]
+    assert not pool._available_proxies
+    for task in tasks[1:]:
+        task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_acquire_timeout(proxies_3):
+    pool = ProxyPool(proxies_3[:1])
+    await pool.acquire()
+    with pytest.raises(ProxiesUnavailable):
+        await pool.acquire(timeout=0.01)
+    assert all(waiter.done() for waiter in pool._waiters)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_lose_proxy(proxies_3):
+    pool = ProxyPool(proxies_3[:1])
+    proxy = await pool.acquire()
+    cancelled = asyncio.create_task(pool.acquire())
+    waiting = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0)
+
+    # Hand the proxy to the first waiter and cancel it before it resumes
+    pool.free(proxy)
+    cancelled.cancel()
+    assert await waiting == proxy
+    assert cancelled.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_acquire_raises_when_exhausted(proxies_3):
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=None)
+    proxy = await pool.acquire()
+    task = asyncio.create_task(pool.acquire())
+    await asyncio.sleep(0)
+    pool.free(proxy, 500)
+    with pytest.raises(ProxiesExhausted):
+        await task
+    with pytest.raises(ProxiesExhausted):
+        await pool.acquire()
+
+
+@pytest.mark.asyncio
+async def test_lease_frees_proxy(proxy_pool_3):
+    async with proxy_pool_3.lease() as proxy:
+        assert proxy in proxy_pool_3._proxies_in_use
+    assert proxy in proxy_pool_3._available_proxies
+
+
+def test_get_prefers_healthier_proxy(proxies_3):
+    pool = ProxyPool(proxies_3, choice_window=2)
+    pool.record(proxies_3[0], 3, 200)
+    pool.record(proxies_3[1], 0.2, 200)
+    assert pool.get() == proxies_3[1]
+    assert pool.get() == proxies_3[2]
+    assert pool.get() == proxies_3[0]
+
+
+def test_get_weights_selection_by_health(proxies_1000):
+    random.seed(0)
+    pool = ProxyPool(proxies_1000[:10])
+    fast = proxies_1000[0]
+    for proxy in proxies_1000[:10]:
+        pool.record(proxy, 0.2 if proxy == fast else 2, 200)
+
+    selected = []
+    for _ in range(1000):
+        proxy = pool.get()
+        selected.append(proxy)
+        pool.free(proxy)
+    # The fast proxy gets more than its fair share of 100 selections
+    assert selected.count(fast) > 130
+
+
+def test_health_is_removed_with_proxy(proxies_3):
+    pool = ProxyPool(proxies_3)
+    pool.record(proxies_3[0], 0.1, 200)
+    assert pool.health(proxies_3[0]).successes == 1
+    pool.remove(proxies_3[0])
+    with pytest.raises(KeyError):
+        pool.health(proxies_3[0])
+    pool.record(proxies_3[0], 0.1, 200)
+
+
+def test_invalid_choice_window(proxies_3):
+    with pytest.raises(ValueError):
+        ProxyPool(proxies_3, choice_window=1)
+
+
+def test_bad_proxies_are_quarantined(proxies_3):
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=10)
+    proxy = pool.get()
+    pool.free(proxy, 500)
+    assert proxy not in pool
+    assert 9 < pool.quarantined_proxies[proxy] <= 10
+    assert not pool.add(proxy)
+    with pytest.raises(ProxiesUnavailable):
+        pool.get()
+
+
+def test_quarantined_proxies_are_revived_on_probation(proxies_3, monkeypatch):
+    now = 0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    pool = ProxyPool(proxies_3[:1], 1, quarantine_cooldown=10)
+    proxy = pool.get()
+    pool.free(proxy, 500)
+    pool.get()
+    pool.free(proxy, 500)
+    assert proxy in pool.quarantined_proxies
+
+    now = 10
+    assert pool.get() == proxy
+    assert pool.proxies_remaining[proxy] == 1
+
+    # A single bad response on probation quarantines the proxy again, with twice the cool-down
+    pool.free(proxy, 500)
+    assert pool.quarantined_proxies[proxy] == 20
+
+    # A good response clears the quarantine history
+    now = 30
+    pool.free(pool.get(), 200)
+    assert pool.proxies_remaining[proxy] == 0
+    pool.free(pool.get(), 500)
+    pool.free(pool.get(), 500)
+    assert pool.quarantined_proxies[proxy] == 10
+
+
+def test_cooldown_is_capped(proxies_3, monkeypatch):
+    now = 0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=10, max_quarantine_cooldown=25)
+    for cooldown in (10, 20, 25, 25):
+        pool.free(pool.get(), 500)
+        assert pool.quarantined_proxies[proxies_3[0]] == cooldown
+        now += cooldown
+
+
+def test_max_quarantines_removes_proxy(proxies_3, monkeypatch):
+    now = 0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=10, max_quarantines=1)
+    pool.free(pool.get(), 500)
+    now = 10
+    pool.free(pool.get(), 500)
+    assert not pool.quarantined_proxies
+    with pytest.raises(ProxiesExhausted):
+        pool.get()
+
+
+@pytest.mark.asyncio
+async def test_waiters_get_revived_proxies(proxies_3):
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=0.05)
+    proxy = await pool.acquire()
+    pool.free(proxy, 500)
+    assert await pool.acquire(timeout=1) == proxy
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("probe_result", [True, False])
+async def test_probe_decides_revival(proxies_3, probe_result):
+    probed = []
+
+    async def probe(proxy):
+        probed.append(proxy)
+        return probe_result
+
+    pool = ProxyPool(proxies_3[:1], 0, quarantine_cooldown=0.05, probe=probe)
+    proxy = await pool.acquire()
+    pool.free(proxy, 500)
+    await asyncio.sleep(0.1)
+    assert probed == [proxy]
+    assert (proxy in pool) is probe_result
+    assert (proxy in pool.quarantined_proxies) is not probe_result
+
+
+@respx.mock
+@pytest.mark.asyncio
+@pytest.mark.parametrize("response, expected", [(httpx.Response(200), True), (httpx.Response(403), False),
+                                                (httpx.ConnectError("foo"), False)])
+async def test_http_probe(proxy_u1a1, url, response, expected):
+    route = respx.head(url).mock(side_effect=[response])
+    assert await HttpProbe(url)(proxy_u1a1) is expected
+    assert route.calls.last.request.headers["User-Agent"] == "foo"
@@ -0,0 +1,144 @@
+import asyncio
+
+import pytest
+import respx
+
+from .._exceptions import ProxiesUnavailable
+from .._proxy_registry import ProxyRegistry
+from .._webber import Webber
+
+
+@pytest.mark.parametrize("kwargs", [{"max_leases_per_proxy": 0}, {"max_leases_per_host": 0}, {"pool_size": 0}])
+def test_invalid_initialization(proxies_3, kwargs):
+    with pytest.raises(ValueError):
+        ProxyRegistry(proxies_3, **kwargs)
+
+
+def test_pools_share_health(proxies_3):
+    registry = ProxyRegistry(proxies_3)
+    pool1, pool2 = registry.pool(), registry.pool()
+    pool1.record(proxies_3[0], 0.1, 503)
+    assert pool2.health(proxies_3[0]) is registry.health(proxies_3[0])
+    assert pool2.health(proxies_3[0]).failures == 1
+
+
+def test_pools_get_consecutive_slices(proxies_3):
+    registry = ProxyRegistry(proxies_3, pool_size=2)
+    pools = [registry.pool() for _ in range(3)]
+    assert [list(pool.proxies_remaining) for pool in pools] == [
+        proxies_3[:2], [proxies_3[2], proxies_3[0]], proxies_3[1:]
+    ]
+    # Pools share the registry's health records instead of copying them
+    assert all(pool._health is registry._health for pool in pools)
+    pools[0].remove(proxies_3[0])
+    assert registry.health(proxies_3[0]) is pools[1].health(proxies_3[0])
+
+
+def test_dead_proxy_is_deprioritised_everywhere(proxies_3):
+    registry = ProxyRegistry(proxies_3)
+    pool1, pool2 = registry.pool(choice_window=3), registry.pool(choice_window=3)
+    for proxy in proxies_3[1:]:
+        pool1.record(proxy, 0.1, 200)
+    for _ in range(10):
+        pool1.record(proxies_3[0], 0.1, 503)
+    assert proxies_3[0] not in [pool2.get(), pool2.get()]
+
+
+def test_max_leases_per_proxy(proxies_3):
+    registry = ProxyRegistry(proxies_3[:1], max_leases_per_proxy=1)
+    pool1, pool2 = registry.pool(), registry.pool()
+    proxy = pool1.get()
+    assert registry.leases(proxy) == 1
+    with pytest.raises(ProxiesUnavailable):
+        pool2.get()
+    pool1.free(proxy)
+    assert not registry.leases(proxy)
+    assert pool2.get() == proxy
+
+
+def test_max_leases_per_proxy_skips_leased_proxies(proxies_3):
+    registry = ProxyRegistry(proxies_3, max_leases_per_proxy=1)
+    pool1, pool2 = registry.pool(), registry.pool()
+    leased = {pool1.get(), pool1.get()}
+    assert pool2.get() not in leased
+
+
+def test_max_leases_per_host(proxies_3):
+    registry = ProxyRegistry(proxies_3, max_leases_per_host=2)
+    pool = registry.pool()
+    proxy = pool.get()
+    pool.get()
+    with pytest.raises(ProxiesUnavailable):
+        pool.get()
+    pool.free(proxy)
+    pool.get()
+
+
+@pytest.mark.asyncio
+async def test_waiting_pool_gets_proxy_released_by_another_pool(proxies_3):
+    registry = ProxyRegistry(proxies_3[:1], max_leases_per_proxy=1)
+    pool1, pool2 = registry.pool(), registry.pool()
+    proxy = await pool1.acquire()
+    task = asyncio.create_task(pool2.acquire())
+    await asyncio.sleep(0)
+    assert not task.done()
+    pool1.free(proxy)
+    assert await task == proxy
+    assert registry.leases(proxy) == 1
+    assert proxy in pool1._available_proxies
+
+
+@pytest.mark.asyncio
+async def test_local_waiters_are_served_first(proxies_3):
+    registry = ProxyRegistry(proxies_3[:1], max_leases_per_proxy=1)
+    pool1, pool2 = registry.pool(), registry.pool()
+    proxy = await pool1.acquire()
+    other = asyncio.create_task(pool2.acquire())
+    local = asyncio.create_task(pool1.acquire())
+    await asyncio.sleep(0)
+    pool1.free(proxy)
+    assert await local == proxy
+    assert not other.done()
+    pool1.free(proxy)
+    assert await other == proxy
+
+
+@pytest.mark.asyncio
+async def test_waiting_pool_gets_proxy_held_by_idle_client(proxies_3):
+    registry = ProxyRegistry(proxies_3[:1], max_leases_per_proxy=1)
+    pool1, pool2 = registry.pool(), registry.pool()
+    busy = True
+
+    def release_idle(proxy):
+        if busy:
+            return False
+        pool1.free(proxy)
+        return True
+
+    pool1.release_idle = release_idle
+    proxy = pool1.get()
+    with pytest.raises(ProxiesUnavailable):
+        await pool2.acquire(0.05)
+
+    busy = False
+    assert await asyncio.wait_for(pool2.acquire(), 1) is proxy
+    assert proxy not in pool1._proxies_in_use
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_idle_clients_of_other_hosts_free_their_proxies():
+    respx.get().respond(200)
+    async with Webber(ua_proxies={"https://proxy0.com": {}}, max_leases_per_proxy=1) as webber:
+        await webber.get("https://a.com", {}, retries={})
+        response = await asyncio.wait_for(webber.get("https://b.com", {}, retries={}), 1)
+        assert response.status_code == 200
+        await asyncio.wait_for(webber.get("https://a.com", {}, retries={}), 1)
+
+
+def test_changed_health(proxies_3):
+    registry = ProxyRegistry(proxies_3)
+    pool = registry.pool()
+    pool.record(proxies_3[1], 0.1, 200)
+    assert registry.changed_health() == {proxies_3[1]: registry.health(proxies_3[1])}
+    assert not registry.changed_health()
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+import respx
+
+from .._proxy_store import ProxyStore
+from .._webber import Webber
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProxyStore(str(tmp_path / "proxies.jsonl"))
+
+
+def test_add_appends_only_new_proxies(store):
+    assert store.add(["https://proxy0.com", "https://proxy1.com"]) == {
+        "https://proxy0.com": None, "https://proxy1.com": None
+    }
+    store.add(["https://proxy1.com", "https://proxy2.com"])
+    with open(store.path) as f:
+        assert [json.loads(line)["url"] for line in f] == [
+            "https://proxy0.com", "https://proxy1.com", "https://proxy2.com"
+        ]
+    with pytest.raises(ValueError):
+        store.add(["https://proxy3.com", "foo"])
+    assert "https://proxy3.com" not in store.load()
+
+
+def test_later_records_replace_earlier_ones(store):
+    store.add(["https://proxy0.com"])
+    store.append([("https://proxy0.com", {"User-Agent": "foo"})])
+    assert store.load() == {"https://proxy0.com": {"User-Agent": "foo"}}
+    store.compact()
+    with open(store.path) as f:
+        assert len(f.readlines()) == 1
+    assert store.load() == {"https://proxy0.com": {"User-Agent": "foo"}}
+
+
+def test_reads_and_appends_to_json_object_files(store):
+    with open(store.path, "w") as f:
+        json.dump({"https://proxy0.com": {"User-Agent": "foo"}}, f)
+    store.add(["https://proxy1.com"])
+    assert store.load() == {"https://proxy0.com": {"User-Agent": "foo"}, "https://proxy1.com": None}
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_assigns_user_agents_on_first_use(store):
+    respx.get().respond(200)
+    async with Webber(["https://proxy0.com", "https://proxy1.com"], store.path) as webber:
+        assert webber.proxies == {"https://proxy0.com": None, "https://proxy1.com": None}
+        webber.user_agent_flush_interval = 0.01
+        response = await webber.get("https://example.com", {})
+        # Assignments are appended in a batch later
+        assert all(user_agent is None for user_agent in store.load().values())
+        await asyncio.sleep(0.1)
+        assigned = {url: user_agent for url, user_agent in store.load().items() if user_agent is not None}
+        assert len(assigned) == 1
+        user_agent = httpx.Headers(next(iter(assigned.values())))
+        assert response.request.headers["User-Agent"] == user_agent["User-Agent"]
+
+    # The assigned user agent is kept in later runs
+    assert Webber(ua_proxies_path=store.path).proxies == store.load()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_appends_pending_user_agents_on_close(store):
+    respx.get().respond(200)
+    async with Webber(["https://proxy0.com"], store.path) as webber:
+        await webber.get("https://example.com", {})
+        assert store.load() == {"https://proxy0.com": None}
+    assert store.load() == webber.proxies
+    assert store.load()["https://proxy0.com"] is not None
+    with open(store.path) as f:
+        assert len(f.readlines()) == 2
@@ -0,0 +1,106 @@
+import httpx
+import pytest
+import respx
+
+from .._host_manager import HostManager
+from .._rate_controller import RateController
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"rate": 0},
+        {"rate": 1, "min_rate": 2},
+        {"rate": 200},
+        {"concurrency": 0},
+        {"concurrency": 100},
+        {"decrease": 1},
+        {"latency_decrease": 0},
+        {"increase": 0},
+        {"latency_tolerance": 1},
+    ]
+)
+def test_invalid_initialization(kwargs):
+    with pytest.raises(ValueError):
+        RateController(**kwargs)
+
+
+def test_success_increases_rate_and_concurrency():
+    controller = RateController(rate=1, concurrency=1, increase=0.5)
+    controller.record(0.1, 200)
+    assert controller.rate == 1.5
+    assert controller.delay == 1 / 1.5
+    assert controller.concurrency == 2
+    controller.record(0.1, 200)
+    assert controller.concurrency == 2
+    assert [sample.reason for sample in controller.history] == ["increase", "increase"]
+
+
+def test_increase_is_capped():
+    controller = RateController(rate=1, max_rate=1.2, concurrency=1, max_concurrency=1, increase=0.5)
+    controller.record(0.1, 200)
+    assert controller.rate == 1.2
+    assert controller.concurrency == 1
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_rate_limiting_decreases_rate_and_concurrency(status_code):
+    controller = RateController(rate=10, concurrency=8, decrease=0.5)
+    controller.record(0.1, status_code)
+    assert controller.rate == 5
+    assert controller.concurrency == 4
+    assert controller.history[-1].reason == "rate_limited"
+
+
+def test_backs_off_once_per_delay_window():
+    controller = RateController(rate=0.1, min_rate=0.01, decrease=0.5)
+    controller.record(0.1, 429)
+    controller.record(0.1, 429)
+    assert controller.rate == 0.05
+    assert len(controller.history) == 1
+
+
+def test_timeout_decreases_rate():
+    controller = RateController(rate=10, decrease=0.5)
+    controller.record(None, timed_out=True)
+    assert controller.rate == 5
+    assert controller.history[-1].reason == "timeout"
+
+
+def test_decrease_is_capped():
+    controller = RateController(rate=1, min_rate=0.8, concurrency=1, decrease=0.5)
+    controller.record(0.1, 429)
+    assert controller.rate == 0.8
+    assert controller.concurrency == 1
+
+
+def test_rising_response_times_decrease_rate():
+    controller = RateController(rate=10, latency_decrease=0.5)
+    for _ in range(10):
+        controller.record(0.1, 200)
+    rate = controller.rate
+    for _ in range(5):
+        controller.record(2, 200)
+    assert controller.rate == rate / 2
+    assert controller.history[-1].reason == "latency"
+
+
+def test_other_errors_do_not_adjust():
+    controller = RateController()
+    controller.record(0.1, 404)
+    assert controller.rate == 1
+    assert not controller.history
+    assert controller.response_times == (0.1,)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_host_manager_feeds_rate_controller(proxies_3, url):
+    respx.get().mock(side_effect=[httpx.Response(200), httpx.Response(503)])
+    host_manager = HostManager("example.com", proxies_3, RateController(rate=50, max_rate=100, decrease=0.5))
+    await host_manager.get(url, {})
+    assert host_manager.rate_controller.rate == 50.05
+    await host_manager.get(url, {})
+    assert host_manager.rate_controller.rate == 50.05 / 2
+    assert len(host_manager.rate_controller.response_times) == 2
+    assert not host_manager.active_requests
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import math
+
+import httpx
+import pytest
+import respx
+
+from .test_utils import raise_for_status_hook
+from .._exceptions import DeadlineExceeded
+from .._retry import RetryPolicy
+from .._webber import Webber
+
+
+def responses(*items):
+    items = iter(items)
+
+    async def send():
+        item = next(items)
+        if isinstance(item, Exception):
+            raise item
+        return httpx.Response(item) if isinstance(item, int) else item
+
+    return send
+
+
+@pytest.mark.parametrize("kwargs", [{"backoff_base": -1}, {"backoff_max": -1}, {"deadline": 0}])
+def test_invalid_initialization(kwargs):
+    with pytest.raises(ValueError):
+        RetryPolicy({}, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_retries_status_codes_until_success():
+    policy = RetryPolicy({503: 2}, backoff_base=0)
+    response = await policy.execute(responses(503, 503, 200))
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_returns_last_response_when_retries_exhausted():
+    policy = RetryPolicy({503: 1}, backoff_base=0)
+    response = await policy.execute(responses(503, 503, 200))
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_does_not_retry_unmapped_status_codes():
+    policy = RetryPolicy({503: 1}, backoff_base=0)
+    response = await policy.execute(responses(404, 200))
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_retries_exception_subclasses():
+    policy = RetryPolicy({httpx.TimeoutException: math.inf}, backoff_base=0)
+    response = await policy.execute(responses(httpx.ReadTimeout("foo"), httpx.ConnectTimeout("bar"), 200))
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_raises_last_exception_when_retries_exhausted():
+    policy = RetryPolicy({httpx.ReadTimeout: 1, httpx.ConnectError: 1}, backoff_base=0)
+    with pytest.raises(httpx.ReadTimeout):
+        await policy.execute(responses(httpx.ReadTimeout("foo"), httpx.ConnectError("bar"), httpx.ReadTimeout("baz")))
+
+
+@pytest.mark.asyncio
+async def test_raises_unmapped_exceptions():
+    policy = RetryPolicy({httpx.ReadTimeout: 1}, backoff_base=0)
+    with pytest.raises(httpx.ConnectError):
+        await policy.execute(responses(httpx.ConnectError("foo"), 200))
+
+
+@pytest.mark.asyncio
+async def test_retries_http_status_errors():
+    request = httpx.Request("GET", "https://example.com")
+    error = httpx.HTTPStatusError("foo", request=request, response=httpx.Response(429, request=request))
+    policy = RetryPolicy({429: 1}, backoff_base=0)
+    assert (await policy.execute(responses(error, 200))).status_code == 200
+    with pytest.raises(httpx.HTTPStatusError):
+        await policy.execute(responses(error, error))
+
+
+@pytest.mark.parametrize("value, expected", [("3", 3), ("-3", 0), ("Wed, 21 Oct 2015 07:28:00 GMT", 0), ("foo", None)])
+def test_parse_retry_after(value, expected):
+    assert RetryPolicy._parse_retry_after(value) == expected
+
+
+@pytest.mark.asyncio
+async def test_respects_retry_after():
+    policy = RetryPolicy({429: 1}, backoff_base=0)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await policy.execute(responses(httpx.Response(429, headers={"Retry-After": "0.3"}), 200))
+    assert loop.time() - start >= 0.3
+
+
+@pytest.mark.asyncio
+async def test_gives_up_when_retry_after_exceeds_max_retry_after():
+    policy = RetryPolicy({429: 1}, backoff_base=0, max_retry_after=60)
+    response = await policy.execute(responses(httpx.Response(429, headers={"Retry-After": "86400"}), 200))
+    assert response.status_code == 429
+    policy = RetryPolicy({429: 1}, backoff_base=0, max_retry_after=None)
+    assert policy._calc_delay(0, httpx.Response(429, headers={"Retry-After": "86400"})) == 86400
+
+
+def test_backoff_of_many_attempts_is_capped():
+    policy = RetryPolicy({httpx.ConnectError: math.inf}, backoff_max=30)
+    assert 0 <= policy._calc_delay(1100, None) <= 30
+
+
+@pytest.mark.asyncio
+async def test_gives_up_when_backoff_exceeds_deadline():
+    policy = RetryPolicy({429: 1}, deadline=1)
+    response = await policy.execute(responses(httpx.Response(429, headers={"Retry-After": "5"}), 200))
+    assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_raises_deadline_exceeded():
+    async def send():
+        await asyncio.sleep(1)
+
+    with pytest.raises(DeadlineExceeded):
+        await RetryPolicy({}, deadline=0.1).execute(send)
+
+
+@respx.mock
+@pytest.mark.asyncio
+@pytest.mark.parametrize("event_hooks", [None, {"response": [raise_for_status_hook]}])
+async def test_webber_get_retries_on_fresh_proxy(tmp_path, url, event_hooks):
+    path = tmp_path / "proxies.json"
+    path.write_text(json.dumps({f"https://proxy{i}.com": {} for i in range(3)}))
+    route = respx.get().mock(side_effect=[httpx.Response(503), httpx.Response(200)])
+    webber = Webber(ua_proxies_path=str(path))
+    response = await webber.get(url, {}, retries={503: 1}, event_hooks=event_hooks)
+    assert response.status_code == 200
+    assert route.call_count == 2
+    client_manager = webber._hosts["example.com"]._client_manager
+    assert len(client_manager.proxy_pool.proxies_remaining) == 3
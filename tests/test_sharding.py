@@ -0,0 +1,75 @@
+import json
+
+import httpx
+import pytest
+
+from ..benchmarks import OriginServer, ForwardProxy
+from .._sharding import HashRing, ShardedWebber
+
+
+def test_hash_ring_spreads_keys_evenly():
+    ring = HashRing(range(4))
+    assert ring.nodes == {0, 1, 2, 3}
+    counts = [0] * 4
+    for i in range(4000):
+        counts[ring.node(f"host{i}.com")] += 1
+    assert min(counts) > 600
+
+
+def test_hash_ring_only_remaps_keys_of_removed_node():
+    ring = HashRing(range(4))
+    before = {f"host{i}.com": ring.node(f"host{i}.com") for i in range(1000)}
+    ring.remove(3)
+    after = {key: ring.node(key) for key in before}
+    assert 3 not in after.values()
+    assert all(after[key] == node for key, node in before.items() if node != 3)
+
+    ring.add(3)
+    assert {key: ring.node(key) for key in before} == before
+
+
+def test_empty_hash_ring_raises():
+    with pytest.raises(LookupError):
+        HashRing().node("example.com")
+
+
+@pytest.fixture
+def ua_proxies_path(tmp_path):
+    path = str(tmp_path / "proxies.json")
+    with open(path, "w") as f:
+        json.dump({f"http://proxy{i}.com": {"User-Agent": str(i)} for i in range(5)}, f)
+    return path
+
+
+def test_proxies_are_partitioned_across_workers(ua_proxies_path):
+    webber = ShardedWebber(ua_proxies_path=ua_proxies_path, workers=2)
+    partitions = [webber.worker_proxies(worker) for worker in range(webber.num_workers)]
+    assert not partitions[0].keys() & partitions[1].keys()
+    assert partitions[0] | partitions[1] == webber.proxies
+    assert webber.worker("https://example.com/foo") == webber.worker("https://example.com/bar")
+
+
+def test_workers_are_capped_by_proxies(ua_proxies_path):
+    assert ShardedWebber(ua_proxies_path=ua_proxies_path, workers=10).num_workers == 5
+    with pytest.raises(ValueError):
+        ShardedWebber(ua_proxies_path=ua_proxies_path, workers=0)
+
+
+@pytest.mark.asyncio
+async def test_results_stream_back_from_workers(tmp_path):
+    async with OriginServer(body_size=10) as origin, ForwardProxy(ports=2) as forward_proxy:
+        path = str(tmp_path / "proxies.json")
+        with open(path, "w") as f:
+            json.dump({url: {"User-Agent": "foo"} for url in forward_proxy.urls}, f)
+
+        async with ShardedWebber(ua_proxies_path=path, workers=2) as webber:
+            urls = [f"{origin.url}/{i}" for i in range(3)]
+            responses = [response async for response in webber.fetch_many(urls, http2=False)]
+            assert sorted(str(response.url) for response in responses) == urls
+            assert all(response.status_code == 200 and response.content == b"x" * 10 for response in responses)
+
+            assert (await webber.get("http://127.0.0.1:1", retries={}, http2=False)).status_code == 502
+            with pytest.raises(httpx.UnsupportedProtocol):
+                await webber.get("ftp://127.0.0.1", retries={})
+
+    assert origin.stats["requests"] == 3
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from .._single_flight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_result():
+    single_flight = SingleFlight()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return object()
+
+    results = await asyncio.gather(*(single_flight.do("foo", call) for _ in range(5)), single_flight.do("bar", call))
+    assert calls == 2
+    assert len({id(result) for result in results[:5]}) == 1
+    assert results[5] is not results[0]
+    assert not single_flight
+
+    await single_flight.do("foo", call)
+    assert calls == 3
+
+
+@pytest.mark.asyncio
+async def test_exceptions_are_shared():
+    single_flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise ValueError()
+
+    results = await asyncio.gather(*(single_flight.do("foo", call) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert results[0] is results[1] is results[2]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    single_flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def call():
+        started.set()
+        await asyncio.sleep(0.05)
+        return "foo"
+
+    first = asyncio.create_task(single_flight.do("foo", call))
+    second = asyncio.create_task(single_flight.do("foo", call))
+    await started.wait()
+    assert single_flight.joined("foo") == 2
+    first.cancel()
+    assert await second == "foo"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_call_is_cancelled_when_every_caller_is():
+    single_flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    task = asyncio.create_task(single_flight.do("foo", call))
+    await asyncio.sleep(0)
+    task.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert "foo" not in single_flight
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+import respx
+
+from .._host_manager import HostState
+from .._proxy_health import ProxyHealthState
+from .._state_store import LearnedState, StateStore
+from .._webber import Webber
+
+
+def host_state(rate=5.0, age=0.0):
+    return HostState(rate, 3.5, 0.2, 8, time.time() - age)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return StateStore(str(tmp_path / "state.json"))
+
+
+def test_save_and_load(store, tmp_path):
+    health = ProxyHealthState(0.5, 3, 1, {"429": 1}, 123.0)
+    store.save(LearnedState({"b.com": host_state(age=1), "a.com": host_state(age=2)}, {"https://proxy0.com": health}))
+    state = store.load()
+    assert list(state.hosts) == ["a.com", "b.com"]
+    assert state.hosts["a.com"].concurrency == 3.5
+    assert state.proxies == {"https://proxy0.com": health}
+    assert [path.name for path in tmp_path.iterdir()] == ["state.json"]
+
+
+def test_host_states_without_protocol_are_loaded(store):
+    host = {
+        "rate": 5.0, "concurrency": 3.5, "average_response_time": None, "max_client_requests": 8, "time": time.time()
+    }
+    with open(store.path, "w") as f:
+        json.dump({"version": StateStore.VERSION, "hosts": {"a.com": host}, "proxies": {}}, f)
+    assert store.load().hosts["a.com"].http2 is None
+
+
+def test_missing_file_loads_empty(store):
+    assert store.load() == LearnedState({}, {})
+
+
+@pytest.mark.parametrize("content", ["{", json.dumps({"version": 0, "hosts": {}, "proxies": {}})])
+def test_unreadable_file_loads_empty(store, content):
+    with open(store.path, "w") as f:
+        f.write(content)
+    with pytest.warns(UserWarning):
+        assert store.load() == LearnedState({}, {})
+
+
+def test_old_host_states_are_not_loaded(tmp_path):
+    store = StateStore(str(tmp_path / "state.json"), max_age=60)
+    store.save(LearnedState({"old.com": host_state(age=61), "new.com": host_state()}, {}))
+    assert list(store.load().hosts) == ["new.com"]
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_restores_learned_state(store):
+    respx.get().respond(200)
+    proxies = {f"https://proxy{i}.com": {} for i in range(3)}
+    async with Webber(ua_proxies=proxies, state_store=store) as webber:
+        await webber.get("https://example.com", {})
+        webber.hosts["example.com"].restore(host_state(rate=7))
+        learned_health = webber.proxy_registry.health(webber.proxy_registry.proxies[0]).state()
+
+    webber = Webber(ua_proxies=proxies, state_store=store)
+    assert webber.proxy_registry.health(webber.proxy_registry.proxies[0]).state() == learned_health
+    host = webber._get_host("https://example.com")
+    assert host.rate_controller.rate == 7
+    assert host.rate_controller.concurrency_limit == 3.5
+    await webber.aclose()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_flushes_periodically(tmp_path):
+    respx.get().respond(200)
+    store = StateStore(str(tmp_path / "state.json"), flush_interval=0.01)
+    webber = Webber(ua_proxies={"https://proxy0.com": {}}, state_store=store)
+    await webber.get("https://example.com", {})
+    await asyncio.sleep(0.05)
+    assert "example.com" in store.load().hosts
+    await webber.aclose()
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_webber_saves_only_used_proxies(store):
+    respx.get().respond(200)
+    proxies = {f"https://proxy{i}.com": {} for i in range(3)}
+    async with Webber(ua_proxies=proxies, state_store=store) as webber:
+        await webber.get("https://example.com", {})
+    saved = store.load().proxies
+    assert len(saved) == 1
+    assert next(iter(saved.values())).successes == 1
+
+    # Restored records are saved again even if the proxies aren't used
+    async with Webber(ua_proxies=proxies, state_store=store):
+        pass
+    assert store.load().proxies == saved
@@ -0,0 +1,54 @@
+import types
+
+import pytest
+
+from .. import _token_bucket
+from .._token_bucket import TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(_token_bucket, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+@pytest.mark.parametrize("kwargs", [{"rate": 0}, {"rate": 1, "burst": 0.5}])
+def test_invalid_initialization(kwargs):
+    with pytest.raises(ValueError):
+        TokenBucket(**kwargs)
+
+
+def test_burst_is_available_at_once(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.consume() for _ in range(3)] == [0, 0, 0]
+    assert bucket.consume() == 0.5
+    assert bucket.tokens == 0
+
+
+def test_bucket_refills_at_rate_up_to_burst(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    for _ in range(3):
+        bucket.consume()
+    clock[0] += 0.75
+    assert bucket.tokens == 1.5
+    assert bucket.delay(2) == 0.25
+    clock[0] += 10
+    assert bucket.tokens == 3
+
+
+def test_rate_change_keeps_earned_tokens(clock):
+    bucket = TokenBucket(rate=1)
+    bucket.consume()
+    clock[0] += 0.5
+    bucket.rate = 4
+    assert bucket.tokens == 0.5
+    assert bucket.delay() == 0.125
+
+
+def test_lowering_burst_drops_excess_tokens(clock):
+    bucket = TokenBucket(rate=1, burst=5)
+    bucket.burst = 2
+    assert bucket.tokens == 2
+    with pytest.raises(ValueError):
+        bucket.rate = 0
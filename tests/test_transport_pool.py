@@ -0,0 +1,91 @@
+import httpcore
+import pytest
+import respx
+
+from .test_utils import HTTP2_EXTENSIONS
+from .._client_manager import ClientManager
+from .._transport_pool import TransportPool
+
+
+def test_get_shares_transport_per_proxy_and_http_version(proxies_3):
+    pool = TransportPool()
+    assert pool.get(proxies_3[0], True).transport is pool.get(proxies_3[0], True).transport
+    assert pool.get(proxies_3[0], True).transport is not pool.get(proxies_3[0], False).transport
+    assert pool.get(proxies_3[0], True).transport is not pool.get(proxies_3[1], True).transport
+    assert len(pool) == 3
+    assert proxies_3[0] in pool
+    assert proxies_3[2] not in pool
+
+
+@pytest.mark.asyncio
+async def test_closing_shared_transport_keeps_connections(proxies_3, monkeypatch):
+    pool = TransportPool()
+    shared = pool.get(proxies_3[0], True)
+    closed = []
+    monkeypatch.setattr(shared.transport, "aclose", lambda: closed.append(True))
+    await shared.aclose()
+    assert not closed
+
+
+@pytest.mark.asyncio
+async def test_discard_and_aclose(proxies_3):
+    pool = TransportPool()
+    for proxy in proxies_3:
+        pool.get(proxy, True)
+        pool.get(proxy, False)
+    await pool.discard(proxies_3[0])
+    assert proxies_3[0] not in pool
+    assert len(pool) == 4
+    await pool.aclose()
+    assert not len(pool)
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_client_rotation_reuses_transport(proxies_3, url, monkeypatch):
+    respx.get().respond(200, extensions=HTTP2_EXTENSIONS)
+    client_manager = ClientManager(proxies_3[:1], 1, 1)
+    clients = []
+    create_client = client_manager._create_client
+
+    async def _create_client(http2, timeout=None):
+        clients.append(await create_client(http2, timeout))
+        return clients[-1]
+
+    monkeypatch.setattr(client_manager, "_create_client", _create_client)
+    await client_manager.request(url, {})
+    await client_manager.request(url, {})
+    assert clients[0] is not clients[1]
+    assert clients[0].is_closed
+    assert clients[0]._transport.transport is clients[1]._transport.transport
+    assert len(client_manager.transport_pool) == 1
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_evicted_proxy_transport_is_discarded(proxies_3, url):
+    respx.get().respond(500)
+    client_manager = ClientManager(proxies_3[:1], 1, 1)
+    client_manager.proxy_pool.max_bad_responses = 0
+    await client_manager.request(url, {})
+    assert not client_manager.proxy_pool
+    assert not len(client_manager.transport_pool)
+
+
+def test_max_streams_of_established_connections(proxies_3):
+    pool = TransportPool()
+    assert pool.max_streams(proxies_3[0]) is None
+    connections = pool.get(proxies_3[0], True).transport._pool._connections
+    origin = httpcore.Origin(b"https", b"example.com", 443)
+
+    # Proxied connections wrap the connection to the host once it is established
+    proxied = httpcore.AsyncHTTPConnection(origin)
+    connections.append(proxied)
+    assert pool.max_streams(proxies_3[0]) is None
+    proxied._connection = httpcore.AsyncHTTP2Connection(origin, stream=None)
+    assert pool.max_streams(proxies_3[0]) is None
+    proxied._connection._max_streams = 100
+    assert pool.max_streams(proxies_3[0]) == 100
+
+    connections.append(httpcore.AsyncHTTP11Connection(origin, stream=None))
+    assert pool.max_streams(proxies_3[0]) == 1
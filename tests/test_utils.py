@@ -1,2 +1,6 @@
 async def raise_for_status_hook(response):
     response.raise_for_status()
+
+
+# The extensions of mocked responses sent over HTTP/2, since mocked responses default to HTTP/1.1
+HTTP2_EXTENSIONS = {"http_version": b"HTTP/2"}
@@ -0,0 +1,164 @@
+import asyncio
+import gc
+import json
+
+import httpx
+import pytest
+import respx
+
+from .._webber import Webber
+
+
+@pytest.fixture
+def webber(tmp_path):
+    path = tmp_path / "proxies.json"
+    path.write_text(json.dumps({f"https://proxy{i}.com": {} for i in range(3)}))
+    return Webber(ua_proxies_path=str(path))
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_fetch_many_yields_all_responses(webber):
+    respx.get().respond(200)
+    urls = [f"https://host{i}.com" for i in range(10)]
+    responses = [response async for response in webber.fetch_many(urls, concurrency=3)]
+    assert sorted(str(response.request.url) for response in responses) == sorted(urls)
+    assert len(webber._hosts) == 10
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("concurrency, host_concurrency", [(1, None), (4, None), (4, 1), (8, 2)])
+async def test_fetch_many_bounds_concurrency(webber, monkeypatch, concurrency, host_concurrency):
+    in_flight = []
+    max_in_flight = 0
+    max_host_in_flight = 0
+
+    async def get(url, *args):
+        nonlocal max_in_flight, max_host_in_flight
+        in_flight.append(url)
+        max_in_flight = max(max_in_flight, len(in_flight))
+        max_host_in_flight = max(max_host_in_flight, in_flight.count(url))
+        await asyncio.sleep(0.01)
+        in_flight.remove(url)
+        return url
+
+    monkeypatch.setattr(webber, "get", get)
+    consumed = 0
+
+    async def urls():
+        nonlocal consumed
+        for i in range(50):
+            consumed += 1
+            yield f"https://host{i % 3}.com"
+
+    results = []
+    async for result in webber.fetch_many(urls(), concurrency=concurrency, host_concurrency=host_concurrency):
+        # Urls are read lazily, so only a bounded number may be consumed ahead of the results
+        assert consumed - len(results) <= 2 * concurrency
+        results.append(result)
+
+    assert len(results) == 50
+    assert max_in_flight <= concurrency
+    assert max_host_in_flight <= (host_concurrency or concurrency)
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_exceptions(webber, monkeypatch):
+    async def get(url, *args):
+        if url == "https://bad.com":
+            raise httpx.ConnectError("foo")
+        return url
+
+    monkeypatch.setattr(webber, "get", get)
+    urls = ["https://good.com", "https://bad.com"]
+    results = [result async for result in webber.fetch_many(urls, return_exceptions=True)]
+    assert len(results) == 2
+    assert any(isinstance(result, httpx.ConnectError) for result in results)
+
+    with pytest.raises(httpx.ConnectError):
+        async for _ in webber.fetch_many(urls):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_fetch_many_retrieves_every_finished_exception(webber, monkeypatch):
+    async def get(url, *args):
+        raise httpx.ConnectError(url)
+
+    monkeypatch.setattr(webber, "get", get)
+    errors = []
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+    with pytest.raises(httpx.ConnectError):
+        async for _ in webber.fetch_many([f"https://host{i}.com" for i in range(3)]):
+            pass
+    await asyncio.sleep(0)
+    gc.collect()
+    assert not errors
+
+
+@pytest.mark.parametrize("kwargs", [{"concurrency": 0}, {"host_concurrency": 0}])
+@pytest.mark.asyncio
+async def test_fetch_many_invalid_concurrency(webber, kwargs):
+    with pytest.raises(ValueError):
+        async for _ in webber.fetch_many([], **kwargs):
+            pass
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_download_to_path(webber, tmp_path):
+    respx.get().respond(200, content=b"foo" * 1000)
+    path = tmp_path / "foo.txt"
+    response = await webber.download("https://example.com", path, chunk_size=10)
+    assert response.status_code == 200
+    assert path.read_bytes() == b"foo" * 1000
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_download_to_async_sink(webber):
+    respx.get().respond(200, content=b"foo" * 1000)
+    chunks = []
+
+    class Sink:
+        async def write(self, chunk):
+            chunks.append(chunk)
+
+    await webber.download("https://example.com", Sink(), chunk_size=10)
+    assert b"".join(chunks) == b"foo" * 1000
+    assert all(len(chunk) <= 10 for chunk in chunks)
+    assert not webber._hosts["example.com"].active_requests
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_get_coalesces_concurrent_identical_requests(webber):
+    async def respond(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(200)
+
+    route = respx.get().mock(side_effect=respond)
+    responses = await asyncio.gather(
+        *(webber.get("https://example.com", {}) for _ in range(3)),
+        webber.get("https://example.com", {"X-Foo": "bar"}),
+    )
+    assert route.call_count == 2
+    assert responses[0] is responses[1] is responses[2]
+    assert responses[3] is not responses[0]
+
+    webber.coalesce = False
+    await asyncio.gather(*(webber.get("https://example.com", {}) for _ in range(2)))
+    assert route.call_count == 4
+
+
+@respx.mock
+@pytest.mark.asyncio
+async def test_async_with_closes_every_host(webber):
+    respx.get().respond(200)
+    async with webber:
+        await asyncio.gather(webber.get("https://host1.com", {}), webber.get("https://host2.com", {}))
+        hosts = list(webber.hosts.values())
+    assert webber.closed
+    assert len(hosts) == 2 and all(host.closed for host in hosts)
+    with pytest.raises(RuntimeError):
+        await webber.get("https://host3.com", {})